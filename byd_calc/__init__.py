@@ -0,0 +1,31 @@
+"""Calculation core of the BYD installment calculator.
+
+Importing this package has no side effects: no Streamlit, no network and no
+pandas import. Sheet fetching lives in ``byd_calc.sheets`` and is only loaded
+by code that asks for it.
+"""
+from .catalog import CarRecord, Catalog
+from .links import convert_drive_link_to_direct_image_url, convert_google_sheet_link_to_csv, is_google_sheet_link
+from .promotions import Campaign, PromotionMap, compile_promotions, load_campaigns
+from .quotes import Quote, QuoteGrid, ThirtyPlanOption, flat_rate_installment, quote, quote_grid
+from .rates import RATE_PERIODS, RateIndex
+
+__all__ = [
+    "RATE_PERIODS",
+    "Campaign",
+    "CarRecord",
+    "Catalog",
+    "PromotionMap",
+    "Quote",
+    "QuoteGrid",
+    "RateIndex",
+    "ThirtyPlanOption",
+    "compile_promotions",
+    "convert_drive_link_to_direct_image_url",
+    "convert_google_sheet_link_to_csv",
+    "flat_rate_installment",
+    "is_google_sheet_link",
+    "load_campaigns",
+    "quote",
+    "quote_grid",
+]
@@ -0,0 +1,129 @@
+"""Affordability explorer: which car, down payment and term fit a monthly budget.
+
+AffordabilityGrid quotes every car x whole down % x term once per snapshot with
+quote_grid(), so the calculator's rules (tiers, promotions, the 30% plan) apply
+unchanged. Answering a budget is then one vectorized comparison over the
+precomputed installments: nothing is re-quoted when only the budget changes.
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from .matrix import group_by_rate_index
+from .quotes import MIN_DOWN_PERCENT, down_payment_for, quote_grid
+from .rates import RATE_PERIODS
+
+# Smallest whole down % at which one car and term fits the budget
+AffordableOption = namedtuple("AffordableOption", [
+    "model", "submodel", "price", "period", "down_percent", "down_payment",
+    "monthly_installment", "interest_rate", "thirty_plan", "promotion",
+])
+
+
+class AffordabilityGrid:
+    # Arrays have shape (cars, down percents, periods); monthly installments are rounded up
+    # to the next baht like the calculator page shows them, and NaN where a cell cannot
+    # be financed.
+    __slots__ = (
+        "cars", "promotions", "down_percents", "periods", "down_payment", "monthly", "interest_rate", "thirty_plan",
+        "_curve_frames",
+    )
+
+    def __init__(self, cars, promotions, down_percents, periods, down_payment, monthly, interest_rate, thirty_plan):
+        self.cars = cars
+        self.promotions = promotions
+        self.down_percents = down_percents
+        self.periods = periods
+        self.down_payment = down_payment
+        self.monthly = monthly
+        self.interest_rate = interest_rate
+        self.thirty_plan = thirty_plan
+        self._curve_frames = {}  # position -> curve_frame()
+
+    @classmethod
+    def build(cls, cars, rate_index_for, down_percents=None, periods=RATE_PERIODS):
+        # cars: CarRecords; rate_index_for(model, submodel) -> (RateIndex, campaign or None),
+        # e.g. Snapshot.rate_index_for. One quote_grid() call per distinct rate table
+        # (see byd_calc.matrix.group_by_rate_index).
+        cars = list(cars)
+        if down_percents is None:
+            down_percents = np.arange(math.ceil(MIN_DOWN_PERCENT), 100, dtype=float)
+        down_percents = np.asarray(down_percents, dtype=float)
+        periods = np.asarray(periods, dtype=float)
+        shape = (len(cars), len(down_percents), len(periods))
+        monthly = np.full(shape, np.nan)
+        interest_rate = np.full(shape, np.nan)
+        thirty_plan = np.zeros(shape, dtype=bool)
+        promotions = []
+        for car in cars:
+            _, campaign = rate_index_for(car.model, car.submodel)
+            promotions.append(campaign.name if campaign is not None else None)
+        for rate_index, positions in group_by_rate_index(cars, rate_index_for):
+            if rate_index.empty:
+                continue
+            grid = quote_grid([cars[i].price for i in positions], down_percents, periods, rate_index)
+            monthly[positions] = np.where(grid.eligible, np.ceil(grid.monthly_installment), np.nan)
+            interest_rate[positions] = np.where(grid.eligible, grid.interest_rate, np.nan)
+            thirty_plan[positions] = grid.thirty_plan
+        prices = np.array([car.price for car in cars], dtype=float).reshape(-1, 1)
+        down_payment = down_payment_for(prices, down_percents[None, :])
+        return cls(cars, promotions, down_percents, periods, down_payment, monthly, interest_rate, thirty_plan)
+
+    def car_positions(self, model=None):
+        return [i for i, car in enumerate(self.cars) if model is None or car.model == model]
+
+    def position(self, model, submodel):
+        for i, car in enumerate(self.cars):
+            if car.model == model and car.submodel == submodel:
+                return i
+        return None
+
+    def solve(self, budget, model=None, max_down_payment=None):
+        # For every car (of one model) and term, the smallest whole down % whose installment
+        # fits `budget`, optionally with at most `max_down_payment` THB down. Sorted by down
+        # payment, then installment.
+        positions = self.car_positions(model)
+        if not positions:
+            return []
+        monthly = self.monthly[positions]
+        with np.errstate(invalid="ignore"):
+            fits = monthly <= budget  # NaN (not financeable) never fits
+        if max_down_payment is not None:
+            fits &= (self.down_payment[positions] <= max_down_payment)[:, :, None]
+        first = fits.argmax(axis=1)  # (cars, periods): first down % that fits
+        car_rows, period_cols = np.nonzero(fits.any(axis=1))
+        options = []
+        for row, col in zip(car_rows, period_cols):
+            d = first[row, col]
+            car_index = positions[row]
+            car = self.cars[car_index]
+            options.append(AffordableOption(
+                car.model, car.submodel, car.price, int(self.periods[col]),
+                float(self.down_percents[d]), float(self.down_payment[car_index, d]),
+                float(self.monthly[car_index, d, col]), float(self.interest_rate[car_index, d, col]),
+                bool(self.thirty_plan[car_index, d, col]), self.promotions[car_index],
+            ))
+        options.sort(key=lambda o: (o.down_payment, o.monthly_installment))
+        return options
+
+    def curve(self, position):
+        # (down percents, periods) installments of one car, for charting
+        return self.monthly[position]
+
+    def curve_frame(self, position):
+        # The same curve as a long DataFrame (down_percent, period, monthly) without the cells
+        # that cannot be financed; built once per car, as charts take long-form data
+        frame = self._curve_frames.get(position)
+        if frame is None:
+            import pandas as pd
+
+            curve = self.monthly[position]
+            rows, cols = np.nonzero(~np.isnan(curve))
+            frame = pd.DataFrame({
+                "down_percent": self.down_percents[rows],
+                "period": self.periods[cols].astype(int),
+                "monthly": curve[rows, cols],
+            })
+            self._curve_frames[position] = frame
+        return frame
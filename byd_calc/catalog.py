@@ -0,0 +1,70 @@
+"""Compiled car catalog: the cleaned car sheet as lookups instead of DataFrame scans."""
+from .links import convert_drive_link_to_direct_image_url
+
+
+class CarRecord:
+    # One sellable submodel with its image link already converted to a direct URL
+    __slots__ = ("model", "submodel", "price", "image_url")
+
+    def __init__(self, model, submodel, price, image_url):
+        self.model = model
+        self.submodel = submodel
+        self.price = price
+        self.image_url = image_url
+
+    def __repr__(self):
+        return f"CarRecord({self.model!r}, {self.submodel!r}, {self.price!r})"
+
+
+class Catalog:
+    # Built once per car table version. `models` is sorted by name and `submodels[model]`
+    # by price, so the page's selectboxes read their options straight from here, and a
+    # (model, submodel) selection resolves with one dict lookup.
+    __slots__ = ("models", "submodels", "records")
+
+    def __init__(self, records=()):
+        by_key = {}
+        for record in records:
+            by_key.setdefault((record.model, record.submodel), record)  # First row wins, like `.values[0]`
+        by_model = {}
+        for record in by_key.values():
+            by_model.setdefault(record.model, []).append(record)
+        self.records = by_key
+        self.models = tuple(sorted(by_model))
+        self.submodels = {
+            model: tuple(r.submodel for r in sorted(by_model[model], key=lambda r: r.price))
+            for model in self.models
+        }
+
+    @classmethod
+    def from_frame(cls, car_df):
+        # From a cleaned car frame ('model', 'sub model', 'price', 'image_url')
+        return cls(
+            CarRecord(model, submodel, float(price), _direct_image_url(image_url))
+            for model, submodel, price, image_url in zip(
+                car_df["model"], car_df["sub model"], car_df["price"], car_df["image_url"]
+            )
+        )
+
+    @property
+    def empty(self):
+        return not self.records
+
+    def get(self, model, submodel):
+        # CarRecord for a selection, or None if the sheet has no such car
+        return self.records.get((model, submodel))
+
+    def submodels_for(self, model):
+        return self.submodels.get(model, ())
+
+    def cars(self, model=None):
+        # Records of one model (or every model), ordered by model name then price
+        models = self.models if model is None else (model,)
+        return [self.records[(m, s)] for m in models for s in self.submodels_for(m)]
+
+
+def _direct_image_url(link):
+    # Direct image URL for a sheet cell, or None for an empty cell
+    if not isinstance(link, str) or not link.strip():
+        return None
+    return convert_drive_link_to_direct_image_url(link.strip())
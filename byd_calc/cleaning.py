@@ -0,0 +1,61 @@
+"""Validation and cleaning of the car and rate sheets.
+
+pandas is imported inside the functions so that importing the calculation
+core stays fast; only code that actually cleans a sheet pays for it.
+"""
+CAR_COLUMNS = ["model", "sub model", "price", "image_url"]
+RATE_COLUMNS = ['down_payment', '48', '60', '72', '84']
+
+# Sheet column -> cleaned column, for each rate sheet layout
+STANDARD_RATE_COLUMNS = {'ดาวน์': 'down_payment', '48': '48', '60': '60', '72': '72', '84': '84'}
+SEAL_PROMO_RATE_COLUMNS = {
+    'ดาวน์': 'down_payment',
+    'ผ่อน 48 งวด': '48',
+    'ผ่อน 60 งวด': '60',
+    'ผ่อน 72 งวด': '72',
+    'ผ่อน 84 งวด': '84',
+}
+
+
+class MissingColumnsError(ValueError):
+    # A sheet loaded but lacks columns the calculator needs; args[0] lists the required columns
+    pass
+
+
+def empty_rate_df():
+    import pandas as pd
+
+    return pd.DataFrame(columns=RATE_COLUMNS)
+
+
+def _to_number(series):
+    # '2.49%' / ' 10 ' / 10 -> float, anything else -> NaN
+    import pandas as pd
+
+    return pd.to_numeric(series.astype(str).str.replace('%', '').str.strip(), errors='coerce')
+
+
+def clean_car_df(car_df):
+    # Keeps cars with a positive numeric price; the result may be empty
+    import pandas as pd
+
+    if not all(col in car_df.columns for col in CAR_COLUMNS):
+        raise MissingColumnsError(CAR_COLUMNS)
+    car_df = car_df.copy()
+    car_df['price'] = pd.to_numeric(car_df['price'], errors='coerce')
+    car_df.dropna(subset=['price'], inplace=True)
+    return car_df[car_df['price'] > 0]
+
+
+def clean_rate_df(rate_df, column_map):
+    # Renames a rate sheet to RATE_COLUMNS and turns '%' strings into numbers; the result may be empty
+    source_columns = list(column_map)
+    if not all(col in rate_df.columns for col in source_columns):
+        raise MissingColumnsError(source_columns)
+    rate_df = rate_df[source_columns].drop_duplicates()
+    rate_df = rate_df.rename(columns=column_map)
+    rate_df['down_payment'] = _to_number(rate_df['down_payment'])
+    rate_df.dropna(subset=['down_payment'], inplace=True)
+    for col in RATE_COLUMNS[1:]:
+        rate_df[col] = _to_number(rate_df[col])
+    return rate_df
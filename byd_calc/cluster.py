@@ -0,0 +1,221 @@
+"""Multi-worker deployment: one sheet loader, N Streamlit workers and a sticky load balancer.
+
+    python -m byd_calc.cluster --workers 4 --port 8501
+
+One Streamlit process runs every session on a single interpreter. This mode
+spreads sessions over several processes and starts:
+
+- a loader process, the only one that talks to Google. It owns the SheetCache and
+  SnapshotStore and publishes every new snapshot into a shared snapshot directory
+  (under /dev/shm when available, so it lives in RAM). It also owns the ImageCache:
+  it downloads and resizes every catalog photo once into --image-dir and alone keeps
+  that directory under BYD_IMAGE_CACHE_MB;
+- N Streamlit workers on ports --base-port .. --base-port+N-1. They run in follower
+  mode (BYD_SNAPSHOT_FOLLOW=1, see byd_calc.persist.SnapshotFollower): they never fetch
+  a sheet, all serve the same data version, and map the loader's rate arrays instead of
+  each keeping its own copy. Their image caches only read --image-dir
+  (BYD_IMAGE_FOLLOW=1), so no photo is downloaded more than once. With
+  BYD_IMAGE_BASE_URL set, photos come from the quoting API instead and the loader
+  fetches none;
+- a TCP load balancer on --port. It pins each client IP to one worker, because a
+  Streamlit session lives on the websocket of the worker that created it. If that
+  worker is down, the next one takes over.
+
+Workers and the loader are restarted if they exit. With BYD_METRICS_PORT set, worker i
+serves its metrics on BYD_METRICS_PORT + i.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+import zlib
+
+from .data import DataUnavailableError, SnapshotStore
+from .images import IMAGE_CACHE_DIR
+from .persist import SNAPSHOT_DIR
+
+SHARED_SNAPSHOT_DIR = "/dev/shm/byd-snapshot" if os.path.isdir("/dev/shm") else SNAPSHOT_DIR
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "byd_interest_calc.py")
+LOADER_REFRESH_SECONDS = 10  # How often the loader checks the sheets for changes
+BALANCER_CONNECT_TIMEOUT = 2  # Seconds before a worker counts as down for one connection
+PIPE_CHUNK_BYTES = 64 * 1024
+SUPERVISE_SECONDS = 2  # How often exited children are noticed and restarted
+
+
+def run_loader(snapshot_dir, refresh_seconds=LOADER_REFRESH_SECONDS, image_dir=IMAGE_CACHE_DIR):
+    # Loader process main loop: SnapshotStore.snapshot() saves every new snapshot into snapshot_dir,
+    # and the catalog's photos are fetched into image_dir for the workers
+    from .images import ImageCache
+    from .sheets import SheetCache
+
+    store = SnapshotStore(SheetCache(), snapshot_dir=snapshot_dir)
+    images = None if os.environ.get("BYD_IMAGE_BASE_URL") else ImageCache(image_dir)
+    if store.promotions_error is not None:
+        print(f"loader: promotions not loaded, every car uses standard rates: {store.promotions_error}", flush=True)
+    published = None
+    while True:
+        snapshot = store.snapshot()
+        if snapshot.version != published:
+            published = snapshot.version
+            try:
+                snapshot.require_cars()
+                print(f"loader: rate data version {snapshot.data_version} published to {snapshot_dir}", flush=True)
+            except DataUnavailableError as e:
+                print(f"loader: rate data version {snapshot.data_version} published without cars: {e}", flush=True)
+        if images is not None and snapshot.catalog is not None:
+            # Cached photos are skipped; failed ones are retried after IMAGE_RETRY_SECONDS
+            images.prefetch(car.image_url for car in snapshot.catalog.cars())
+        time.sleep(refresh_seconds)
+
+
+class StickyBalancer:
+    # TCP proxy in front of the workers. Works below HTTP, so Streamlit's websockets pass
+    # through untouched. Behind another reverse proxy every client has that proxy's IP;
+    # in that case the outer proxy should do the sticky routing instead.
+    def __init__(self, backends, connect_timeout=BALANCER_CONNECT_TIMEOUT):
+        self.backends = list(backends)  # (host, port) per worker
+        self.connect_timeout = connect_timeout
+
+    def candidates(self, client_ip):
+        # Workers to try for a client, its own worker first
+        start = zlib.crc32(client_ip.encode("utf-8")) % len(self.backends)
+        return [self.backends[(start + i) % len(self.backends)] for i in range(len(self.backends))]
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        client_ip = peer[0] if peer else ""
+        for host, port in self.candidates(client_ip):
+            try:
+                upstream_reader, upstream_writer = await asyncio.wait_for(
+                    asyncio.open_connection(host, port), self.connect_timeout
+                )
+                break
+            except (OSError, asyncio.TimeoutError):
+                continue
+        else:
+            writer.close()
+            return
+        await asyncio.gather(_pipe(reader, upstream_writer), _pipe(upstream_reader, writer))
+
+
+async def _pipe(reader, writer):
+    # Copies one direction of a proxied connection until either side closes it
+    try:
+        while True:
+            data = await reader.read(PIPE_CHUNK_BYTES)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+class _Child:
+    # One supervised subprocess
+    def __init__(self, name, args, env):
+        self.name = name
+        self.args = args
+        self.env = env
+        self.process = subprocess.Popen(args, env=env)
+
+    def restart_if_exited(self):
+        code = self.process.poll()
+        if code is not None:
+            print(f"cluster: {self.name} exited with {code}, restarting", flush=True)
+            self.process = subprocess.Popen(self.args, env=self.env)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+
+
+def start_children(
+    workers, base_port, snapshot_dir, script=APP_SCRIPT, refresh_seconds=LOADER_REFRESH_SECONDS,
+    image_dir=IMAGE_CACHE_DIR,
+):
+    image_dir = os.path.abspath(image_dir)
+    children = [_Child(
+        "loader",
+        [sys.executable, "-m", "byd_calc.cluster", "--loader", "--snapshot-dir", snapshot_dir,
+         "--refresh-seconds", str(refresh_seconds), "--image-dir", image_dir],
+        dict(os.environ, BYD_SNAPSHOT_FOLLOW="0", BYD_IMAGE_FOLLOW="0"),
+    )]
+    metrics_port = os.environ.get("BYD_METRICS_PORT")
+    for i in range(workers):
+        env = dict(
+            os.environ, BYD_SNAPSHOT_DIR=snapshot_dir, BYD_SNAPSHOT_FOLLOW="1",
+            BYD_IMAGE_CACHE_DIR=image_dir, BYD_IMAGE_FOLLOW="1",
+        )
+        if metrics_port:
+            env["BYD_METRICS_PORT"] = str(int(metrics_port) + i)
+        children.append(_Child(f"worker {i}", [
+            sys.executable, "-m", "streamlit", "run", script,
+            "--server.address", "127.0.0.1",
+            "--server.port", str(base_port + i),
+            "--server.headless", "true",
+        ], env))
+    return children
+
+
+async def serve(
+    workers, host="0.0.0.0", port=8501, base_port=8511, snapshot_dir=SHARED_SNAPSHOT_DIR, script=APP_SCRIPT,
+    refresh_seconds=LOADER_REFRESH_SECONDS, image_dir=IMAGE_CACHE_DIR,
+):
+    children = start_children(workers, base_port, snapshot_dir, script, refresh_seconds, image_dir)
+    balancer = StickyBalancer([("127.0.0.1", base_port + i) for i in range(workers)])
+    server = await asyncio.start_server(balancer.handle_connection, host, port)
+    print(f"cluster: {workers} workers behind http://{host}:{port}, rate data in {snapshot_dir}", flush=True)
+    stopping = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)  # e.g. systemd / docker stop
+    try:
+        async with server:
+            while not stopping.is_set():
+                try:
+                    await asyncio.wait_for(stopping.wait(), SUPERVISE_SECONDS)
+                except asyncio.TimeoutError:
+                    for child in children:
+                        child.restart_if_exited()
+    finally:
+        for child in children:
+            child.stop()
+        for child in children:
+            try:
+                child.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                child.process.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the calculator as several workers behind one port")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8501)
+    parser.add_argument("--base-port", type=int, default=8511, help="worker i listens on base-port + i")
+    parser.add_argument("--snapshot-dir", default=SHARED_SNAPSHOT_DIR)
+    parser.add_argument("--script", default=APP_SCRIPT)
+    parser.add_argument("--loader", action="store_true", help=argparse.SUPPRESS)  # The loader child process
+    parser.add_argument("--refresh-seconds", type=float, default=LOADER_REFRESH_SECONDS)
+    parser.add_argument("--image-dir", default=IMAGE_CACHE_DIR, help="resized car photos, fetched by the loader only")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    try:
+        if args.loader:
+            run_loader(args.snapshot_dir, args.refresh_seconds, args.image_dir)
+        else:
+            asyncio.run(serve(
+                args.workers, args.host, args.port, args.base_port, args.snapshot_dir, args.script, args.refresh_seconds,
+                args.image_dir,
+            ))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
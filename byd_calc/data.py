@@ -0,0 +1,383 @@
+"""Versioned, immutable snapshots of the cleaned sheets and their rate indexes.
+
+A SnapshotStore turns raw sheet downloads into a Snapshot. Each table keeps the
+content hash of the CSV it was built from and a hash of how it was built (sheet
+link and column layout), so a refresh re-parses, re-cleans and re-indexes only
+the tables where either changed, reuses the rest, and publishes the
+result as a new Snapshot with the next version number. Publishing is a single
+reference swap: a reader holds on to the snapshot it started with and never sees
+a half-updated set of tables. Frames inside a snapshot are shared and must be
+treated as read-only. A sheet that fails to download, or downloads but cannot be
+parsed or lacks its columns, keeps the table last built from it.
+
+Version numbers only count rebuilds within one store, so two processes (the page and
+the quoting API, say) can give different data the same number. What identifies the
+rate data, e.g. on a quote, is Snapshot.data_version: a hash of the table contents
+that every process building or loading the same sheets agrees on.
+
+Besides the car and standard rate sheets, every promotion campaign (see
+byd_calc.promotions) contributes its own rate table, named ``promo.<campaign>``.
+"""
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, field, replace
+
+from .catalog import Catalog
+from .cleaning import (
+    STANDARD_RATE_COLUMNS,
+    MissingColumnsError,
+    clean_car_df,
+    clean_rate_df,
+    empty_rate_df,
+)
+from .promotions import compile_promotions, load_campaigns, promotions_today
+from .rates import RateIndex
+from .links import convert_google_sheet_link_to_csv
+from .metrics import cache_event, span
+from .sources import CAR_SHEET_LINK, STANDARD_RATE_SHEET_LINK
+
+CAR_TABLE = "car"
+STANDARD_RATES_TABLE = "standard_rates"
+
+# SheetTable.problem values
+PROBLEM_LOAD_FAILED = "load_failed"  # Download or CSV parsing failed, or the sheet is empty
+PROBLEM_MISSING_COLUMNS = "missing_columns"
+PROBLEM_EMPTY = "empty"  # No usable rows left after cleaning
+
+
+class DataUnavailableError(RuntimeError):
+    # The car sheet could not be loaded or has no usable rows, so nothing can be quoted
+    pass
+
+
+@dataclass(frozen=True)
+class SheetTable:
+    name: str
+    digest: str  # sha256 of the CSV this table was built from; None if it never loaded
+    version: int  # Snapshot version in which this table last changed
+    df: object  # Cleaned DataFrame (empty on problems)
+    index: RateIndex = None  # Rate tables only
+    catalog: Catalog = None  # Car table only
+    problem: str = None
+    error: Exception = None
+    config: str = None  # table_config() of the source this table was built with
+    # When the latest download could not be used (parse or builder failure, missing columns)
+    # and this table kept its previous good data instead: that download's digest and why
+    rejected_digest: str = None
+    rejected_problem: str = None
+    rejected_error: Exception = None
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: int
+    created_at: float
+    tables: dict = field(default_factory=dict)  # name -> SheetTable
+    campaigns: tuple = ()  # byd_calc.promotions.Campaign, each with a table in `tables`
+    promotions_error: Exception = None  # Why the promotions file could not be read; campaigns is () then
+    _promotions: dict = field(default_factory=dict, compare=False, repr=False)  # Compiled PromotionMap cache
+    data_version: str = field(init=False, compare=False)  # Content hash of the tables; see the module docstring
+
+    def __post_init__(self):
+        object.__setattr__(self, "data_version", data_version(self.tables, self.campaigns))
+
+    @property
+    def car_df(self):
+        return self.tables[CAR_TABLE].df
+
+    @property
+    def catalog(self):
+        return self.tables[CAR_TABLE].catalog
+
+    @property
+    def standard_rates(self):
+        return self.tables[STANDARD_RATES_TABLE].index
+
+    @property
+    def promo_rates(self):
+        # campaign name -> RateIndex
+        return {c.name: self.tables[c.table].index for c in self.campaigns}
+
+    @property
+    def digests(self):
+        return {name: table.digest for name, table in self.tables.items()}
+
+    def promotions(self, day=None):
+        # PromotionMap of the campaigns active on `day` (default: today in Bangkok),
+        # compiled once per snapshot and day
+        day = day or promotions_today()
+        compiled = self._promotions.get("current")
+        if compiled is None or compiled.day != day:
+            compiled = compile_promotions(
+                self.catalog.records if self.catalog is not None else (),
+                self.campaigns,
+                {name: table.index for name, table in self.tables.items() if table.index is not None},
+                self.standard_rates,
+                day,
+            )
+            self._promotions["current"] = compiled
+        return compiled
+
+    def rate_index_for(self, model, submodel):
+        # (rate index, campaign or None for standard rates) for a car, same choice as the calculator page
+        return self.promotions().resolve(model, submodel)
+
+    def require_cars(self):
+        # Raises DataUnavailableError unless the car table is usable
+        car = self.tables[CAR_TABLE]
+        if car.problem is not None:
+            detail = f": {car.error}" if car.error else ""
+            raise DataUnavailableError(f"car sheet unavailable ({car.problem}){detail}")
+        return self
+
+
+def data_version(tables, campaigns=()):
+    # Short hash of every table's name and content digest, and of the campaign rules that
+    # decide which table a car is quoted from
+    h = hashlib.sha256()
+    for name in sorted(tables):
+        h.update(f"{name}={tables[name].digest}\n".encode("utf-8"))
+    for c in campaigns:
+        rules = [
+            c.name, c.sheet, sorted(c.columns.items()), sorted(c.models), sorted(c.submodels),
+            list(c.submodel_keywords), str(c.starts), str(c.ends), c.priority,
+        ]
+        h.update(json.dumps(rules, ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()[:12]
+
+
+def _read_csv(content):
+    from io import StringIO
+
+    import pandas as pd
+
+    return pd.read_csv(StringIO(content))
+
+
+def _empty_frame():
+    import pandas as pd
+
+    return pd.DataFrame()
+
+
+def build_car_table(raw_df):
+    # (cleaned frame, extra SheetTable fields, problem)
+    try:
+        car_df = clean_car_df(raw_df)
+    except MissingColumnsError:
+        return raw_df.iloc[0:0], {"catalog": Catalog()}, PROBLEM_MISSING_COLUMNS
+    return car_df, {"catalog": Catalog.from_frame(car_df)}, PROBLEM_EMPTY if car_df.empty else None
+
+
+def _rate_table_builder(column_map):
+    def build_rate_table(raw_df):
+        try:
+            rate_df = clean_rate_df(raw_df, column_map)
+        except MissingColumnsError:
+            rate_df = empty_rate_df()
+            return rate_df, {"index": RateIndex(rate_df)}, PROBLEM_MISSING_COLUMNS
+        return rate_df, {"index": RateIndex(rate_df)}, PROBLEM_EMPTY if rate_df.empty else None
+    build_rate_table.column_map = dict(column_map)
+    return build_rate_table
+
+
+def table_config(link, builder):
+    # Short hash of everything besides the sheet's content that a table is built from:
+    # the share link, the builder and, for rate tables, the column layout. A saved table
+    # whose config differs from its source's was built under an older promotions file.
+    column_map = getattr(builder, "column_map", None)
+    config = [link, builder.__name__, sorted(column_map.items()) if column_map is not None else None]
+    return hashlib.sha256(json.dumps(config, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+
+
+def _failed_table(name, error):
+    # Placeholder for a table that has never loaded; keeps the snapshot's shape uniform
+    if name == CAR_TABLE:
+        extra = {"catalog": Catalog()}
+        df = _empty_frame()
+    else:
+        df = empty_rate_df()
+        extra = {"index": RateIndex(df)}
+    return SheetTable(name, None, 0, df, problem=PROBLEM_LOAD_FAILED, error=error, **extra)
+
+
+def unavailable_snapshot(campaigns, error, promotions_error=None):
+    # Version 0 snapshot whose every table failed with `error`, for readers that have no data yet
+    tables = {name: _failed_table(name, error) for name in table_sources(campaigns)}
+    return Snapshot(
+        version=0, created_at=time.time(), tables=tables, campaigns=tuple(campaigns), promotions_error=promotions_error
+    )
+
+
+def load_promotions(campaigns=None):
+    # (campaigns, error) for a store: the given campaigns, or those of the promotions file.
+    # Like a sheet that fails to load, a bad file does not stop quoting: every car
+    # gets standard rates and the error is kept on the snapshots for the page to show.
+    if campaigns is not None:
+        return tuple(campaigns), None
+    try:
+        return load_campaigns(), None
+    except (OSError, ValueError) as e:
+        return (), e
+
+
+def table_sources(campaigns):
+    # name -> (share link, builder) for the fixed sheets plus one rate sheet per campaign
+    sources = {
+        CAR_TABLE: (CAR_SHEET_LINK, build_car_table),
+        STANDARD_RATES_TABLE: (STANDARD_RATE_SHEET_LINK, _rate_table_builder(STANDARD_RATE_COLUMNS)),
+    }
+    for campaign in campaigns:
+        sources[campaign.table] = (campaign.sheet, _rate_table_builder(campaign.columns))
+    return sources
+
+
+def build_table(name, raw, version, builder, config=None):
+    # SheetTable for one raw sheet download ({"content", "digest"} or an exception)
+    if isinstance(raw, Exception):
+        return replace(_failed_table(name, raw), config=config)
+    try:
+        raw_df = _read_csv(raw["content"])
+    except Exception as e:
+        # Keeps the digest so the same unparseable download is not rebuilt on every call
+        return replace(_failed_table(name, e), digest=raw["digest"], version=version, config=config)
+    if raw_df.empty:
+        return replace(_failed_table(name, None), digest=raw["digest"], version=version, config=config)
+    try:
+        df, extra, problem = builder(raw_df)
+    except Exception as e:
+        # Like a sheet that cannot be parsed: this table fails, the rest of the snapshot is served
+        return replace(_failed_table(name, e), digest=raw["digest"], version=version, config=config)
+    return SheetTable(name, raw["digest"], version, df, problem=problem, config=config, **extra)
+
+
+class SnapshotStore:
+    # Owns the current Snapshot and rebuilds it from a byd_calc.sheets.SheetCache.
+    # snapshot() is cheap enough to call on every rerun: it compares content hashes
+    # and only rebuilds when a sheet's content actually changed.
+    # With a snapshot_dir, the store starts from the last snapshot saved there (see
+    # byd_calc.persist) and saves every new one, so a fresh process serves its first
+    # request without touching the network while the sheets are fetched in the background.
+    def __init__(self, sheet_cache, sources=None, snapshot_dir=None, campaigns=None):
+        self.sheet_cache = sheet_cache
+        self.campaigns, self.promotions_error = load_promotions(campaigns)
+        self.sources = sources or table_sources(self.campaigns)
+        self.configs = {name: table_config(link, builder) for name, (link, builder) in self.sources.items()}
+        self.snapshot_dir = snapshot_dir
+        self._current = None
+        self._build_lock = threading.Lock()
+        if snapshot_dir:
+            from .persist import load_snapshot
+
+            saved = load_snapshot(snapshot_dir)
+            # Tables saved under a different config are served until their sheet is
+            # back in the sheet cache, then rebuilt (see _changed)
+            if saved is not None and set(saved.tables) == set(self.sources):
+                self._current = replace(
+                    saved, campaigns=self.campaigns, promotions_error=self.promotions_error, _promotions={}
+                )
+
+    @property
+    def current(self):
+        return self._current
+
+    def snapshot(self):
+        # Latest snapshot, rebuilding the changed tables first if the sheets moved on.
+        # If another thread is already rebuilding, the previous snapshot is returned
+        # rather than waiting, except on the very first load.
+        names = list(self.sources)
+        urls = [self._url(name) for name in names]
+        current = self._current
+        # Only the very first load of a process without a saved snapshot waits on the network
+        with span("fetch"):
+            raw = dict(zip(names, self.sheet_cache.get_many(urls, block=current is None)))
+        if current is not None and not self._changed(current, raw):
+            cache_event("snapshot", hit=True)
+            return current
+        if not self._build_lock.acquire(blocking=current is None):
+            return current
+        try:
+            current = self._current
+            if current is None or self._changed(current, raw):
+                cache_event("snapshot", hit=False)
+                with span("clean"):
+                    self._current = self._build(current, raw)
+                with span("persist"):
+                    self._save(self._current)
+            return self._current
+        finally:
+            self._build_lock.release()
+
+    def _url(self, name):
+        return convert_google_sheet_link_to_csv(self.sources[name][0])
+
+    def _changed(self, current, raw):
+        for name, result in raw.items():
+            if result is None:
+                continue  # Still being fetched in the background
+            previous = current.tables[name]
+            if previous.config != self.configs[name]:
+                return True  # Built under another link or layout; its content no longer applies
+            if isinstance(result, Exception):
+                # A failed download keeps the last good table; only retry tables that never loaded
+                if previous.digest is None and repr(previous.error) != repr(result):
+                    return True
+                continue
+            if result["digest"] != (previous.rejected_digest or previous.digest):
+                return True
+        return False
+
+    def _build(self, current, raw):
+        version = current.version + 1 if current is not None else 1
+        tables = {}
+        for name, result in raw.items():
+            previous = current.tables.get(name) if current is not None else None
+            if previous is not None and (
+                result is None
+                or (
+                    previous.config == self.configs[name]
+                    and (
+                        (
+                            not isinstance(result, Exception)
+                            and result["digest"] == (previous.rejected_digest or previous.digest)
+                        )
+                        or (isinstance(result, Exception) and previous.digest is not None)
+                    )
+                )
+            ):
+                tables[name] = previous  # Unchanged (or temporarily unreachable): reuse as-is
+                continue
+            table = build_table(name, result, version, self.sources[name][1], self.configs[name])
+            if (
+                table.problem in (PROBLEM_LOAD_FAILED, PROBLEM_MISSING_COLUMNS)
+                and previous is not None
+                and previous.problem is None
+                and previous.config == self.configs[name]
+            ):
+                # A sheet that downloads but cannot be used (a sign-in page, a broken edit) is
+                # treated like a failed download: the last good table stays, with the reason.
+                # A sheet left with no usable rows is taken as it is.
+                table = replace(
+                    previous, rejected_digest=table.digest, rejected_problem=table.problem, rejected_error=table.error
+                )
+            elif table.problem is None and not isinstance(result, Exception):
+                # Only content that built a usable table becomes the sheet's disk fallback
+                self.sheet_cache.save_last_good(self._url(name), result["digest"])
+            tables[name] = table
+        return Snapshot(
+            version=version, created_at=time.time(), tables=tables,
+            campaigns=self.campaigns, promotions_error=self.promotions_error,
+        )
+
+    def _save(self, snapshot):
+        # Best effort: a read-only filesystem must never break serving quotes
+        if not self.snapshot_dir:
+            return
+        from .persist import save_snapshot
+
+        try:
+            save_snapshot(snapshot, self.snapshot_dir)
+        except OSError:
+            pass
@@ -0,0 +1,306 @@
+"""Server-side cache of resized car photos.
+
+Each source image (a direct Google Drive URL from convert_drive_link_to_direct_image_url,
+or one of the PNGs bundled with the app) is downloaded once, resized to every
+IMAGE_WIDTHS entry, and stored as both WebP and JPEG under IMAGE_CACHE_DIR. The
+directory is kept under a size cap by evicting the least recently used sources,
+all of their variants at once. Sources are downloaded again in the background once
+their variants are IMAGE_REFRESH_SECONDS old, so a Drive photo replaced under the
+same URL shows up within a day; ETags are content hashes, so clients notice too.
+A follower cache (fetch=False, used by cluster workers, see byd_calc.cluster) only
+reads the variants another process writes into the same directory: it never
+downloads, and leaves the size cap to that process.
+Pillow and requests are imported only when an image has to be fetched or resized.
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import cache_event, span
+
+IMAGE_CACHE_DIR = os.environ.get("BYD_IMAGE_CACHE_DIR", ".image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("BYD_IMAGE_CACHE_MB", "256")) * 1024 * 1024
+IMAGE_FOLLOW = os.environ.get("BYD_IMAGE_FOLLOW") == "1"  # Only read IMAGE_CACHE_DIR; another process fetches into it
+IMAGE_WIDTHS = {"desktop": 1280, "mobile": 720}  # Pixels; never upscaled
+IMAGE_FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+IMAGE_QUALITY = 80
+IMAGE_TIMEOUT = (3.05, 20)  # (connect, read) seconds; Drive originals can be several MB
+IMAGE_RETRIES = 1  # Images are always optional; the page falls back to the original URL
+IMAGE_RETRY_SECONDS = 60  # A failed source is not fetched again for this long
+IMAGE_REFRESH_SECONDS = 24 * 3600  # Cached variants older than this are re-fetched in the background
+BUNDLED_IMAGES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # The repo's *.png files
+
+ImageVariant = namedtuple("ImageVariant", ["content", "content_type", "etag"])
+
+
+class ImageUnavailableError(RuntimeError):
+    # The source could not be downloaded or decoded, or is not an allowed image source
+    pass
+
+
+def is_image_source(source):
+    # Only Drive direct links and bundled files are proxied, never arbitrary URLs
+    if not isinstance(source, str):
+        return False
+    if source.startswith("https://drive.google.com/uc?"):
+        return True
+    return _bundled_path(source) is not None
+
+
+def _bundled_path(source):
+    name = os.path.basename(source)
+    if name != source or not name.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
+        return None
+    path = os.path.join(BUNDLED_IMAGES_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def _resize(original, width, fmt):
+    from PIL import Image
+
+    with Image.open(io.BytesIO(original)) as image:
+        image.load()
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        if fmt == "jpeg":
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        out = io.BytesIO()
+        if fmt == "jpeg":
+            image.save(out, format="JPEG", quality=IMAGE_QUALITY, optimize=True, progressive=True)
+        else:
+            image.save(out, format="WEBP", quality=IMAGE_QUALITY, method=4)
+        return out.getvalue()
+
+
+def _variant_names(key):
+    # File names of every variant of one source
+    return [f"{key}.{variant}.{fmt}" for variant in IMAGE_WIDTHS for fmt in IMAGE_FORMATS]
+
+
+def _source_key(name):
+    # Source key of a variant file name
+    return name.split(".", 1)[0]
+
+
+class ImageCache:
+    # Process-wide, disk-backed cache of resized images. get() is cheap once a source has
+    # been processed (a dict lookup and a file read); the first request for a source
+    # downloads it and writes all of its variants. prefetch() warms sources in the background.
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES, max_workers=4, fetch=True):
+        self.cache_dir = cache_dir
+        self.fetch = fetch
+        self.max_bytes = max_bytes
+        self._sources = OrderedDict()  # source key -> {file name: size}, least recently used first
+        self._size = 0
+        self._failed = {}  # source -> (monotonic time, error)
+        self._inflight = {}  # source -> Lock held while it is being processed
+        self._refreshing = set()  # Sources with a background refresh queued or running
+        self._lock = threading.Lock()
+        self._session = None
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-fetch")
+        if fetch:
+            self._scan()
+
+    def get(self, source, variant="desktop", fmt="webp", block=True):
+        # ImageVariant for a source, fetching and resizing it on first use.
+        # With block=False an uncached source returns None and is fetched in the background.
+        if variant not in IMAGE_WIDTHS or fmt not in IMAGE_FORMATS:
+            raise ValueError(f"unknown image variant {variant!r} / {fmt!r}")
+        if not is_image_source(source):
+            raise ImageUnavailableError(f"not an image source: {source!r}")
+        key = self._key(source)
+        name = f"{key}.{variant}.{fmt}"
+        content, modified = self._read(name)
+        cache_event("image", hit=content is not None)
+        if content is not None and self.fetch and time.time() - modified > IMAGE_REFRESH_SECONDS:
+            self._refresh_in_background(source)
+        if content is None and not self.fetch:
+            if block:
+                raise ImageUnavailableError(f"image not cached yet: {source!r}")
+            return None
+        if content is None and not block:
+            self.prefetch([source])
+            return None
+        if content is None:
+            variants = self._process(source, key)
+            content = variants[name] if variants else self._read(name)[0]
+            if content is None:
+                raise ImageUnavailableError(f"image evicted before it could be served: {source!r}")
+        return ImageVariant(content, IMAGE_FORMATS[fmt], f'"{hashlib.sha1(content).hexdigest()[:20]}"')
+
+    def prefetch(self, sources):
+        if not self.fetch:
+            return
+        for source in sources:
+            if not is_image_source(source):
+                continue
+            key = self._key(source)
+            with self._lock:
+                if source in self._inflight or self._complete(key):
+                    continue
+            self._pool.submit(self._prefetch_one, source)
+
+    def _prefetch_one(self, source, refresh=False):
+        try:
+            self._process(source, self._key(source), refresh)
+        except ImageUnavailableError:
+            pass  # The cached variants, if any, are kept
+        finally:
+            if refresh:
+                with self._lock:
+                    self._refreshing.discard(source)
+
+    def _refresh_in_background(self, source):
+        with self._lock:
+            if source in self._refreshing:
+                return
+            self._refreshing.add(source)
+        self._pool.submit(self._prefetch_one, source, True)
+
+    def _key(self, source):
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    def _complete(self, key):
+        # Whether every variant of a source is cached; call with self._lock held
+        files = self._sources.get(key, {})
+        return all(name in files for name in _variant_names(key))
+
+    def _read(self, name):
+        # (content, modification time) of a cached variant, or (None, None).
+        # A follower keeps no index: the fetching process adds and evicts the files.
+        if self.fetch:
+            key = _source_key(name)
+            with self._lock:
+                if name not in self._sources.get(key, {}):
+                    return None, None
+                self._sources.move_to_end(key)
+        try:
+            with open(os.path.join(self.cache_dir, name), "rb") as f:
+                return f.read(), os.fstat(f.fileno()).st_mtime
+        except OSError:
+            self._forget(name)
+            return None, None
+
+    def _process(self, source, key, refresh=False):
+        # Downloads and resizes one source and returns its variants by file name, or None if
+        # another caller already did; concurrent callers for the same source wait for the first.
+        # refresh=True downloads it again even when every variant is cached.
+        with self._lock:
+            failed = self._failed.get(source)
+            if failed is not None and time.monotonic() - failed[0] < IMAGE_RETRY_SECONDS:
+                raise ImageUnavailableError(f"image unavailable: {failed[1]}")
+            source_lock = self._inflight.setdefault(source, threading.Lock())
+        with source_lock:
+            try:
+                with self._lock:
+                    if self._complete(key) and not refresh:
+                        return None
+                try:
+                    with span("image.fetch"):
+                        original = self._download(source)
+                    with span("image.resize"):
+                        variants = {
+                            f"{key}.{variant}.{fmt}": _resize(original, width, fmt)
+                            for variant, width in IMAGE_WIDTHS.items()
+                            for fmt in IMAGE_FORMATS
+                        }
+                except Exception as e:
+                    with self._lock:
+                        self._failed[source] = (time.monotonic(), e)
+                    raise ImageUnavailableError(f"image unavailable: {e}") from e
+                with self._lock:
+                    self._failed.pop(source, None)
+                self._store(variants)
+                return variants
+            finally:
+                with self._lock:
+                    self._inflight.pop(source, None)
+
+    def _download(self, source):
+        path = _bundled_path(source)
+        if path is not None:
+            with open(path, "rb") as f:
+                return f.read()
+        if self._session is None:
+            from .sheets import make_sheet_session
+
+            self._session = make_sheet_session(retries=IMAGE_RETRIES)
+        response = self._session.get(source, timeout=IMAGE_TIMEOUT)
+        response.raise_for_status()
+        return response.content
+
+    def _store(self, variants):
+        # Best effort: on a read-only filesystem images are still served, just not cached
+        for name, content in variants.items():
+            path = os.path.join(self.cache_dir, name)
+            tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"  # Unique: another process may store the same source
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            except OSError:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                continue
+            self._add(name, len(content))
+        self._evict()
+
+    def _add(self, name, size):
+        key = _source_key(name)
+        with self._lock:
+            files = self._sources.setdefault(key, {})
+            self._size += size - files.get(name, 0)
+            files[name] = size
+            self._sources.move_to_end(key)
+
+    def _evict(self):
+        # Least recently used sources go first, all of their variants together, so a cached
+        # source always has all of them. The most recent source is never evicted, e.g. the
+        # one just stored.
+        with self._lock:
+            evicted = []
+            while self._size > self.max_bytes and len(self._sources) > 1:
+                _, files = self._sources.popitem(last=False)
+                self._size -= sum(files.values())
+                evicted.extend(files)
+        for name in evicted:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def _forget(self, name):
+        key = _source_key(name)
+        with self._lock:
+            files = self._sources.get(key)
+            if files is None:
+                return
+            self._size -= files.pop(name, 0)
+            if not files:
+                del self._sources[key]
+
+    def _scan(self):
+        # Picks up variants written by earlier runs, oldest modification first
+        try:
+            entries = [e for e in os.scandir(self.cache_dir) if e.is_file() and not e.name.endswith(".tmp")]
+        except OSError:
+            return
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            self._add(entry.name, entry.stat().st_size)
+        self._evict()
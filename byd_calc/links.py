@@ -0,0 +1,42 @@
+"""Google Sheets / Google Drive share-link converters."""
+import os
+import re
+
+GOOGLE_SHEETS_BASE_URL = "https://docs.google.com"
+GOOGLE_SHEET_ID_RE = re.compile(r"/d/([a-zA-Z0-9-_]+)")
+GOOGLE_SHEET_GID_RE = re.compile(r"gid=([0-9]+)")
+GOOGLE_DRIVE_FILE_ID_RE = re.compile(r"/d/([a-zA-Z0-9_-]+)")
+
+
+def sheets_base_url() -> str:
+    # Where sheet exports are downloaded from. BYD_SHEETS_BASE_URL points the whole app
+    # at a local stand-in (see scripts/fake_sheets.py) for offline runs and benchmarks.
+    return os.environ.get("BYD_SHEETS_BASE_URL", GOOGLE_SHEETS_BASE_URL).rstrip("/")
+
+
+def is_google_sheet_link(link) -> bool:
+    # Whether convert_google_sheet_link_to_csv() can turn the link into an export URL
+    return isinstance(link, str) and link.startswith(GOOGLE_SHEETS_BASE_URL + "/spreadsheets/d/") and bool(
+        GOOGLE_SHEET_ID_RE.search(link)
+    )
+
+
+def convert_google_sheet_link_to_csv(shared_link: str) -> str:
+    # Converts a Google Sheet share link to a direct CSV export link.
+    # Links without a sheet ID are returned unchanged; callers can compare to detect that.
+    sheet_id_match = GOOGLE_SHEET_ID_RE.search(shared_link)
+    gid_match = GOOGLE_SHEET_GID_RE.search(shared_link)
+    if sheet_id_match:
+        sheet_id = sheet_id_match.group(1)
+        gid = gid_match.group(1) if gid_match else "0"  # Default to first sheet if gid not specified
+        return f"{sheets_base_url()}/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
+    return shared_link
+
+
+def convert_drive_link_to_direct_image_url(shared_link: str) -> str:
+    # Converts a Google Drive file share link to a direct view link
+    match = GOOGLE_DRIVE_FILE_ID_RE.search(shared_link)
+    if match:
+        file_id = match.group(1)
+        return f"https://drive.google.com/uc?export=view&id={file_id}"
+    return shared_link
@@ -0,0 +1,45 @@
+"""Comparison matrix: the installment of every car x rate tier x term.
+
+Cars that share a rate table (the standard rates, or one promotion's) are quoted
+together with one quote_grid() call per table; group_by_rate_index() does that
+grouping for both the matrix and byd_calc.affordability.
+"""
+import numpy as np
+
+from .quotes import quote_grid
+from .rates import RATE_PERIODS
+
+
+def group_by_rate_index(cars, rate_index_for):
+    # [(rate index, car positions)] in first-seen order, one entry per distinct rate table.
+    # rate_index_for(model, submodel) -> (RateIndex, campaign or None), e.g. Snapshot.rate_index_for
+    groups = {}  # id(rate index) -> (rate index, car positions)
+    for i, car in enumerate(cars):
+        rate_index, _ = rate_index_for(car.model, car.submodel)
+        groups.setdefault(id(rate_index), (rate_index, []))[1].append(i)
+    return list(groups.values())
+
+
+def comparison_matrix(cars, rate_index_for, periods=RATE_PERIODS):
+    # DataFrame with one row per car and tier of its rate table: model, submodel, down_percent,
+    # then one column per term holding the monthly installment rounded up to the next baht
+    # like the page shows it, NaN where that tier and term cannot be financed
+    import pandas as pd
+
+    cars = list(cars)
+    parts = []
+    for rate_index, positions in group_by_rate_index(cars, rate_index_for):
+        if rate_index.empty:
+            continue
+        grid = quote_grid([cars[i].price for i in positions], rate_index.tiers, periods, rate_index)
+        monthly = np.where(grid.eligible, np.ceil(grid.monthly_installment), np.nan)
+        for row, i in enumerate(positions):
+            part = pd.DataFrame(monthly[row], columns=list(periods))
+            part.insert(0, "down_percent", np.asarray(rate_index.tiers, dtype=float))
+            part.insert(0, "submodel", cars[i].submodel)
+            part.insert(0, "model", cars[i].model)
+            parts.append((i, part))
+    if not parts:
+        return pd.DataFrame(columns=["model", "submodel", "down_percent", *periods])
+    parts.sort(key=lambda p: p[0])  # Catalog order, whichever rate table a car uses
+    return pd.concat([part for _, part in parts], ignore_index=True)
@@ -0,0 +1,162 @@
+"""Lightweight, switchable timing spans and cache counters.
+
+    with span("fetch"):
+        ...
+    cache_event("sheet", hit=True)
+
+Every span's duration goes to a process-wide registry that keeps the most recent
+samples per span name for p50/p95/p99, plus total counts. start_trace() also
+collects the spans of the current context (one Streamlit rerun) into a list;
+own_trace() gives a block (a Streamlit fragment) a list of its own.
+render_prometheus() formats the registry in the Prometheus text format and
+start_metrics_server() serves it at /metrics. Set BYD_METRICS=0 to turn
+recording off entirely.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.environ.get("BYD_METRICS", "1") != "0"
+SAMPLES_PER_SPAN = 2048  # Percentiles are computed over this many most recent samples
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class MetricsRegistry:
+    def __init__(self, samples=SAMPLES_PER_SPAN):
+        self.samples = samples
+        self._spans = {}  # name -> [deque of seconds, count, total seconds]
+        self._cache = {}  # cache name -> [hits, misses]
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = [deque(maxlen=self.samples), 0, 0.0]
+            stats[0].append(seconds)
+            stats[1] += 1
+            stats[2] += seconds
+
+    def cache_event(self, cache, hit):
+        with self._lock:
+            counts = self._cache.setdefault(cache, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def span_stats(self):
+        # name -> {"count", "sum", "p50", "p95", "p99"} with durations in seconds
+        with self._lock:
+            spans = {name: (sorted(s[0]), s[1], s[2]) for name, s in self._spans.items()}
+        stats = {}
+        for name, (samples, count, total) in spans.items():
+            entry = {"count": count, "sum": total}
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}"] = samples[min(len(samples) - 1, int(q * len(samples)))]
+            stats[name] = entry
+        return stats
+
+    def cache_stats(self):
+        # cache name -> {"hits", "misses", "hit_rate"}
+        with self._lock:
+            caches = {name: tuple(c) for name, c in self._cache.items()}
+        return {
+            name: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else None}
+            for name, (hits, misses) in caches.items()
+        }
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._cache.clear()
+
+
+REGISTRY = MetricsRegistry()
+_trace = contextvars.ContextVar("byd_metrics_trace", default=None)
+
+
+def start_trace():
+    # Starts collecting (span name, seconds) pairs for the current context; returns the list
+    trace = []
+    _trace.set(trace)
+    return trace
+
+
+@contextmanager
+def own_trace():
+    # Collects the block's (or, as a decorator, each call's) spans into a fresh list and
+    # restores the outer trace afterwards.
+    # A fragment-only rerun must not append to the trace of the full rerun before it,
+    # which is already stored for the timing panel.
+    trace = []
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def span(name):
+    # Times the block into the process-wide registry and the current trace, if any
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        REGISTRY.observe(name, elapsed)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((name, elapsed))
+
+
+def cache_event(cache, hit):
+    if ENABLED:
+        REGISTRY.cache_event(cache, hit)
+
+
+def render_prometheus(registry=REGISTRY):
+    lines = [
+        "# HELP byd_span_duration_seconds Duration of instrumented calculator stages.",
+        "# TYPE byd_span_duration_seconds summary",
+    ]
+    for name, s in sorted(registry.span_stats().items()):
+        for q in QUANTILES:
+            lines.append(f'byd_span_duration_seconds{{span="{name}",quantile="{q}"}} {s[f"p{int(q * 100)}"]:.6f}')
+        lines.append(f'byd_span_duration_seconds_sum{{span="{name}"}} {s["sum"]:.6f}')
+        lines.append(f'byd_span_duration_seconds_count{{span="{name}"}} {s["count"]}')
+    lines += [
+        "# HELP byd_cache_requests_total Cache lookups by result.",
+        "# TYPE byd_cache_requests_total counter",
+    ]
+    for name, c in sorted(registry.cache_stats().items()):
+        lines.append(f'byd_cache_requests_total{{cache="{name}",result="hit"}} {c["hits"]}')
+        lines.append(f'byd_cache_requests_total{{cache="{name}",result="miss"}} {c["misses"]}')
+    return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(port, host="127.0.0.1", registry=REGISTRY):
+    # Serves render_prometheus() at http://host:port/metrics from a daemon thread
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus(registry).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    return server
@@ -0,0 +1,224 @@
+"""Compact on-disk Snapshot format for instant cold starts.
+
+Layout of a snapshot directory::
+
+    <root>/CURRENT                    name of the live snapshot, swapped atomically
+    <root>/v12-3f9c0a1b/manifest.json tables, digests, builder configs, versions, column dtypes
+    <root>/v12-3f9c0a1b/<table>.<column>.npy
+    <root>/v12-3f9c0a1b/<table>.tiers.npy / <table>.rates.npy   compiled RateIndex
+
+Every column is a plain .npy file (strings as fixed-width unicode), so a fresh
+process loads them with ``np.load(mmap_mode="r")``: no network, no CSV parsing,
+and the compiled rate arrays are used straight from the page cache, shared by
+every worker process on the host.
+
+A SnapshotFollower is the read-only side: it serves whatever snapshot another
+process last published into a directory (see byd_calc.cluster), picking up each
+new one as CURRENT changes, and never fetches a sheet itself.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import replace
+
+import numpy as np
+
+from .catalog import Catalog
+from .data import DataUnavailableError, Snapshot, SheetTable, load_promotions, unavailable_snapshot
+from .rates import RateIndex
+
+SNAPSHOT_DIR = os.environ.get("BYD_SNAPSHOT_DIR", ".snapshot")
+FORMAT_VERSION = 2  # Bumped when the layout changes; older snapshots are ignored and rebuilt
+CURRENT_FILE = "CURRENT"
+KEEP_SNAPSHOTS = 3  # Older directories are removed; readers that still map them keep working on POSIX
+SNAPSHOT_FOLLOW = os.environ.get("BYD_SNAPSHOT_FOLLOW") == "1"  # Only read SNAPSHOT_DIR; another process writes it
+FOLLOW_CHECK_SECONDS = 1.0  # How often a follower looks at CURRENT
+FOLLOW_WAIT_SECONDS = 30.0  # How long a follower's first snapshot() waits for the writer to publish one
+
+
+def _save_frame(df, directory, table):
+    columns = []
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        entry = {"name": str(col), "file": f"{table}.{i}.npy"}
+        if series.dtype.kind in "biuf":
+            values = series.to_numpy()
+        else:
+            nulls = series.isna().to_numpy()
+            values = np.array(["" if null else str(v) for v, null in zip(series, nulls)], dtype=str)
+            if nulls.any():
+                entry["nulls"] = f"{table}.{i}.nulls.npy"
+                np.save(os.path.join(directory, entry["nulls"]), nulls)
+        entry["dtype"] = values.dtype.str
+        np.save(os.path.join(directory, entry["file"]), values, allow_pickle=False)
+        columns.append(entry)
+    return columns
+
+
+def _load_frame(columns, directory, mmap_mode):
+    import pandas as pd
+
+    data = {}
+    for entry in columns:
+        values = np.load(os.path.join(directory, entry["file"]), mmap_mode=mmap_mode, allow_pickle=False)
+        if values.dtype.kind == "U":
+            values = values.astype(object)
+            if "nulls" in entry:
+                nulls = np.load(os.path.join(directory, entry["nulls"]), allow_pickle=False)
+                values[nulls] = np.nan
+        data[entry["name"]] = values
+    return pd.DataFrame(data, columns=[entry["name"] for entry in columns])
+
+
+def save_snapshot(snapshot, root):
+    # Writes the snapshot into a new directory under root and points CURRENT at it.
+    # Returns the directory name. Readers never see a partially written snapshot.
+    os.makedirs(root, exist_ok=True)
+    name = f"v{snapshot.version}-{uuid.uuid4().hex[:8]}"
+    tmp_dir = os.path.join(root, f".{name}.tmp")
+    os.makedirs(tmp_dir)
+    manifest = {"format": FORMAT_VERSION, "version": snapshot.version, "created_at": snapshot.created_at, "tables": {}}
+    for table_name, table in snapshot.tables.items():
+        entry = {
+            "digest": table.digest,
+            "config": table.config,
+            "version": table.version,
+            "problem": table.problem,
+            "error": repr(table.error) if table.error is not None else None,
+            "rejected_digest": table.rejected_digest,
+            "rejected_problem": table.rejected_problem,
+            "rejected_error": repr(table.rejected_error) if table.rejected_error is not None else None,
+            "columns": _save_frame(table.df, tmp_dir, table_name),
+        }
+        if table.index is not None:
+            entry["tiers"] = f"{table_name}.tiers.npy"
+            entry["rates"] = f"{table_name}.rates.npy"
+            np.save(os.path.join(tmp_dir, entry["tiers"]), np.ascontiguousarray(table.index.tiers))
+            np.save(os.path.join(tmp_dir, entry["rates"]), np.ascontiguousarray(table.index.rates))
+        if table.catalog is not None:
+            entry["catalog"] = True  # Rebuilt from the car columns on load
+        manifest["tables"][table_name] = entry
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_dir, os.path.join(root, name))
+
+    current_tmp = os.path.join(root, f".{CURRENT_FILE}.{uuid.uuid4().hex[:8]}")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(current_tmp, os.path.join(root, CURRENT_FILE))
+    _prune(root, keep=name)
+    return name
+
+
+def _prune(root, keep):
+    snapshots = sorted(
+        (d for d in os.listdir(root) if d.startswith("v") and os.path.isdir(os.path.join(root, d)) and d != keep),
+        key=lambda d: os.path.getmtime(os.path.join(root, d)),
+    )
+    for d in snapshots[: max(0, len(snapshots) - (KEEP_SNAPSHOTS - 1))]:
+        shutil.rmtree(os.path.join(root, d), ignore_errors=True)
+
+
+def current_snapshot_name(root):
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def load_snapshot(root, mmap_mode="r", name=None):
+    # Snapshot from root's CURRENT directory (or the named one), or None if there is none
+    # (or it is unreadable). Rate indexes are memory-mapped read-only; frames are rebuilt
+    # from the mapped columns.
+    name = name or current_snapshot_name(root)
+    if name is None:
+        return None
+    directory = os.path.join(root, name)
+    try:
+        with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != FORMAT_VERSION:
+            return None
+        tables = {}
+        for table_name, entry in manifest["tables"].items():
+            df = _load_frame(entry["columns"], directory, mmap_mode)
+            extra = {}
+            if "tiers" in entry:
+                extra["index"] = RateIndex.from_arrays(
+                    np.load(os.path.join(directory, entry["tiers"]), mmap_mode=mmap_mode),
+                    np.load(os.path.join(directory, entry["rates"]), mmap_mode=mmap_mode),
+                )
+            if entry.get("catalog"):
+                extra["catalog"] = Catalog.from_frame(df) if entry["problem"] is None else Catalog()
+            tables[table_name] = SheetTable(
+                table_name, entry["digest"], entry["version"], df,
+                problem=entry["problem"],
+                error=RuntimeError(entry["error"]) if entry["error"] else None,
+                config=entry.get("config"),  # Absent before configs were saved: rebuilt on the next refresh
+                rejected_digest=entry.get("rejected_digest"),
+                rejected_problem=entry.get("rejected_problem"),
+                rejected_error=RuntimeError(entry["rejected_error"]) if entry.get("rejected_error") else None,
+                **extra,
+            )
+    except (OSError, ValueError, KeyError):
+        return None
+    return Snapshot(version=manifest["version"], created_at=manifest["created_at"], tables=tables)
+
+
+class SnapshotFollower:
+    # Drop-in for SnapshotStore in processes that only read a snapshot directory another
+    # process publishes into. snapshot() looks at CURRENT at most every check_seconds and
+    # maps the new snapshot when it changed, so every follower on the host serves the same
+    # data version from the same mapped rate arrays. Until the writer has published anything,
+    # snapshot() returns a version 0 snapshot whose tables all failed to load.
+    def __init__(self, root, campaigns=None, check_seconds=FOLLOW_CHECK_SECONDS, wait_seconds=FOLLOW_WAIT_SECONDS):
+        self.root = root
+        self.campaigns, self.promotions_error = load_promotions(campaigns)
+        self.check_seconds = check_seconds
+        self.wait_seconds = wait_seconds
+        self._current = None
+        self._name = None
+        self._checked_at = float("-inf")
+        self._waited = False
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self._current
+
+    def snapshot(self):
+        if self._current is not None and time.monotonic() - self._checked_at < self.check_seconds:
+            return self._current
+        with self._lock:
+            self._follow()
+            if self._current is None and not self._waited:
+                # Only the very first call of a process waits, while the writer is starting up
+                self._waited = True
+                deadline = time.monotonic() + self.wait_seconds
+                while self._current is None and time.monotonic() < deadline:
+                    time.sleep(min(self.check_seconds, 0.25))
+                    self._follow()
+            if self._current is None:
+                return unavailable_snapshot(
+                    self.campaigns,
+                    DataUnavailableError(f"no rate data has been published to {self.root} yet"),
+                    self.promotions_error,
+                )
+            return self._current
+
+    def _follow(self):
+        self._checked_at = time.monotonic()
+        name = current_snapshot_name(self.root)
+        if name is None or name == self._name:
+            return
+        loaded = load_snapshot(self.root, name=name)
+        if loaded is None:
+            return  # Pruned or half-visible; the next check reads CURRENT again
+        # Campaigns whose table the writer does not publish (a different promotions.json) are ignored
+        campaigns = tuple(c for c in self.campaigns if c.table in loaded.tables)
+        self._current = replace(loaded, campaigns=campaigns, promotions_error=self.promotions_error)
+        self._name = name
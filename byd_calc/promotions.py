@@ -0,0 +1,198 @@
+"""Declarative promotion campaigns and their compiled (model, submodel) -> rate table map.
+
+Campaigns are read from PROMOTIONS_FILE (JSON)::
+
+    {"campaigns": [{
+        "name": "seal_special",                  # unique, [A-Za-z0-9_-]; the rate table is "promo.<name>"
+        "label": "BYD SEAL Dynamic/Premium",     # shown to customers
+        "sheet": "https://docs.google.com/...",  # share link of the campaign's rate sheet
+        "layout": "promo",                       # "standard" or "promo" column names (see RATE_LAYOUTS),
+                                                 # or a map of sheet column -> each of RATE_COLUMNS
+        "models": ["BYD SEAL"],                  # exact model names; omit for every model
+        "submodels": [],                         # exact submodel names; omit for every submodel
+        "submodel_keywords": ["dynamic"],        # ... or words the submodel must contain
+        "starts": "2025-01-01", "ends": null,    # inclusive dates (Bangkok time); null = open
+        "priority": 10                           # highest wins when campaigns overlap
+    }]}
+
+Names are compared case-insensitively with whitespace collapsed. compile_promotions()
+resolves every car in the catalog against every active campaign once, so choosing
+the rate table for a quote is a single dict lookup however many campaigns run.
+"""
+import json
+import os
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+
+from .cleaning import RATE_COLUMNS, SEAL_PROMO_RATE_COLUMNS, STANDARD_RATE_COLUMNS
+from .links import is_google_sheet_link
+
+PROMOTIONS_FILE = os.environ.get(
+    "BYD_PROMOTIONS_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "promotions.json"),
+)
+PROMOTIONS_TZ = timezone(timedelta(hours=7))  # Campaign dates are showroom (Bangkok) dates
+RATE_LAYOUTS = {"standard": STANDARD_RATE_COLUMNS, "promo": SEAL_PROMO_RATE_COLUMNS}
+CAMPAIGN_NAME_RE = re.compile(r"[A-Za-z0-9_-]+")  # Names end up in snapshot file names
+
+
+def normalize_name(text):
+    return " ".join(str(text).split()).casefold()
+
+
+@dataclass(frozen=True)
+class Campaign:
+    name: str
+    label: str
+    sheet: str
+    columns: dict  # Sheet column -> cleaned column, like cleaning.STANDARD_RATE_COLUMNS
+    models: frozenset = frozenset()  # Normalized; empty matches every model
+    submodels: frozenset = frozenset()
+    submodel_keywords: tuple = ()
+    starts: date = None
+    ends: date = None
+    priority: int = 0
+
+    @property
+    def table(self):
+        # Name of this campaign's rate table in a Snapshot
+        return f"promo.{self.name}"
+
+    def active_on(self, day):
+        return (self.starts is None or self.starts <= day) and (self.ends is None or day <= self.ends)
+
+    def matches(self, model, submodel):
+        if self.models and normalize_name(model) not in self.models:
+            return False
+        if not self.submodels and not self.submodel_keywords:
+            return True
+        submodel = normalize_name(submodel)
+        return submodel in self.submodels or any(kw in submodel for kw in self.submodel_keywords)
+
+
+def _date(value, field_name, name):
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"campaign {name!r}: {field_name} must be an ISO date (YYYY-MM-DD), got {value!r}")
+
+
+def _names(entry, field_name, name):
+    # Normalized entries of a list-of-strings field; a bare string would otherwise be split into letters
+    values = entry.get(field_name, [])
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        raise ValueError(f"campaign {name!r}: {field_name} must be a list of strings, got {values!r}")
+    return [normalize_name(v) for v in values]
+
+
+def _string(entry, field_name, name, default=None):
+    value = entry.get(field_name, default)
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"campaign {name!r}: {field_name} must be a non-empty string, got {value!r}")
+    return value
+
+
+def _sheet(entry, name):
+    value = _string(entry, "sheet", name)
+    if not is_google_sheet_link(value):
+        raise ValueError(f"campaign {name!r}: sheet must be a Google Sheet share link, got {value!r}")
+    return value
+
+
+def _columns(layout, name):
+    # Sheet column -> cleaned column map of a layout name or an explicit map
+    if isinstance(layout, str) and layout in RATE_LAYOUTS:
+        return RATE_LAYOUTS[layout]
+    if (
+        isinstance(layout, dict)
+        and all(isinstance(k, str) and isinstance(v, str) for k, v in layout.items())
+        and sorted(layout.values()) == sorted(RATE_COLUMNS)
+    ):
+        return dict(layout)
+    raise ValueError(
+        f"campaign {name!r}: layout must be one of {list(RATE_LAYOUTS)} or a map of sheet column names"
+        f" to each of {RATE_COLUMNS}, got {layout!r}"
+    )
+
+
+def _priority(value, name):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"campaign {name!r}: priority must be an integer, got {value!r}")
+    return value
+
+
+def parse_campaigns(config):
+    # Campaigns from a parsed promotions config; raises ValueError on invalid entries
+    entries = config.get("campaigns", []) if isinstance(config, dict) else None
+    if not isinstance(entries, list):
+        raise ValueError('promotions config must be {"campaigns": [...]}')
+    campaigns = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("name") or not entry.get("sheet"):
+            raise ValueError(f"every campaign needs a name and a sheet: {entry!r}")
+        name = entry["name"]
+        if not isinstance(name, str) or not CAMPAIGN_NAME_RE.fullmatch(name):
+            raise ValueError(f"campaign names may only contain letters, digits, '_' and '-', got {name!r}")
+        campaigns.append(Campaign(
+            name=name,
+            label=_string(entry, "label", name, default=name),
+            sheet=_sheet(entry, name),
+            columns=_columns(entry.get("layout", "promo"), name),
+            models=frozenset(_names(entry, "models", name)),
+            submodels=frozenset(_names(entry, "submodels", name)),
+            submodel_keywords=tuple(_names(entry, "submodel_keywords", name)),
+            starts=_date(entry.get("starts"), "starts", name),
+            ends=_date(entry.get("ends"), "ends", name),
+            priority=_priority(entry.get("priority", 0), name),
+        ))
+    if len({c.name for c in campaigns}) != len(campaigns):
+        raise ValueError("campaign names must be unique")
+    return tuple(campaigns)
+
+
+def load_campaigns(path=PROMOTIONS_FILE):
+    # Campaigns from a promotions file; no file means no promotions
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return ()
+    return parse_campaigns(config)
+
+
+def promotions_today():
+    return datetime.now(PROMOTIONS_TZ).date()
+
+
+class PromotionMap:
+    # Compiled campaigns for one snapshot and one day: (model, submodel) -> (rate index, campaign)
+    __slots__ = ("day", "standard", "_by_car")
+
+    def __init__(self, day, standard, by_car):
+        self.day = day
+        self.standard = standard
+        self._by_car = by_car
+
+    def resolve(self, model, submodel):
+        # (rate index to quote with, the campaign it comes from or None for standard rates)
+        return self._by_car.get((model, submodel), (self.standard, None))
+
+
+def compile_promotions(cars, campaigns, rate_tables, standard, day):
+    # cars: (model, submodel) pairs; rate_tables: campaign table name -> RateIndex.
+    # Each car gets the highest-priority active campaign that matches it and has usable
+    # rates (earlier campaigns win ties); cars without one quote at standard rates.
+    ranked = sorted(
+        (c for c in campaigns if c.active_on(day) and c.table in rate_tables and not rate_tables[c.table].empty),
+        key=lambda c: -c.priority,
+    )
+    by_car = {}
+    for model, submodel in cars:
+        for campaign in ranked:
+            if campaign.matches(model, submodel):
+                by_car[(model, submodel)] = (rate_tables[campaign.table], campaign)
+                break
+    return PromotionMap(day, standard, by_car)
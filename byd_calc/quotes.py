@@ -0,0 +1,278 @@
+"""Flat-rate installment quotes for single selections and whole grids."""
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+from .rates import RateIndex
+
+MIN_DOWN_PERCENT = 5  # Smallest down payment (% of price) the showroom accepts
+THIRTY_PLAN_TIER = 30.0  # Down payments above this tier are offered the 30% plan instead
+THIRTY_PLAN_MIN_INTEREST = 25000  # A 30% plan term qualifies only if its total interest exceeds this (THB)
+
+# Quote.status values
+QUOTE_OK = "ok"  # Regular quote at the matched tier
+QUOTE_THIRTY_PLAN = "thirty_plan"  # Down payment above 30%: see thirty_plan_options
+QUOTE_NO_THIRTY_PLAN = "no_thirty_plan"  # 30% plan applies but no term clears the minimum interest
+QUOTE_NO_FINANCING = "no_financing"  # Down payment covers the whole price
+QUOTE_NO_TIER = "no_tier"  # Down payment is below the lowest tier
+QUOTE_MISSING_RATE = "missing_rate"  # The sheet has no rate for the matched tier and period
+
+
+@dataclass(frozen=True)
+class ThirtyPlanOption:
+    period: int
+    interest_rate: float
+    total_interest: float
+    monthly_installment: float
+
+
+@dataclass(frozen=True)
+class Quote:
+    status: str
+    price: float
+    down_payment: float
+    down_percent: float
+    period: int
+    loan_amount: float
+    matched_tier: float = None
+    interest_rate: float = math.nan
+    total_interest: float = math.nan
+    monthly_installment: float = math.nan
+    thirty_plan_options: tuple = ()
+    snapshot_version: str = None  # Snapshot.data_version of the rate data the quote was made under
+
+
+@dataclass(frozen=True)
+class QuoteGrid:
+    # Every array has shape (len(prices), len(down_percents), len(periods)).
+    # Cells that cannot be financed hold NaN (or -1 for matched_tier) and eligible=False.
+    prices: np.ndarray
+    down_percents: np.ndarray
+    periods: np.ndarray
+    down_payment: np.ndarray
+    loan_amount: np.ndarray
+    matched_tier: np.ndarray
+    interest_rate: np.ndarray
+    total_interest: np.ndarray
+    monthly_installment: np.ndarray
+    thirty_plan: np.ndarray
+    eligible: np.ndarray
+
+
+def flat_rate_installment(loan_amount, interest_rate, period):
+    # (total interest, monthly installment) of a flat-rate loan; works on scalars and arrays alike
+    total_interest = loan_amount * (interest_rate / 100) * (period / 12)
+    return total_interest, (loan_amount + total_interest) / period
+
+
+def down_payment_for(price, down_percent):
+    # Down payment of a down % exactly as the calculator page computes it. Every quote path
+    # uses this one expression: reordering it can move the result by one ULP, enough for
+    # the rounded-up installment to differ by ฿1 between two paths.
+    return (down_percent / 100) * price
+
+
+# The 30% plan rules, shared by quote(), quote_batch() and quote_grid(). Both work on
+# scalars and NumPy arrays alike.
+def thirty_plan_applies(down_percent, rate_index: RateIndex):
+    # Down payments above THIRTY_PLAN_TIER get the 30% plan instead of their tier's rate,
+    # provided the sheet has a 30% tier
+    above = down_percent > THIRTY_PLAN_TIER
+    if isinstance(above, bool):
+        return above and rate_index.has_tier(THIRTY_PLAN_TIER)  # Skip the tier search for most single quotes
+    return above & rate_index.has_tier(THIRTY_PLAN_TIER)
+
+
+def thirty_plan_qualifies(total_interest):
+    # A 30% plan term is offered only when its total interest exceeds THIRTY_PLAN_MIN_INTEREST;
+    # NaN (no rate for the term) never does
+    return total_interest > THIRTY_PLAN_MIN_INTEREST
+
+
+class _RateLookup:
+    # Vectorized rate lookups for quote_batch() and quote_grid(). The tier x period matrix is
+    # padded with a NaN row and column, so row -1 ("below every tier") and column -1
+    # ("period not in the sheet") read NaN without any masking.
+    __slots__ = ("padded", "rows", "cols", "tier_values", "thirty_row", "n_periods")
+
+    def __init__(self, rate_index: RateIndex, down_percents, periods):
+        tiers = rate_index.tiers
+        rate_periods = np.asarray(rate_index.periods)
+        self.n_periods = len(rate_periods)
+        self.padded = np.full((len(tiers) + 1, self.n_periods + 1), np.nan)
+        self.padded[:len(tiers), :self.n_periods] = rate_index.rates
+        self.rows = np.searchsorted(tiers, down_percents, side='right') - 1
+        col = np.minimum(np.searchsorted(rate_periods, periods), self.n_periods - 1)
+        self.cols = np.where(rate_periods[col] == periods, col, -1)
+        self.tier_values = np.append(tiers, np.nan)  # tier_values[rows]: matched tier, NaN for none
+        has_thirty = rate_index.has_tier(THIRTY_PLAN_TIER)
+        self.thirty_row = rate_index.match_tier(THIRTY_PLAN_TIER) if has_thirty else -1
+
+    def thirty_rates(self):
+        # 30%-tier rate for every period of the sheet (NaN without a 30% tier)
+        return self.padded[self.thirty_row, :self.n_periods]
+
+
+def thirty_plan_options(loan_amount, rate_index: RateIndex, periods=None):
+    # Terms offered under the 30% plan: every period with a 30%-tier rate whose
+    # total interest on this loan qualifies
+    tier = rate_index.match_tier(THIRTY_PLAN_TIER)
+    options = []
+    for p in periods or rate_index.periods:
+        interest_rate = rate_index.rate(tier, p)
+        total_interest, monthly = flat_rate_installment(loan_amount, interest_rate, p)
+        if thirty_plan_qualifies(total_interest):
+            options.append(ThirtyPlanOption(p, interest_rate, total_interest, monthly))
+    return tuple(options)
+
+
+def quote(price, down_payment, down_percent, period, rate_index: RateIndex, snapshot_version=None) -> Quote:
+    # Quotes one selection exactly as the calculator page does. down_percent is passed in
+    # rather than derived from down_payment so slider values hit their tier exactly.
+    loan_amount = price - down_payment
+    base = dict(
+        price=price,
+        down_payment=down_payment,
+        down_percent=down_percent,
+        period=period,
+        loan_amount=loan_amount,
+        snapshot_version=snapshot_version,
+    )
+    if down_payment >= price:
+        return Quote(QUOTE_NO_FINANCING, **base)
+    if thirty_plan_applies(down_percent, rate_index):
+        options = thirty_plan_options(loan_amount, rate_index)
+        status = QUOTE_THIRTY_PLAN if options else QUOTE_NO_THIRTY_PLAN
+        return Quote(status, matched_tier=THIRTY_PLAN_TIER, thirty_plan_options=options, **base)
+    matched_tier, interest_rate = rate_index.lookup(down_percent, period)
+    if matched_tier is None:
+        return Quote(QUOTE_NO_TIER, **base)
+    if math.isnan(interest_rate):
+        return Quote(QUOTE_MISSING_RATE, matched_tier=matched_tier, **base)
+    total_interest, monthly = flat_rate_installment(loan_amount, interest_rate, period)
+    return Quote(
+        QUOTE_OK,
+        matched_tier=matched_tier,
+        interest_rate=interest_rate,
+        total_interest=total_interest,
+        monthly_installment=monthly,
+        **base,
+    )
+
+
+def quote_batch(prices, down_payments, down_percents, periods, rate_index: RateIndex, snapshot_version=None):
+    # Vectorized quote() over aligned 1-D inputs (one row per quote), for serving many
+    # quotes against the same rate table at once. Every number matches quote() exactly:
+    # the arithmetic is the same IEEE double operations, just done element-wise.
+    prices = np.asarray(prices, dtype=float)
+    down_payments = np.asarray(down_payments, dtype=float)
+    down_percents = np.asarray(down_percents, dtype=float)
+    periods = np.asarray(periods, dtype=int)
+    loan_amount = prices - down_payments
+
+    rate_periods = np.asarray(rate_index.periods)
+    lookup = _RateLookup(rate_index, down_percents, periods)
+    tier_index = lookup.rows
+    rate = lookup.padded[tier_index, lookup.cols]
+    with np.errstate(invalid='ignore'):
+        total_interest, monthly = flat_rate_installment(loan_amount, rate, periods)
+
+    thirty = thirty_plan_applies(down_percents, rate_index)
+    if thirty.any():
+        thirty_rates = lookup.thirty_rates()
+        with np.errstate(invalid='ignore'):
+            thirty_interest, thirty_monthly = flat_rate_installment(loan_amount[:, None], thirty_rates[None, :], rate_periods[None, :])
+            thirty_ok = thirty_plan_qualifies(thirty_interest)
+
+    # Plain Python lists: per-row indexing of NumPy arrays costs more than the math itself
+    row_prices, row_down, row_percents = prices.tolist(), down_payments.tolist(), down_percents.tolist()
+    row_periods, row_loans = periods.tolist(), loan_amount.tolist()
+    row_rates, row_interest, row_monthly = rate.tolist(), total_interest.tolist(), monthly.tolist()
+    row_tiers = lookup.tier_values[tier_index].tolist()
+    row_thirty, row_has_tier = thirty.tolist(), (tier_index >= 0).tolist()
+    quotes = []
+    for i in range(len(row_prices)):
+        base = dict(
+            price=row_prices[i],
+            down_payment=row_down[i],
+            down_percent=row_percents[i],
+            period=row_periods[i],
+            loan_amount=row_loans[i],
+            snapshot_version=snapshot_version,
+        )
+        if row_down[i] >= row_prices[i]:
+            quotes.append(Quote(QUOTE_NO_FINANCING, **base))
+        elif row_thirty[i]:
+            options = tuple(
+                ThirtyPlanOption(int(p), float(thirty_rates[j]), float(thirty_interest[i, j]), float(thirty_monthly[i, j]))
+                for j, p in enumerate(rate_periods) if thirty_ok[i, j]
+            )
+            status = QUOTE_THIRTY_PLAN if options else QUOTE_NO_THIRTY_PLAN
+            quotes.append(Quote(status, matched_tier=THIRTY_PLAN_TIER, thirty_plan_options=options, **base))
+        elif not row_has_tier[i]:
+            quotes.append(Quote(QUOTE_NO_TIER, **base))
+        elif math.isnan(row_rates[i]):
+            quotes.append(Quote(QUOTE_MISSING_RATE, matched_tier=row_tiers[i], **base))
+        else:
+            quotes.append(Quote(
+                QUOTE_OK,
+                matched_tier=row_tiers[i],
+                interest_rate=row_rates[i],
+                total_interest=row_interest[i],
+                monthly_installment=row_monthly[i],
+                **base,
+            ))
+    return quotes
+
+
+def quote_grid(prices, down_percents, periods, rate_table: RateIndex) -> QuoteGrid:
+    # Quotes every (price, down %, period) combination with NumPy broadcasting.
+    # Follows the calculator's rules: the highest tier <= down % sets the rate, and a down
+    # payment above 30% switches to the 30% plan rate, where a term is only eligible when
+    # its total interest exceeds THIRTY_PLAN_MIN_INTEREST.
+    prices = np.atleast_1d(np.asarray(prices, dtype=float))
+    down_percents = np.atleast_1d(np.asarray(down_percents, dtype=float))
+    periods = np.atleast_1d(np.asarray(periods, dtype=float))
+
+    price = prices[:, None, None]
+    down_percent = down_percents[None, :, None]
+    period = periods[None, None, :]
+
+    # Rates depend only on (down %, period): look them up once on a (D, T) grid
+    lookup = _RateLookup(rate_table, down_percents, periods)
+    rate = lookup.padded[lookup.rows[:, None], lookup.cols[None, :]]
+    matched_tier = np.where(lookup.rows >= 0, lookup.tier_values[lookup.rows], -1)
+
+    thirty_plan = np.asarray(thirty_plan_applies(down_percents, rate_table))
+    rate = np.where(thirty_plan[:, None], lookup.padded[lookup.thirty_row, lookup.cols][None, :], rate)
+    matched_tier = np.where(thirty_plan, THIRTY_PLAN_TIER, matched_tier)
+
+    shape = (len(prices), len(down_percents), len(periods))
+    down_payment = np.broadcast_to(down_payment_for(price, down_percent), shape)
+    loan_amount = price - down_payment
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total_interest, monthly = flat_rate_installment(loan_amount, rate[None, :, :], period)
+    total_interest = np.broadcast_to(total_interest, shape)
+    monthly = np.broadcast_to(monthly, shape)
+
+    thirty_cells = np.broadcast_to(thirty_plan[None, :, None], shape)
+    eligible = (
+        (down_percent >= MIN_DOWN_PERCENT)
+        & (loan_amount > 0)
+        & ~np.isnan(monthly)
+        & (~thirty_cells | thirty_plan_qualifies(total_interest))
+    )
+    return QuoteGrid(
+        prices=prices,
+        down_percents=down_percents,
+        periods=periods,
+        down_payment=down_payment,
+        loan_amount=loan_amount,
+        matched_tier=np.broadcast_to(matched_tier[None, :, None], shape),
+        interest_rate=np.broadcast_to(rate[None, :, :], shape),
+        total_interest=total_interest,
+        monthly_installment=monthly,
+        thirty_plan=thirty_cells,
+        eligible=eligible,
+    )
@@ -0,0 +1,65 @@
+"""Compiled interest rate tables for the BYD installment calculator."""
+import numpy as np
+
+RATE_PERIODS = (48, 60, 72, 84)  # Installment periods (months) offered in every rate sheet
+
+
+class RateIndex:
+    # Immutable, precompiled view of a cleaned rate sheet ('down_payment', '48', '60', '72', '84').
+    # Tiers are kept as a sorted NumPy array and rates as a dense tier x period matrix,
+    # so matching a down payment to its tier is a binary search instead of a DataFrame filter.
+    __slots__ = ("tiers", "periods", "rates", "_period_cols")
+
+    def __init__(self, rate_df):
+        if 'down_payment' in rate_df.columns:
+            # First row wins for a repeated tier, same as the old `.values[0]` / `.iloc[0]` lookups
+            df = rate_df.dropna(subset=['down_payment']).drop_duplicates(subset=['down_payment'])
+            df = df.sort_values('down_payment', kind='stable')
+            tiers = df['down_payment'].to_numpy(dtype=float)
+            columns = [
+                df[str(p)].to_numpy(dtype=float, na_value=np.nan) if str(p) in df.columns else np.full(len(df), np.nan)
+                for p in RATE_PERIODS
+            ]
+        else:
+            tiers, columns = np.empty(0), []
+        self.tiers = tiers
+        self.periods = RATE_PERIODS
+        self._period_cols = {p: i for i, p in enumerate(RATE_PERIODS)}
+        self.rates = np.column_stack(columns) if len(tiers) else np.empty((0, len(RATE_PERIODS)))
+        self.tiers.setflags(write=False)
+        self.rates.setflags(write=False)
+
+    @classmethod
+    def from_arrays(cls, tiers, rates):
+        # Rebuilds an index from saved arrays (e.g. read-only memory maps from byd_calc.persist)
+        index = cls.__new__(cls)
+        index.tiers = tiers
+        index.periods = RATE_PERIODS
+        index._period_cols = {p: i for i, p in enumerate(RATE_PERIODS)}
+        index.rates = rates
+        return index
+
+    @property
+    def empty(self):
+        return len(self.tiers) == 0
+
+    def match_tier(self, down_percent):
+        # Index of the highest tier <= down_percent, or None if the down payment is below every tier
+        i = int(np.searchsorted(self.tiers, down_percent, side='right')) - 1
+        return i if i >= 0 else None
+
+    def has_tier(self, percent):
+        i = self.match_tier(percent)
+        return i is not None and self.tiers[i] == percent
+
+    def rate(self, tier_index, period):
+        # Interest rate (% per year) for a tier and period; NaN when the sheet has no value
+        col = self._period_cols.get(period)
+        return float(self.rates[tier_index, col]) if col is not None else float("nan")
+
+    def lookup(self, down_percent, period):
+        # (matched tier %, interest rate) for a down payment percentage and period
+        i = self.match_tier(down_percent)
+        if i is None:
+            return None, float("nan")
+        return float(self.tiers[i]), self.rate(i, period)
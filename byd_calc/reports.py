@@ -0,0 +1,305 @@
+"""Month-by-month schedules, CSV / PDF reports and whole-catalog exports.
+
+Everything here streams: schedules are generators, CSV output is produced one
+line at a time, and a catalog export (every car x every tier x every term) is
+split per car across a process pool, with each worker writing its own gzip
+member to disk. Peak memory stays flat however many schedules are exported.
+
+    python -m byd_calc.reports --output catalog.csv.gz [--summary] [--workers 4]
+"""
+import csv
+import gzip
+import multiprocessing
+import os
+import shutil
+import tempfile
+import weakref
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .quotes import QUOTE_OK, QUOTE_THIRTY_PLAN, down_payment_for, quote_batch
+from .rates import RATE_PERIODS, RateIndex
+
+PLAN_STANDARD = "standard"
+PLAN_THIRTY = "thirty_plan"
+
+# One financed plan of a quote: the regular term, or one of the 30% plan options
+Plan = namedtuple("Plan", ["plan", "period", "interest_rate", "total_interest", "monthly_installment"])
+ScheduleRow = namedtuple(
+    "ScheduleRow", ["month", "installment", "principal", "interest", "principal_balance", "remaining_balance"]
+)
+
+QUOTE_COLUMNS = [
+    "model", "submodel", "price", "down_percent", "down_payment", "loan_amount",
+    "plan", "period", "interest_rate", "total_interest", "monthly_installment", "snapshot_version",
+]
+SCHEDULE_COLUMNS = list(ScheduleRow._fields)
+
+
+def financed_plans(q):
+    # Plans a customer can actually sign for this quote (none for errors / no financing)
+    if q.status == QUOTE_OK:
+        yield Plan(PLAN_STANDARD, q.period, q.interest_rate, q.total_interest, q.monthly_installment)
+    elif q.status == QUOTE_THIRTY_PLAN:
+        for option in q.thirty_plan_options:
+            yield Plan(PLAN_THIRTY, option.period, option.interest_rate, option.total_interest, option.monthly_installment)
+
+
+def schedule(loan_amount, total_interest, period):
+    # Flat-rate schedule: equal installments, each repaying an equal share of the
+    # principal and of the total interest. Balances are exactly 0 after the last month.
+    installment = (loan_amount + total_interest) / period
+    principal = loan_amount / period
+    interest = total_interest / period
+    total = loan_amount + total_interest
+    for month in range(1, period + 1):
+        if month == period:
+            yield ScheduleRow(month, installment, principal, interest, 0.0, 0.0)
+        else:
+            yield ScheduleRow(month, installment, principal, interest, loan_amount - principal * month, total - installment * month)
+
+
+def plan_schedule(q, plan):
+    return schedule(q.loan_amount, plan.total_interest, plan.period)
+
+
+class _Line:
+    # csv.writer target that hands back each formatted line instead of storing it
+    def write(self, line):
+        return line
+
+
+def _amount(value):
+    # Baht amounts in CSV output: two decimals, like _money() in the PDF but without separators
+    return f"{value:.2f}"
+
+
+def _quote_fields(q, plan, car):
+    model, submodel = car if car else ("", "")
+    return [
+        model, submodel, _amount(q.price), q.down_percent, _amount(q.down_payment), _amount(q.loan_amount),
+        plan.plan, plan.period, plan.interest_rate, _amount(plan.total_interest), _amount(plan.monthly_installment),
+        q.snapshot_version if q.snapshot_version is not None else "",
+    ]
+
+
+def quote_rows(q, car=None, schedules=True):
+    # CSV rows (lists) for one quote: one per plan, or one per plan month with schedules=True
+    for plan in financed_plans(q):
+        fields = _quote_fields(q, plan, car)
+        if not schedules:
+            yield fields
+            continue
+        for row in plan_schedule(q, plan):
+            yield fields + [row.month] + [_amount(value) for value in row[1:]]
+
+
+def csv_lines(rows, header):
+    # Formats rows as CSV text, one line per iteration
+    writer = csv.writer(_Line())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def quote_csv(q, car=None):
+    # Month-by-month CSV of every plan in one quote
+    return "".join(csv_lines(quote_rows(q, car), QUOTE_COLUMNS + SCHEDULE_COLUMNS))
+
+
+def _ascii(text):
+    # fpdf 1.7's core fonts are Latin-1 only; model names in Thai would not encode
+    return str(text).encode("ascii", "replace").decode("ascii")
+
+
+def _money(value):
+    return f"{value:,.2f}"
+
+
+def quote_pdf(q, car=None, comparison=()):
+    # PDF report for one quote: summary, an optional comparison table (other quotes for the
+    # same car, e.g. every term at this down payment) and the schedule of every plan
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 16)
+    title = "Installment quote" + (f": {car[0]} {car[1]}" if car else "")
+    pdf.cell(0, 10, _ascii(title), ln=1)
+    pdf.set_font("Arial", "", 10)
+    summary = [
+        ("Car price (THB)", _money(q.price)),
+        ("Down payment (THB)", f"{_money(q.down_payment)} ({q.down_percent:.2f}%)"),
+        ("Loan amount (THB)", _money(q.loan_amount)),
+    ]
+    if q.snapshot_version is not None:
+        summary.append(("Rate data version", str(q.snapshot_version)))
+    for label, value in summary:
+        pdf.cell(50, 6, label)
+        pdf.cell(0, 6, value, ln=1)
+
+    comparison_plans = [(other, plan) for other in comparison for plan in financed_plans(other)]
+    if comparison_plans:
+        pdf.ln(4)
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 8, "Comparison", ln=1)
+        _table(pdf, ["Plan", "Months", "Rate %", "Total interest", "Monthly"], [
+            [plan.plan, plan.period, f"{plan.interest_rate:.2f}", _money(plan.total_interest), _money(plan.monthly_installment)]
+            for _, plan in comparison_plans
+        ])
+
+    for plan in financed_plans(q):
+        pdf.ln(4)
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 8, _ascii(
+            f"{plan.period} months at {plan.interest_rate:.2f}% ({plan.plan}): "
+            f"{_money(plan.monthly_installment)} THB / month, total interest {_money(plan.total_interest)} THB"
+        ), ln=1)
+        _table(pdf, ["Month", "Installment", "Principal", "Interest", "Principal left", "Total left"], (
+            [row.month, _money(row.installment), _money(row.principal), _money(row.interest),
+             _money(row.principal_balance), _money(row.remaining_balance)]
+            for row in plan_schedule(q, plan)
+        ))
+    return pdf.output(dest="S").encode("latin-1")
+
+
+def _table(pdf, header, rows):
+    width = (pdf.w - pdf.l_margin - pdf.r_margin) / len(header)
+    pdf.set_font("Arial", "B", 9)
+    for title in header:
+        pdf.cell(width, 6, title, border=1, align="C")
+    pdf.ln()
+    pdf.set_font("Arial", "", 9)
+    for row in rows:
+        for value in row:
+            pdf.cell(width, 5, _ascii(value), border=1, align="R")
+        pdf.ln()
+
+
+def catalog_quotes(price, rate_index, snapshot_version=None):
+    # Quotes for every tier x term of one car. Above the 30% tier the plan options do not
+    # depend on the requested term, so those tiers are quoted once instead of per term.
+    tiers = [float(t) for t in rate_index.tiers]
+    if not tiers:
+        return []
+    prices = [price] * (len(tiers) * len(RATE_PERIODS))
+    percents = [t for t in tiers for _ in RATE_PERIODS]
+    periods = [p for _ in tiers for p in RATE_PERIODS]
+    down_payments = [down_payment_for(price, t) for t in percents]
+    quotes = []
+    for q in quote_batch(prices, down_payments, percents, periods, rate_index, snapshot_version):
+        if q.status == QUOTE_THIRTY_PLAN and q.period != RATE_PERIODS[0]:
+            continue
+        quotes.append(q)
+    return quotes
+
+
+def _export_part(cars, path, schedules, snapshot_version):
+    # Process pool task: writes the rows of some cars as one gzip member; returns the row count
+    count = 0
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        for model, submodel, price, tiers, rates in cars:
+            rate_index = RateIndex.from_arrays(tiers, rates)
+            for q in catalog_quotes(price, rate_index, snapshot_version):
+                for row in quote_rows(q, (model, submodel), schedules):
+                    writer.writerow(row)
+                    count += 1
+    return count
+
+
+def export_pool(max_workers=None):
+    # Spawned workers: forking a process that runs server / Streamlit threads is not safe
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class CatalogExport:
+    # Whole-catalog CSV (gzip) export running on a process pool. Submitting returns at once;
+    # done() / progress() can be polled from a UI, result() finishes the file and cancel()
+    # drops an export that is no longer wanted. A temporary export's file is removed
+    # together with the export object, e.g. when the session that started it ends.
+    def __init__(self, snapshot, path, executor, schedules=True, temporary=False):
+        self.path = path
+        self.schedules = schedules
+        self.snapshot_version = snapshot.data_version
+        self._parts_dir = tempfile.mkdtemp(prefix="byd-export-")
+        # Also removes the parts of an export dropped unfinished
+        self._remove_parts = weakref.finalize(self, shutil.rmtree, self._parts_dir, True)
+        self._remove_output = weakref.finalize(self, _remove_file, path)
+        if not temporary:
+            self._remove_output.detach()
+        self._futures = []
+        self._finished = False
+        for i, car in enumerate(snapshot.catalog.cars()):
+            rate_index, _ = snapshot.rate_index_for(car.model, car.submodel)
+            # Plain arrays: the index may be backed by memory maps (byd_calc.persist)
+            job = [(car.model, car.submodel, car.price, np.array(rate_index.tiers), np.array(rate_index.rates))]
+            part = os.path.join(self._parts_dir, f"{i:05d}.csv.gz")
+            self._futures.append((part, executor.submit(_export_part, job, part, schedules, snapshot.data_version)))
+
+    def progress(self):
+        # (finished cars, total cars)
+        return sum(f.done() for _, f in self._futures), len(self._futures)
+
+    def done(self):
+        return all(f.done() for _, f in self._futures)
+
+    def result(self):
+        # Waits for every part, then writes the header and the parts into self.path.
+        # Concatenated gzip members are one valid gzip file, so parts are copied as-is.
+        # Returns the number of data rows.
+        rows = sum(f.result() for _, f in self._futures)
+        if not self._finished:
+            columns = QUOTE_COLUMNS + (SCHEDULE_COLUMNS if self.schedules else [])
+            # A temporary name of its own, so exports to the same path never write one file
+            tmp_path = f"{self.path}.{os.getpid()}-{id(self)}.tmp"
+            with open(tmp_path, "wb") as out:
+                out.write(gzip.compress("".join(csv_lines((), columns)).encode("utf-8")))
+                for part, _ in self._futures:
+                    with open(part, "rb") as f:
+                        shutil.copyfileobj(f, out)
+            os.replace(tmp_path, self.path)
+            self._remove_parts()
+            self._finished = True
+        return rows
+
+    def cancel(self):
+        # Cancels the parts not started yet and removes the parts and the output file.
+        # Parts already running finish in the background; their output is discarded.
+        for _, future in self._futures:
+            future.cancel()
+        self._remove_parts()
+        _remove_file(self.path)
+        self._remove_output.detach()
+
+
+def main(argv=None):
+    import argparse
+
+    from .data import SnapshotStore
+    from .persist import SNAPSHOT_DIR
+    from .sheets import SheetCache
+
+    parser = argparse.ArgumentParser(description="Export every car x tier x term as CSV (gzip)")
+    parser.add_argument("--output", default="catalog.csv.gz")
+    parser.add_argument("--summary", action="store_true", help="one row per plan instead of one per month")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    snapshot = SnapshotStore(SheetCache(), snapshot_dir=SNAPSHOT_DIR).snapshot().require_cars()
+    with export_pool(args.workers) as pool:
+        rows = CatalogExport(snapshot, args.output, pool, schedules=not args.summary).result()
+    print(f"Wrote {rows:,} rows to {args.output} (rate data version {snapshot.data_version})")
+
+
+if __name__ == "__main__":
+    main()
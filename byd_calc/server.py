@@ -0,0 +1,385 @@
+"""Local JSON quoting API for dealer integrations (CRM, showroom kiosks).
+
+    python -m byd_calc.server --host 127.0.0.1 --port 8600
+
+    POST /quote          {"model": ..., "submodel": ...} or {"price": ...},
+                         plus "down_percent" or "down_payment", and "period"
+    POST /quotes:batch   {"quotes": [<quote request>, ...]}
+    GET  /healthz
+    GET  /metrics        Prometheus text format, see byd_calc.metrics
+    GET  /image?src=<direct Drive URL or bundled file>&variant=desktop|mobile[&format=webp|jpeg]
+                         resized car photo from byd_calc.images, cacheable for a day
+                         and revalidated by its content ETag after that
+
+Requests that arrive together are merged by QuoteBatcher and computed with
+quote_batch(), so numbers match the calculator page exactly while thousands
+of quotes per second cost one vectorized call per event-loop tick. Point
+BYD_SHEETS_BASE_URL at scripts/fake_sheets.py to run against local fixtures.
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+import traceback
+from collections import namedtuple
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from .data import DataUnavailableError, SnapshotStore
+from .images import IMAGE_FORMATS, IMAGE_WIDTHS, ImageUnavailableError
+from .metrics import render_prometheus, span
+from .quotes import MIN_DOWN_PERCENT, down_payment_for, quote_batch
+from .rates import RATE_PERIODS
+
+MAX_BODY_BYTES = 4 * 1024 * 1024
+MAX_BATCH_QUOTES = 10000  # Per /quotes:batch request
+DATA_REFRESH_SECONDS = 10  # How often to check the SnapshotStore for changed sheets
+IMAGE_CACHE_CONTROL = "public, max-age=86400"  # A photo replaced under the same URL shows up within a day
+
+# A non-JSON response body
+RawResponse = namedtuple("RawResponse", ["content", "content_type", "headers"])
+
+
+class QuoteRequestError(ValueError):
+    # Invalid quote input; args are (http status, message)
+    pass
+
+
+def parse_quote_request(payload, snapshot):
+    # Validates one quote request the way the calculator page validates its inputs.
+    # Returns (rate_index, campaign, price, down_payment, down_percent, period, car);
+    # campaign is the promotion the rates come from, or None for standard rates.
+    if not isinstance(payload, dict):
+        raise QuoteRequestError(HTTPStatus.BAD_REQUEST, "quote request must be a JSON object")
+    model, submodel = payload.get("model"), payload.get("submodel")
+    if model is not None or submodel is not None:
+        if not isinstance(model, str) or not isinstance(submodel, str):
+            raise QuoteRequestError(HTTPStatus.BAD_REQUEST, "model and submodel must both be strings")
+        record = snapshot.catalog.get(model, submodel)
+        if record is None:
+            raise QuoteRequestError(HTTPStatus.NOT_FOUND, f"unknown car: {model!r} / {submodel!r}")
+        price = record.price
+        rate_index, campaign = snapshot.rate_index_for(model, submodel)
+    else:
+        price = payload.get("price")
+        rate_index, campaign = snapshot.standard_rates, None
+    try:
+        price = float(price)
+        raw_period = payload["period"]
+        period = int(raw_period)
+        if "down_percent" in payload:
+            down_percent = float(payload["down_percent"])
+            down_payment = down_payment_for(price, down_percent)
+        else:
+            down_payment = float(payload["down_payment"])
+            down_percent = (down_payment / price) * 100
+    except KeyError as e:
+        raise QuoteRequestError(HTTPStatus.BAD_REQUEST, f"missing field: {e.args[0]}")
+    except (TypeError, ValueError, OverflowError, ZeroDivisionError) as e:
+        raise QuoteRequestError(HTTPStatus.BAD_REQUEST, f"invalid input: {e}")
+    if any(isinstance(payload.get(name), bool) for name in ("price", "down_percent", "down_payment")):
+        raise QuoteRequestError(HTTPStatus.BAD_REQUEST, "price and down payment must be numbers")
+    if not all(math.isfinite(value) for value in (price, down_payment, down_percent)):
+        raise QuoteRequestError(HTTPStatus.BAD_REQUEST, "price and down payment must be finite numbers")
+    if isinstance(raw_period, bool) or (isinstance(raw_period, float) and raw_period != period):
+        raise QuoteRequestError(HTTPStatus.BAD_REQUEST, "period must be a whole number of months")
+    if not price > 0:
+        raise QuoteRequestError(HTTPStatus.BAD_REQUEST, "price must be greater than 0")
+    if period not in RATE_PERIODS:
+        raise QuoteRequestError(HTTPStatus.BAD_REQUEST, f"period must be one of {list(RATE_PERIODS)}")
+    if not MIN_DOWN_PERCENT <= down_percent <= 100:
+        raise QuoteRequestError(
+            HTTPStatus.UNPROCESSABLE_ENTITY, f"down payment must be between {MIN_DOWN_PERCENT}% and 100% of the price"
+        )
+    if rate_index.empty:
+        raise QuoteRequestError(HTTPStatus.SERVICE_UNAVAILABLE, "the selected rate data table is missing or invalid")
+    car = {"model": model, "submodel": submodel} if model is not None else {}
+    return rate_index, campaign, price, down_payment, down_percent, period, car
+
+
+def _number(value):
+    return None if value is None or (isinstance(value, float) and math.isnan(value)) else value
+
+
+def quote_to_json(q, campaign=None, car=None):
+    monthly = _number(q.monthly_installment)
+    return {
+        **(car or {}),
+        "status": q.status,
+        "price": q.price,
+        "down_payment": q.down_payment,
+        "down_percent": q.down_percent,
+        "period": q.period,
+        "loan_amount": q.loan_amount,
+        "matched_tier": _number(q.matched_tier),
+        "interest_rate": _number(q.interest_rate),
+        "total_interest": _number(q.total_interest),
+        "monthly_installment": monthly,
+        # What the page shows: installments are rounded up to the next baht
+        "monthly_installment_rounded": math.ceil(monthly) if monthly is not None else None,
+        "special_rate": campaign is not None,
+        "promotion": campaign.name if campaign is not None else None,
+        "snapshot_version": q.snapshot_version,
+        "thirty_plan_options": [
+            {
+                "period": o.period,
+                "interest_rate": o.interest_rate,
+                "total_interest": o.total_interest,
+                "monthly_installment": o.monthly_installment,
+            }
+            for o in q.thirty_plan_options
+        ],
+    }
+
+
+class QuoteBatcher:
+    # Collects quotes submitted during one event-loop tick (or up to max_delay seconds)
+    # and computes them with one quote_batch() call per rate table and snapshot version.
+    def __init__(self, max_batch=4096, max_delay=0.0):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = []  # (rate_index, snapshot_version, (price, down_payment, down_percent, period), future)
+        self._flush_handle = None
+        self.batches = 0
+        self.quotes = 0
+
+    def submit(self, rate_index, args, snapshot_version=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((rate_index, snapshot_version, args, future))
+        if len(self._pending) >= self.max_batch:
+            self.flush()
+        elif self._flush_handle is None:
+            if self.max_delay > 0:
+                self._flush_handle = loop.call_later(self.max_delay, self.flush)
+            else:
+                self._flush_handle = loop.call_soon(self.flush)
+        return future
+
+    def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        groups = {}
+        for item in pending:
+            groups.setdefault((id(item[0]), item[1]), []).append(item)
+        for items in groups.values():
+            rate_index, snapshot_version = items[0][0], items[0][1]
+            try:
+                with span("rate_lookup"):
+                    results = quote_batch(*zip(*(args for _, _, args, _ in items)), rate_index, snapshot_version)
+            except Exception as e:
+                for _, _, _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, _, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+        self.batches += len(groups)
+        self.quotes += len(pending)
+
+
+class QuoteService:
+    # Answers quote requests from the SnapshotStore's current snapshot. Each request
+    # reads self.snapshot once, so a refresh landing mid-request cannot mix rate tables.
+    def __init__(self, store, refresh_seconds=DATA_REFRESH_SECONDS, batcher=None, image_cache=None):
+        self.store = store
+        self.image_cache = image_cache
+        self.refresh_seconds = refresh_seconds
+        self.batcher = batcher or QuoteBatcher()
+        self.snapshot = None
+        self.loaded_at = None
+
+    async def load(self):
+        loop = asyncio.get_running_loop()
+        snapshot = await loop.run_in_executor(None, self.store.snapshot)
+        self.snapshot = snapshot.require_cars()
+        self.loaded_at = time.time()
+
+    async def refresh_forever(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.load()
+            except DataUnavailableError:
+                pass  # Keep quoting from the last good data
+
+    async def quote(self, payload):
+        snapshot = self.snapshot
+        rate_index, campaign, price, down_payment, down_percent, period, car = parse_quote_request(payload, snapshot)
+        result = await self.batcher.submit(rate_index, (price, down_payment, down_percent, period), snapshot.data_version)
+        return quote_to_json(result, campaign, car)
+
+    async def quote_many(self, payloads):
+        snapshot = self.snapshot
+        parsed, futures = [], []
+        for payload in payloads:
+            try:
+                parsed.append(parse_quote_request(payload, snapshot))
+            except QuoteRequestError as e:
+                parsed.append(e)
+        for item in parsed:
+            if not isinstance(item, QuoteRequestError):
+                rate_index, _, price, down_payment, down_percent, period, _ = item
+                futures.append(self.batcher.submit(rate_index, (price, down_payment, down_percent, period), snapshot.data_version))
+        results = iter(await asyncio.gather(*futures))
+        out = []
+        for item in parsed:
+            if isinstance(item, QuoteRequestError):
+                out.append({"status": "error", "error": item.args[1]})
+            else:
+                out.append(quote_to_json(next(results), item[1], item[6]))
+        return out
+
+    async def image(self, query, request_headers):
+        if self.image_cache is None:
+            return HTTPStatus.NOT_FOUND, {"error": "image cache is not enabled"}
+        params = {k: v[0] for k, v in parse_qs(query).items()}
+        variant = params.get("variant", "desktop")
+        fmt = params.get("format") or ("webp" if "image/webp" in request_headers.get("accept", "") else "jpeg")
+        if variant not in IMAGE_WIDTHS or fmt not in IMAGE_FORMATS:
+            return HTTPStatus.BAD_REQUEST, {"error": f"variant must be one of {list(IMAGE_WIDTHS)}, format one of {list(IMAGE_FORMATS)}"}
+        loop = asyncio.get_running_loop()
+        try:
+            image = await loop.run_in_executor(None, self.image_cache.get, params.get("src"), variant, fmt)
+        except ImageUnavailableError as e:
+            return HTTPStatus.NOT_FOUND, {"error": str(e)}
+        headers = {"Cache-Control": IMAGE_CACHE_CONTROL, "ETag": image.etag, "Vary": "Accept"}
+        if request_headers.get("if-none-match") == image.etag:
+            return HTTPStatus.NOT_MODIFIED, RawResponse(b"", image.content_type, headers)
+        return HTTPStatus.OK, RawResponse(image.content, image.content_type, headers)
+
+    async def dispatch(self, method, target, body, request_headers=None):
+        # (http status, JSON-serializable payload or RawResponse) for one request
+        url = urlsplit(target)
+        path = url.path
+        if path == "/healthz" and method == "GET":
+            return HTTPStatus.OK, {
+                "ok": self.snapshot is not None,
+                "loaded_at": self.loaded_at,
+                "snapshot_version": self.snapshot.data_version if self.snapshot is not None else None,
+                "promotions_error": str(self.snapshot.promotions_error)
+                if self.snapshot is not None and self.snapshot.promotions_error is not None else None,
+                "batches": self.batcher.batches,
+                "quotes": self.batcher.quotes,
+            }
+        if path == "/metrics" and method == "GET":
+            return HTTPStatus.OK, RawResponse(render_prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8", {})
+        if path == "/image" and method == "GET":
+            return await self.image(url.query, request_headers or {})
+        if path not in ("/quote", "/quotes:batch"):
+            return HTTPStatus.NOT_FOUND, {"error": "not found"}
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "use POST"}
+        if self.snapshot is None:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "rate data is not loaded yet"}
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, {"error": "body must be JSON"}
+        try:
+            if path == "/quote":
+                return HTTPStatus.OK, await self.quote(payload)
+            quotes = payload.get("quotes") if isinstance(payload, dict) else None
+            if not isinstance(quotes, list):
+                return HTTPStatus.BAD_REQUEST, {"error": "body must be {\"quotes\": [...]}"}
+            if len(quotes) > MAX_BATCH_QUOTES:
+                return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": f"at most {MAX_BATCH_QUOTES} quotes per batch"}
+            return HTTPStatus.OK, {"results": await self.quote_many(quotes)}
+        except QuoteRequestError as e:
+            return e.args[0], {"error": e.args[1]}
+
+    async def handle_connection(self, reader, writer):
+        # Minimal HTTP/1.1 with keep-alive; enough for local integrations and load tests
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                try:
+                    with span("request"):
+                        status, payload = await self.dispatch(method, target, body, headers)
+                except Exception:
+                    # Last resort: a bug must cost one request a 500, not the client its connection
+                    traceback.print_exc()
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "internal server error"}
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        if not isinstance(payload, RawResponse):
+            try:
+                content = json.dumps(payload, ensure_ascii=False, allow_nan=False)
+            except ValueError:
+                # NaN or Infinity would make the body invalid JSON
+                traceback.print_exc()
+                status, content = HTTPStatus.INTERNAL_SERVER_ERROR, json.dumps({"error": "internal server error"})
+            payload = RawResponse(content.encode("utf-8"), "application/json; charset=utf-8", {})
+        body = payload.content
+        extra_headers = "".join(f"{name}: {value}\r\n" for name, value in payload.headers.items())
+        status = HTTPStatus(status)
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {payload.content_type}\r\n"
+            f"{extra_headers}"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(host="127.0.0.1", port=8600, sheet_cache=None, refresh_seconds=DATA_REFRESH_SECONDS):
+    from .images import IMAGE_FOLLOW, ImageCache
+    from .persist import SNAPSHOT_DIR, SNAPSHOT_FOLLOW, SnapshotFollower
+    from .sheets import SheetCache
+
+    if SNAPSHOT_FOLLOW:
+        store = SnapshotFollower(SNAPSHOT_DIR)  # Next to a byd_calc.cluster loader
+    else:
+        store = SnapshotStore(sheet_cache or SheetCache(), snapshot_dir=SNAPSHOT_DIR)
+    # Like the page: next to a cluster loader, only serve the images it fetched
+    service = QuoteService(store, refresh_seconds, image_cache=ImageCache(fetch=not IMAGE_FOLLOW))
+    await service.load()
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    refresher = asyncio.create_task(service.refresh_forever())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        refresher.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local BYD quoting API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--refresh-seconds", type=float, default=DATA_REFRESH_SECONDS)
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.host, args.port, refresh_seconds=args.refresh_seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""Process-wide, concurrently refreshed cache of the raw Google Sheet exports."""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import cache_event, span
+
+SHEET_TTL_SECONDS = 300  # Sheets are served from memory for 5 minutes before being revalidated
+SHEET_TIMEOUT = (3.05, 10)  # (connect, read) seconds per request
+SHEET_RETRIES = 3  # Extra attempts on connection errors and 429/5xx, with exponential backoff
+SHEET_CACHE_DIR = os.environ.get("BYD_SHEET_CACHE_DIR", ".sheet_cache")  # Last known good copies
+
+
+def content_digest(csv_content):
+    # Content hash used to tell whether a sheet really changed between downloads
+    return hashlib.sha256(csv_content.encode("utf-8")).hexdigest()
+
+
+def make_sheet_session(pool_size=8, retries=SHEET_RETRIES):
+    # Keep-alive session shared by all sheet fetches, with bounded retry and backoff
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class SheetCache:
+    # Process-wide cache of Google Sheet exports, shared by every session and rerun.
+    # Fresh entries are served straight from memory. Stale entries are still served
+    # while a background thread revalidates them with a conditional request
+    # (ETag / Last-Modified), so only the very first load of a sheet waits on the network.
+    # Missing sheets are downloaded concurrently over one pooled session. Downloads its owner
+    # found usable (see save_last_good) are written to disk, so a cold start can fall back
+    # to them if Google is unreachable.
+    # A sheet that failed to load and has no disk copy is not retried for another TTL.
+    def __init__(self, ttl=SHEET_TTL_SECONDS, cache_dir=SHEET_CACHE_DIR, max_workers=8):
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self._entries = {}  # url -> {"content", "digest", "etag", "last_modified", "fetched_at"}
+        self._refreshing = set()
+        self._failed = {}  # url -> (monotonic time, exception) of a sheet that never loaded
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._session = make_sheet_session(max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sheet-fetch")
+
+    def get(self, url):
+        result = self.get_many([url])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def get_many(self, urls, block=True):
+        # Returns one {"content": CSV text, "digest": sha256 of it} per url,
+        # or the exception that prevented loading it. With block=False, sheets that
+        # were never loaded come back as None and are fetched in the background instead.
+        with self._lock:
+            entries = {url: self._entries.get(url) for url in urls}
+        missing = [url for url, entry in entries.items() if entry is None]
+        for entry in entries.values():
+            cache_event("sheet", hit=entry is not None)
+        if missing and block:
+            entries.update(self._load(missing))
+        results = []
+        now = time.monotonic()
+        for url in urls:
+            entry = entries[url]
+            if entry is None:
+                error = self._recent_failure(url, now)
+                if error is None:
+                    self._refresh_in_background(url)
+                results.append(error)
+                continue
+            if isinstance(entry, Exception):
+                results.append(entry)
+                continue
+            if now - entry["fetched_at"] > self.ttl:
+                self._refresh_in_background(url)
+            results.append({"content": entry["content"], "digest": entry["digest"]})
+        return results
+
+    def save_last_good(self, url, digest):
+        # Keeps the download of url with this digest as the disk copy a cold start falls back to.
+        # Called once the content has been parsed and validated, so a sign-in page or a broken
+        # sheet answered with 200 never replaces a good copy.
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is not None and entry["digest"] == digest:
+            self._write_last_good(url, entry)
+
+    def invalidate(self, url=None):
+        # Marks one sheet (or all of them) as stale and forgets failed loads;
+        # the next read revalidates in the background
+        with self._lock:
+            for key, entry in self._entries.items():
+                if url is None or key == url:
+                    entry["fetched_at"] = float("-inf")
+            for key in list(self._failed):
+                if url is None or key == url:
+                    del self._failed[key]
+
+    def _recent_failure(self, url, now):
+        # The error of a load that failed less than a TTL ago, else None
+        with self._lock:
+            failed = self._failed.get(url)
+        if failed is not None and now - failed[0] < self.ttl:
+            return failed[1]
+        return None
+
+    def _load(self, urls):
+        # Blocking first load of several sheets at once, so the wait is set by the slowest one.
+        # Concurrent sessions queue on the same load instead of repeating it.
+        loaded = {}
+        with self._load_lock:
+            with self._lock:
+                for url in urls:
+                    if url in self._entries:
+                        loaded[url] = self._entries[url]
+            now = time.monotonic()
+            for url in urls:
+                error = self._recent_failure(url, now) if url not in loaded else None
+                if error is not None:
+                    loaded[url] = error
+            pending = [url for url in urls if url not in loaded]
+            futures = {url: self._pool.submit(self._fetch, url, None) for url in pending}
+            for url, future in futures.items():
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    entry = self._read_last_good(url)
+                    if entry is None:
+                        with self._lock:
+                            self._failed[url] = (time.monotonic(), e)
+                        loaded[url] = e
+                        continue
+                with self._lock:
+                    self._entries[url] = entry
+                    self._failed.pop(url, None)
+                loaded[url] = entry
+        return loaded
+
+    def _refresh_in_background(self, url):
+        with self._lock:
+            if url in self._refreshing:
+                return
+            self._refreshing.add(url)
+        self._pool.submit(self._refresh, url)
+
+    def _refresh(self, url):
+        with self._lock:
+            previous = self._entries.get(url)
+        try:
+            entry = self._fetch(url, previous)
+            with self._lock:
+                self._entries[url] = entry
+                self._failed.pop(url, None)
+        except Exception as e:
+            # Keep serving the last good copy (from memory, else from disk) and try again
+            # once the TTL runs out
+            now = time.monotonic()
+            entry = self._read_last_good(url) if previous is None else None
+            with self._lock:
+                if url in self._entries:
+                    self._entries[url]["fetched_at"] = now
+                elif entry is not None:
+                    self._entries[url] = dict(entry, fetched_at=now)
+                else:
+                    self._failed[url] = (now, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(url)
+
+    def _fetch(self, url, previous):
+        headers = {}
+        if previous is not None:
+            if previous["etag"]:
+                headers["If-None-Match"] = previous["etag"]
+            if previous["last_modified"]:
+                headers["If-Modified-Since"] = previous["last_modified"]
+        with span("fetch.network"):
+            response = self._session.get(url, headers=headers, timeout=SHEET_TIMEOUT)
+        if response.status_code == 304 and previous is not None:
+            return dict(previous, fetched_at=time.monotonic())
+        response.raise_for_status()  # Raise an exception for bad status codes
+        csv_content = response.content.decode('utf-8')
+        entry = {
+            "content": csv_content,
+            "digest": content_digest(csv_content),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.monotonic(),
+        }
+        return entry
+
+    def _last_good_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+    def _write_last_good(self, url, entry):
+        # Best effort: a read-only filesystem must never break a successful fetch.
+        # Temp names are unique because the page and the API may write the same sheet at once.
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._last_good_path(url)
+            meta = {
+                "url": url, "digest": entry["digest"], "etag": entry["etag"], "last_modified": entry["last_modified"],
+            }
+            for suffix, content in ((".csv", entry["content"]), (".json", json.dumps(meta))):
+                tmp_path = f"{path}{suffix}.{uuid.uuid4().hex[:8]}.tmp"
+                try:
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        f.write(content)
+                    os.replace(tmp_path, path + suffix)
+                except OSError:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+        except OSError:
+            pass
+
+    def _read_last_good(self, url):
+        path = self._last_good_path(url)
+        try:
+            with open(path + ".json", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(path + ".csv", encoding="utf-8") as f:
+                csv_content = f.read()
+        except (OSError, ValueError):
+            return None
+        # Serve the disk copy now but revalidate it on the very next read. If two writers
+        # interleaved, the validators may belong to other content: then fetch it unconditionally.
+        digest = content_digest(csv_content)
+        matches = meta.get("digest") == digest
+        return {
+            "content": csv_content,
+            "digest": digest,
+            "etag": meta.get("etag") if matches else None,
+            "last_modified": meta.get("last_modified") if matches else None,
+            "fetched_at": float("-inf"),
+        }
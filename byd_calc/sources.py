@@ -0,0 +1,7 @@
+"""Share links of the Google Sheets the calculator reads."""
+
+# Car models, submodels, prices and images
+CAR_SHEET_LINK = "https://docs.google.com/spreadsheets/d/1rypFrBiLNemhOy3Gn5_0UiC7o4zP9wDrVXafvd7TxNc/edit?gid=442434100"
+# Standard down payment rates
+STANDARD_RATE_SHEET_LINK = "https://docs.google.com/spreadsheets/d/13bc_Vk1G-CDZVkCswlwYakQM-HuQMXi_K0HLG6tdVEY/edit?gid=569887943"
+
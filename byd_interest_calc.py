@@ -1,10 +1,43 @@
 import streamlit as st
 import pandas as pd
-import io
-import re
+import hmac
 import math
-from io import StringIO
+import os
+import re
 import requests
+import tempfile
+from urllib.parse import quote as url_quote
+from byd_calc import RATE_PERIODS, quote
+from byd_calc.affordability import AffordabilityGrid
+from byd_calc.cleaning import CAR_COLUMNS, STANDARD_RATE_COLUMNS
+from byd_calc.data import (
+    CAR_TABLE,
+    PROBLEM_EMPTY,
+    PROBLEM_LOAD_FAILED,
+    PROBLEM_MISSING_COLUMNS,
+    STANDARD_RATES_TABLE,
+    SnapshotStore,
+    table_sources,
+)
+from byd_calc.images import IMAGE_FOLLOW, ImageCache, ImageUnavailableError, is_image_source
+from byd_calc.links import is_google_sheet_link
+from byd_calc.matrix import comparison_matrix
+from byd_calc.metrics import REGISTRY, own_trace, span, start_metrics_server, start_trace
+from byd_calc.quotes import (
+    MIN_DOWN_PERCENT,
+    QUOTE_MISSING_RATE,
+    QUOTE_NO_FINANCING,
+    QUOTE_NO_THIRTY_PLAN,
+    QUOTE_NO_TIER,
+    QUOTE_THIRTY_PLAN,
+    down_payment_for,
+    quote_batch,
+)
+from byd_calc.persist import SNAPSHOT_DIR, SNAPSHOT_FOLLOW, SnapshotFollower
+from byd_calc.reports import CatalogExport, export_pool, financed_plans, plan_schedule, quote_csv, quote_pdf
+from byd_calc.sheets import SheetCache
+
+rerun_spans = start_trace()  # Every span below also lands here, for the admin timing panel
 
 st.set_page_config(page_title="คำนวณค่างวดรถ BYD | BYD ชลบุรี ออโตโมทีฟ", page_icon="🚗", layout="wide")
 
@@ -55,116 +88,307 @@ st.markdown("""
 
 
 # --------- Functions ---------
-def convert_google_sheet_link_to_csv(shared_link: str) -> str:
-    # Converts a Google Sheet share link to a direct CSV export link
-    sheet_id_match = re.search(r"/d/([a-zA-Z0-9-_]+)", shared_link)
-    gid_match = re.search(r"gid=([0-9]+)", shared_link)
-    if sheet_id_match:
-        sheet_id = sheet_id_match.group(1)
-        gid = gid_match.group(1) if gid_match else "0"  # Default to first sheet if gid not specified
-        return f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
-    st.warning("⚠️ Could not parse Google Sheet ID from link. Using original link.")
-    return shared_link
-
-def convert_drive_link_to_direct_image_url(shared_link: str) -> str:
-    # Converts a Google Drive file share link to a direct view link
-    match = re.search(r"/d/([a-zA-Z0-9_-]+)", shared_link)
-    if match:
-        file_id = match.group(1)
-        return f"https://drive.google.com/uc?export=view&id={file_id}"
-    return shared_link
-
-def read_google_sheet_csv(csv_url):
-    # Reads a CSV from a URL (designed for Google Sheet export links)
+@st.cache_resource
+def get_snapshot_store():
+    # One SheetCache + SnapshotStore per server process, reused across reruns and sessions.
+    # It starts from the snapshot saved on disk, so a new process renders without any fetch.
+    # Cluster workers (see byd_calc.cluster) only follow the snapshots the loader publishes.
+    if SNAPSHOT_FOLLOW:
+        return SnapshotFollower(SNAPSHOT_DIR)
+    return SnapshotStore(SheetCache(), snapshot_dir=SNAPSHOT_DIR)
+
+@st.cache_resource
+def get_image_cache():
+    # Resized car photos, shared by every session (see byd_calc.images). Cluster workers
+    # only read the photos the loader fetches.
+    return ImageCache(fetch=not IMAGE_FOLLOW)
+
+IMAGE_BASE_URL = os.environ.get("BYD_IMAGE_BASE_URL", "").rstrip("/")  # e.g. the quoting API's /image endpoint
+MOBILE_USER_AGENT_RE = re.compile(r"Mobi|Android|iPad|iPhone|Tablet", re.IGNORECASE)
+
+def image_variant():
+    # Phones and showroom tablets get the narrower variant
+    user_agent = st.context.headers.get("User-Agent") or ""
+    return "mobile" if MOBILE_USER_AGENT_RE.search(user_agent) else "desktop"
+
+def car_image(url):
+    # What to hand st.image for a car photo: a browser-cached /image URL when BYD_IMAGE_BASE_URL
+    # is set, otherwise the resized bytes. The page never waits for a download: until the
+    # background fetch has cached the image (or if it cannot be processed) the original URL is used.
+    if not is_image_source(url):
+        return url
+    if IMAGE_BASE_URL:
+        return f"{IMAGE_BASE_URL}/image?src={url_quote(url, safe='')}&variant={image_variant()}"
+    try:
+        # JPEG, because st.image re-encodes anything but JPEG bytes to PNG
+        image = get_image_cache().get(url, image_variant(), "jpeg", block=False)
+    except ImageUnavailableError:
+        return url
+    return image.content if image is not None else url
+
+@st.cache_resource
+def start_metrics_endpoint():
+    # Prometheus scrape endpoint for this server process, only when BYD_METRICS_PORT is set
+    port = os.environ.get("BYD_METRICS_PORT")
+    return start_metrics_server(int(port)) if port else None
+
+def is_admin():
+    # The timing panel is shown only with ?admin=<BYD_ADMIN_TOKEN> in the URL
+    token = os.environ.get("BYD_ADMIN_TOKEN")
+    given = st.query_params.get("admin", "")
+    return bool(token) and hmac.compare_digest(given.encode("utf-8"), token.encode("utf-8"))
+
+def render_admin_panel(previous_rerun_spans):
+    with st.sidebar:
+        st.markdown("#### ⏱️ Timing (admin)")
+        st.caption(f"Rate data version {snapshot.data_version} (build {snapshot.version} of this process)")
+        if previous_rerun_spans:
+            totals = {}
+            for name, seconds in previous_rerun_spans:
+                totals[name] = totals.get(name, 0.0) + seconds * 1000
+            st.markdown("**Previous rerun**")
+            st.dataframe(pd.DataFrame({"span": list(totals), "ms": list(totals.values())}).round(3), hide_index=True)
+        span_stats = REGISTRY.span_stats()
+        if span_stats:
+            st.markdown("**This process**")
+            st.dataframe(pd.DataFrame([
+                {"span": name, "count": s["count"], "p50 ms": s["p50"] * 1000, "p95 ms": s["p95"] * 1000, "p99 ms": s["p99"] * 1000}
+                for name, s in sorted(span_stats.items())
+            ]).round(3), hide_index=True)
+        cache_stats = REGISTRY.cache_stats()
+        if cache_stats:
+            st.dataframe(pd.DataFrame([
+                {"cache": name, "hits": c["hits"], "misses": c["misses"], "hit rate": c["hit_rate"]}
+                for name, c in sorted(cache_stats.items())
+            ]).round(3), hide_index=True)
+        if st.button("Reset timings", key="admin_reset_metrics"):
+            REGISTRY.reset()
+        store = get_snapshot_store()
+        if isinstance(store, SnapshotStore):  # Cluster workers only follow the loader's snapshots
+            st.markdown("#### 🔄 Sheets (admin)")
+            if st.button("Re-fetch sheets now", key="admin_refresh_sheets"):
+                store.sheet_cache.invalidate()
+                st.caption("Sheets are re-fetched in the background; changes show up on a later rerun.")
+        st.markdown("#### 📦 Catalog export (admin)")
+        schedules = st.checkbox("Month-by-month schedules", value=True, key="admin_export_schedules")
+        if st.button("Export every car x tier x term", key="admin_export_catalog"):
+            previous = st.session_state.get("catalog_export")
+            if previous is not None and not previous.done():
+                st.warning("⚠️ An export is already running; wait for it to finish.")
+            else:
+                if previous is not None:
+                    previous.cancel()  # Its file was offered already; keep one export per session on disk
+                # A file of its own: other sessions may export the same version at the same time
+                fd, path = tempfile.mkstemp(prefix=f"byd-catalog-{snapshot.data_version}-", suffix=".csv.gz")
+                os.close(fd)
+                st.session_state.catalog_export = CatalogExport(
+                    snapshot, path, get_export_pool(), schedules=schedules, temporary=True
+                )
+        if "catalog_export" in st.session_state:
+            catalog_export_status()
+
+@st.cache_resource
+def get_export_pool():
+    # Worker processes for catalog exports, shared by every session; the page never waits on them
+    return export_pool(max_workers=max(1, (os.cpu_count() or 2) - 1))
+
+# Fragments trace into lists of their own: a fragment-only rerun must not add to the
+# previous full rerun's spans shown in the timing panel
+@st.fragment(run_every=2)
+@own_trace()
+def catalog_export_progress():
+    # Polls only while the export runs; once done, one full rerun shows the download instead
+    export = st.session_state.catalog_export
+    if export.done():
+        st.rerun()
+    finished, total = export.progress()
+    st.progress(finished / total if total else 1.0, text=f"Exporting… {finished}/{total} cars")
+
+def read_export(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def catalog_export_status():
+    export = st.session_state.catalog_export
+    if not export.done():
+        catalog_export_progress()
+        return
     try:
-        response = requests.get(csv_url)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        csv_content = response.content.decode('utf-8')
-        return pd.read_csv(StringIO(csv_content))
-    except requests.exceptions.RequestException as e:
-        st.error(f"❌ Network error fetching spreadsheet: {e}")
-        return pd.DataFrame()
+        rows = export.result()
     except Exception as e:
-        st.error(f"❌ Failed to read or parse spreadsheet: {e}")
-        return pd.DataFrame()
+        st.error(f"❌ Export failed: {e}")
+        return
+    st.caption(f"{rows:,} rows, rate data version {export.snapshot_version}")
+    st.download_button(
+        "Download catalog CSV (gzip)",
+        data=lambda: read_export(export.path),
+        file_name=f"byd-catalog-{export.snapshot_version}.csv.gz",
+        mime="application/gzip",
+        on_click="ignore",
+        key="admin_export_download",
+    )
 
+def render_downloads(result, model, submodel):
+    # PDF / CSV of this quote's month-by-month schedule; files are built only when clicked
+    car = (model, submodel)
 
-# --------- Load data ---------
-# Convert share links to direct CSV export links
-car_url = convert_google_sheet_link_to_csv("https://docs.google.com/spreadsheets/d/1rypFrBiLNemhOy3Gn5_0UiC7o4zP9wDrVXafvd7TxNc/edit?gid=442434100")
-car_df = read_google_sheet_csv(car_url)
+    def comparison():
+        # The same down payment over every term, for the PDF's comparison table
+        n = len(RATE_PERIODS)
+        rate_index, _ = snapshot.rate_index_for(model, submodel)
+        return quote_batch([result.price] * n, [result.down_payment] * n, [result.down_percent] * n, list(RATE_PERIODS), rate_index, result.snapshot_version)
 
-# URL for the standard down payment rates sheet
-down_payment_url = convert_google_sheet_link_to_csv("https://docs.google.com/spreadsheets/d/13bc_Vk1G-CDZVkCswlwYakQM-HuQMXi_K0HLG6tdVEY/edit?gid=569887943")
-down_payment_df = read_google_sheet_csv(down_payment_url)
+    file_stem = f"byd-quote-{model}-{submodel}-{int(result.down_percent)}pct".replace(" ", "_")
+    col_pdf, col_csv = st.columns(2)
+    col_pdf.download_button(
+        "📄 ดาวน์โหลด PDF (Download PDF)",
+        data=lambda: quote_pdf(result, car, comparison() if result.status != QUOTE_THIRTY_PLAN else ()),
+        file_name=f"{file_stem}.pdf",
+        mime="application/pdf",
+        on_click="ignore",
+        key="download_quote_pdf",
+    )
+    col_csv.download_button(
+        "📊 ดาวน์โหลดตารางผ่อน CSV (Download Schedule CSV)",
+        data=lambda: quote_csv(result, car),
+        file_name=f"{file_stem}.csv",
+        mime="text/csv",
+        on_click="ignore",
+        key="download_quote_csv",
+    )
 
-# URL for the new BYD SEAL Premium & Dynamic promo rates sheet
-seal_promo_url = convert_google_sheet_link_to_csv("https://docs.google.com/spreadsheets/d/13bc_Vk1G-CDZVkCswlwYakQM-HuQMXi_K0HLG6tdVEY/edit?gid=1853511418")
-seal_promo_df = read_google_sheet_csv(seal_promo_url)
+@st.cache_resource(max_entries=16)
+def get_comparison_matrix(_snapshot, data_version, promotions_day, model):
+    # Display frame of every tier x term for one model's cars (or all cars), per rate data version.
+    # Keyed on the content hash, so a rebuild of unchanged data keeps the cached frame.
+    matrix_df = comparison_matrix(_snapshot.catalog.cars(model), _snapshot.rate_index_for)
+    matrix_df["down_percent"] = [f"{int(t)}%" for t in matrix_df["down_percent"]]
+    for p in RATE_PERIODS:
+        matrix_df[p] = matrix_df[p].map(lambda v: f"฿{v:,.0f}" if pd.notna(v) else "—")
+    return matrix_df.rename(columns={
+        "model": "รุ่น (Model)", "submodel": "รุ่นย่อย (Submodel)", "down_percent": "ดาวน์ (Down %)",
+        **{p: f"{p} งวด" for p in RATE_PERIODS},
+    })
+
+@st.cache_resource(max_entries=2)
+def get_affordability_grid(_snapshot, data_version, promotions_day):
+    # Every car x whole down % x term, quoted once per rate data version and promotion day
+    return AffordabilityGrid.build(_snapshot.catalog.cars(), _snapshot.rate_index_for)
+
+@st.fragment
+@own_trace()
+def render_affordability_explorer(grid, model, submodel):
+    # A fragment: changing the budget redraws only this section, and answering it is a
+    # lookup in the precomputed grid, so nothing is fetched, cleaned or re-quoted
+    col_budget, col_down, col_scope = st.columns(3)
+    budget = col_budget.number_input("งบผ่อนต่อเดือน (Monthly Budget, THB)", min_value=0, value=15000, step=500, key="afford_budget")
+    max_down = col_down.number_input("เงินดาวน์สูงสุด (Max Down Payment, THB, 0 = no limit)", min_value=0, value=0, step=10000, key="afford_max_down")
+    all_models = col_scope.checkbox("แสดงทุกรุ่น (Show all models)", key="afford_all_models")
+    with span("affordability.solve"):
+        options = grid.solve(budget, None if all_models else model, max_down or None)
+    with span("render.affordability"):
+        position = grid.position(model, submodel)
+        if position is not None:
+            st.caption(f"ค่างวดของ {model} {submodel} ตามเงินดาวน์ (Installment by down payment)")
+            # A fixed Vega-Lite spec over a cached frame: st.line_chart rebuilds an Altair chart
+            # on every call, which alone cost ~100 ms per budget change
+            st.vega_lite_chart(grid.curve_frame(position), {
+                "layer": [
+                    {"mark": "line", "encoding": {
+                        "x": {"field": "down_percent", "type": "quantitative", "title": "ดาวน์ (Down %)"},
+                        "y": {"field": "monthly", "type": "quantitative", "title": "ค่างวด (THB / month)"},
+                        "color": {"field": "period", "type": "ordinal", "title": "งวด (Months)"},
+                    }},
+                    {"mark": {"type": "rule", "strokeDash": [6, 4]}, "encoding": {"y": {"datum": float(budget)}}},
+                ],
+            }, use_container_width=True)
+        if not options:
+            st.info("ℹ️ ไม่มีแผนที่อยู่ในงบนี้ (No combination fits this budget.)")
+            return
+        st.dataframe(pd.DataFrame({
+            "รุ่น (Model)": [o.model for o in options],
+            "รุ่นย่อย (Submodel)": [o.submodel for o in options],
+            "งวด (Months)": [o.period for o in options],
+            "ดาวน์ขั้นต่ำ (Min Down %)": [f"{o.down_percent:.0f}%" for o in options],
+            "เงินดาวน์ (Down Payment)": [f"฿{o.down_payment:,.0f}" for o in options],
+            "ค่างวด (Monthly)": [f"฿{o.monthly_installment:,.0f}" for o in options],
+            "ดอกเบี้ย (Rate)": [f"{o.interest_rate:.2f}%" + (" 🌟" if o.promotion else "") + (" (30%)" if o.thirty_plan else "") for o in options],
+        }), hide_index=True, use_container_width=True)
+
+def report_load_error(error):
+    # Explains why a sheet could not be downloaded or parsed
+    if isinstance(error, requests.exceptions.RequestException):
+        st.error(f"❌ Network error fetching spreadsheet: {error}")
+    elif error is not None:
+        st.error(f"❌ Failed to read or parse spreadsheet: {error}")
+
+
+# --------- Load data ---------
+# One immutable snapshot per rerun, so every table below comes from the same rate data version.
+# Sheets are fetched together and only tables whose content changed are re-cleaned and re-indexed.
+start_metrics_endpoint()
+snapshot = get_snapshot_store().snapshot()
+car_table = snapshot.tables[CAR_TABLE]
+standard_rates_table = snapshot.tables[STANDARD_RATES_TABLE]
+for table_name, (sheet_link, _) in table_sources(snapshot.campaigns).items():
+    if not is_google_sheet_link(sheet_link):
+        st.warning(f"⚠️ Could not parse Google Sheet ID from the {table_name} link. Using original link.")
 
 
 # --- Data Cleaning and Preparation ---
 
 # Car Data
-if not car_df.empty:
-    if not all(col in car_df.columns for col in ["model", "sub model", "price", "image_url"]):
-        st.error("❌ Car data sheet is missing required columns ('model', 'sub model', 'price', 'image_url').")
-        st.stop()
-    car_df['price'] = pd.to_numeric(car_df['price'], errors='coerce')
-    car_df.dropna(subset=['price'], inplace=True)
-    car_df = car_df[car_df['price'] > 0]
-    if car_df.empty:
-        st.error("❌ No valid car data found after cleaning (check prices).")
-        st.stop()
-else:
+if car_table.problem == PROBLEM_LOAD_FAILED:
+    report_load_error(car_table.error)
     st.error("❌ Failed to load car data. Cannot proceed.")
     st.stop()
+elif car_table.problem == PROBLEM_MISSING_COLUMNS:
+    st.error(f"❌ Car data sheet is missing required columns ({', '.join(repr(c) for c in CAR_COLUMNS)}).")
+    st.stop()
+elif car_table.problem == PROBLEM_EMPTY:
+    st.error("❌ No valid car data found after cleaning (check prices).")
+    st.stop()
+catalog = car_table.catalog  # Models, price-ordered submodels and resolved image URLs for this data version
+if not IMAGE_BASE_URL:
+    get_image_cache().prefetch(car.image_url for car in catalog.cars())  # Only images not cached yet are fetched
 
 # Standard Rates Data (down_payment_df)
-if not down_payment_df.empty:
-    if not all(col in down_payment_df.columns for col in ['ดาวน์', '48', '60', '72', '84']):
-         st.error("❌ Down payment data sheet is missing required columns ('ดาวน์', '48', '60', '72', '84').")
-         down_payment_df = pd.DataFrame(columns=['down_payment', '48', '60', '72', '84'])
-    else:
-        down_payment_df = down_payment_df[['ดาวน์', '48', '60', '72', '84']].drop_duplicates()
-        down_payment_df = down_payment_df.rename(columns={'ดาวน์': 'down_payment'})
-        down_payment_df['down_payment'] = pd.to_numeric(down_payment_df['down_payment'].astype(str).str.replace('%', '').str.strip(), errors='coerce')
-        down_payment_df.dropna(subset=['down_payment'], inplace=True)
-        for col in ['48', '60', '72', '84']:
-             if col in down_payment_df.columns:
-                down_payment_df[col] = pd.to_numeric(down_payment_df[col].astype(str).str.replace('%', '').str.strip(), errors='coerce')
-        if down_payment_df.empty:
-             st.warning("⚠️ No valid standard down payment percentage tiers found after cleaning.")
-else:
+if standard_rates_table.problem == PROBLEM_LOAD_FAILED:
+    report_load_error(standard_rates_table.error)
     st.error("❌ Failed to load down payment data. Calculations for non-promo cars will fail.")
-    down_payment_df = pd.DataFrame(columns=['down_payment', '48', '60', '72', '84'])
+elif standard_rates_table.problem == PROBLEM_MISSING_COLUMNS:
+    st.error(f"❌ Down payment data sheet is missing required columns ({', '.join(repr(c) for c in STANDARD_RATE_COLUMNS)}).")
+elif standard_rates_table.problem == PROBLEM_EMPTY:
+    st.warning("⚠️ No valid standard down payment percentage tiers found after cleaning.")
+down_payment_df = standard_rates_table.df
+standard_rate_index = standard_rates_table.index
 
-# SEAL Promo Rates Data (seal_promo_df)
-if not seal_promo_df.empty:
-    if not all(col in seal_promo_df.columns for col in ['ดาวน์', 'ผ่อน 48 งวด', 'ผ่อน 60 งวด', 'ผ่อน 72 งวด', 'ผ่อน 84 งวด']):
-        st.error("❌ SEAL promo rates sheet is missing required columns.")
-        seal_promo_df = pd.DataFrame(columns=['down_payment', '48', '60', '72', '84'])
-    else:
-        seal_promo_df = seal_promo_df[['ดาวน์', 'ผ่อน 48 งวด', 'ผ่อน 60 งวด', 'ผ่อน 72 งวด', 'ผ่อน 84 งวด']].drop_duplicates()
-        seal_promo_df = seal_promo_df.rename(columns={
-            'ดาวน์': 'down_payment',
-            'ผ่อน 48 งวด': '48',
-            'ผ่อน 60 งวด': '60',
-            'ผ่อน 72 งวด': '72',
-            'ผ่อน 84 งวด': '84'
-        })
-        seal_promo_df['down_payment'] = pd.to_numeric(seal_promo_df['down_payment'].astype(str).str.replace('%', '').str.strip(), errors='coerce')
-        seal_promo_df.dropna(subset=['down_payment'], inplace=True)
-        for col in ['48', '60', '72', '84']:
-            if col in seal_promo_df.columns:
-                seal_promo_df[col] = pd.to_numeric(seal_promo_df[col].astype(str).str.replace('%', '').str.strip(), errors='coerce')
-        if seal_promo_df.empty:
-            st.warning("⚠️ No valid SEAL promo percentage tiers found after cleaning.")
-else:
-    st.error("❌ Failed to load SEAL promo rates. Calculations for these models will fail.")
-    seal_promo_df = pd.DataFrame(columns=['down_payment', '48', '60', '72', '84'])
+# Promotion Rates Data (one table per campaign in promotions.json); cars of a campaign
+# whose table is unusable are quoted at standard rates
+if snapshot.promotions_error is not None:
+    st.error(f"❌ Failed to read the promotions file: {snapshot.promotions_error}. All models use standard rates.")
+for campaign in snapshot.campaigns:
+    promo_rates_table = snapshot.tables[campaign.table]
+    if promo_rates_table.problem == PROBLEM_LOAD_FAILED:
+        report_load_error(promo_rates_table.error)
+        st.error(f"❌ Failed to load {campaign.label} promo rates. These models use standard rates.")
+    elif promo_rates_table.problem == PROBLEM_MISSING_COLUMNS:
+        st.error(f"❌ {campaign.label} promo rates sheet is missing required columns.")
+    elif promo_rates_table.problem == PROBLEM_EMPTY:
+        st.warning(f"⚠️ No valid {campaign.label} promo percentage tiers found after cleaning.")
+
+# Sheets whose latest download was unusable keep serving their last good data
+for table in snapshot.tables.values():
+    if table.rejected_problem is not None:
+        detail = f": {table.rejected_error}" if table.rejected_error is not None else ""
+        st.warning(f"⚠️ The latest download of the {table.name} sheet could not be used ({table.rejected_problem}){detail}. Showing the last good data.")
+
+# The results section may st.stop() early, so the panel shows the previous rerun's complete breakdown
+previous_rerun_spans = st.session_state.get("metrics_rerun_spans")
+st.session_state.metrics_rerun_spans = rerun_spans
+if is_admin():
+    render_admin_panel(previous_rerun_spans)
 
-    
 # ✅ Session state setup
 if "show_result" not in st.session_state:
     st.session_state.show_result = False
@@ -173,8 +397,7 @@ image_url_for_display = None
 price = 0
 input_valid = False
 # ✅ Percent slider data - always defined
-percent_options_raw = sorted(down_payment_df['down_payment'].unique()) if 'down_payment' in down_payment_df.columns else []
-percent_options = [int(x) for x in percent_options_raw if not pd.isna(x)]
+percent_options = [int(x) for x in standard_rate_index.tiers]
 default_percent = 10 if 10 in percent_options else percent_options[0] if percent_options else 0
 # ✅ Image render helper
 def render_image():
@@ -191,17 +414,19 @@ st.markdown("##")
 with col_inputs:
     st.markdown("##### 🚗 รุ่นรถ <small>(Car Model)</small>", unsafe_allow_html=True)
     
-    model_options = sorted(car_df["model"].unique())
+    with span("select"):
+        model_options = list(catalog.models)
     if 'selected_model' not in st.session_state or st.session_state.selected_model not in model_options:
          st.session_state.selected_model = model_options[0]
         
     selected_model = st.selectbox("เลือกรุ่นรถที่ต้องการ (Select Car Model)", model_options, key="selected_model")
-    submodel_df = car_df[car_df["model"] == selected_model].sort_values(by="price")
-    submodel_options = submodel_df["sub model"].tolist()
+    with span("select"):
+        submodel_options = list(catalog.submodels_for(selected_model))
     selected_submodel = st.selectbox("เลือกรุ่นย่อย (Select Submodel)", submodel_options, key="selected_submodel")
-    car_row = car_df[(car_df["model"] == selected_model) & (car_df["sub model"] == selected_submodel)]
-    price = car_row["price"].values[0] if not car_row.empty else 0
-    image_url_for_display = convert_drive_link_to_direct_image_url(car_row["image_url"].values[0]) if not car_row.empty else None
+    with span("select"):
+        car = catalog.get(selected_model, selected_submodel)
+        price = car.price if car is not None else 0
+        image_url_for_display = car.image_url if car is not None else None
     st.metric(label="💰 ราคาจำหน่าย (Car Price)", value=f"฿{price:,.0f}")
     st.markdown("---")
     st.markdown("##### 💵 คำนวณค่างวด <small>(Estimate Your Monthly Payment)</small>", unsafe_allow_html=True)
@@ -215,16 +440,14 @@ with col_inputs:
         try:
             down_payment_amount = float(raw_input.replace(",", ""))
             down_percent = (down_payment_amount / price) * 100
-            input_valid = 5 <= down_percent <= 100
+            input_valid = MIN_DOWN_PERCENT <= down_percent <= 100
         except ValueError:
             st.warning("⚠️ โปรดใส่เงินดาวน์ขั้นต่ำที่ 5% ของราคารถ (Please enter a down payment of at least 5% of the car price)")
     else:
-        percent_options = [int(x) for x in sorted(down_payment_df['down_payment'].dropna().unique())]
-        default_percent = 10 if 10 in percent_options else (percent_options[0] if percent_options else 0)
         st.text("")
         selected_percent = st.select_slider("เปอร์เซ็นต์ดาวน์ (Select Down Payment %)", options=percent_options, value=default_percent, format_func=lambda x: f"{x}%", key="dp_percent_slider")
         down_percent = float(selected_percent)
-        down_payment_amount = (down_percent / 100) * price
+        down_payment_amount = down_payment_for(price, down_percent)
         input_valid = True
     if input_type == "เปอร์เซ็นต์ (%) (Percentage)":
         st.caption(f"💸 เงินดาวน์ : ฿{down_payment_amount:,.0f} ({int(down_percent)}%)")
@@ -236,66 +459,67 @@ with col_inputs:
       
 with col_img:
     st.markdown("#### 🚗 เลือกรถที่คุณสนใจ (Select Car & Options)")
-    if pd.notna(image_url_for_display) and isinstance(image_url_for_display, str) and image_url_for_display.startswith("http"):
-        st.image(image_url_for_display, caption=f"{selected_model} - {selected_submodel}", use_container_width=True)
-    elif price > 0:
-        st.info("ℹ️ No image available for this model.")
+    with span("render.image"):
+        if isinstance(image_url_for_display, str) and (image_url_for_display.startswith("http") or is_image_source(image_url_for_display)):
+            st.image(car_image(image_url_for_display), caption=f"{selected_model} - {selected_submodel}", use_container_width=True)
+        elif price > 0:
+            st.info("ℹ️ No image available for this model.")
     
+# --------- Comparison Matrix ---------
+# Built only while the toggle is on: a collapsed expander would still run its body on every rerun
+if st.toggle("📋 ตารางเปรียบเทียบค่างวด (Compare Submodels, Down Payments & Periods)", key="show_matrix"):
+    with span("render.matrix"):
+        show_all_models = st.checkbox("แสดงทุกรุ่น (Show all models)", key="matrix_all_models")
+        matrix_df = get_comparison_matrix(snapshot, snapshot.data_version, snapshot.promotions().day, None if show_all_models else selected_model)
+        if not matrix_df.empty:
+            st.dataframe(matrix_df, hide_index=True, use_container_width=True)
+        else:
+            st.info("ℹ️ No rate data available to build the comparison matrix.")
+
+# --------- Affordability Explorer ---------
+# Built only while the toggle is on, like the comparison matrix
+if st.toggle("🎯 ผ่อนเดือนละเท่าไหร่ไหว? (Affordability Explorer)", key="show_affordability"):
+    render_affordability_explorer(
+        get_affordability_grid(snapshot, snapshot.data_version, snapshot.promotions().day), selected_model, selected_submodel
+    )
+
 # --------- Calculations & Results ---------
-period_options = [48, 60, 72, 84]
 st.markdown("""
 <div style='margin: 0 0 12px 0; border-top: 1px solid #ddd;'></div>
 """, unsafe_allow_html=True)
 if st.session_state.show_result and input_valid and price > 0 and not down_payment_df.empty:
-    if down_payment_amount >= price:
+    # Determine which rate table to use based on the selected model
+    with span("rate_lookup"):
+        rate_index, campaign = snapshot.rate_index_for(selected_model, selected_submodel)
+        result = quote(price, down_payment_amount, down_percent, period, rate_index, snapshot_version=snapshot.data_version)
+    is_promo_rate = campaign is not None
+    promo_info = f"อัตราดอกเบี้ยพิเศษสำหรับ {selected_model} {selected_submodel}" if is_promo_rate else ""
+
+    if result.status == QUOTE_NO_FINANCING:
          st.info("เงินดาวน์เท่ากับราคารถ ไม่สามารถจัดไฟแนนซ์ได้ (The down payment is equal to the car's price. No financing is required.)")
          st.stop()
-    
-    # Determine which rate table to use based on the selected model
-    # Apply special promo rates ONLY to BYD SEAL Dynamic and Premium
-    is_seal_special = (
-    "BYD SEAL" in selected_model.strip().lower() and
-    any(kw in selected_submodel.strip().lower() for kw in ["dynamic", "premium"])
-    )
-    
-    if is_seal_special and not seal_promo_df.empty:
-        rate_df = seal_promo_df
-        promo_info = f"อัตราดอกเบี้ยพิเศษสำหรับ {selected_model} {selected_submodel}"
-    else:
-        rate_df = down_payment_df
-        promo_info = ""
 
     # Check if a valid rate table was selected and proceed with calculation
-    if rate_df.empty:
+    if rate_index.empty:
         st.error("❌ Cannot perform calculations. The selected rate data table is missing or invalid.")
         st.stop()
 
     # Handle the 30% plan logic
-    if down_percent > 30 and 30.0 in rate_df['down_payment'].values:
-        thirty_plan_row = rate_df[rate_df["down_payment"] == 30.0].iloc[0]
-        loan_amount = price - down_payment_amount
-        qualified_periods_30_plan = []
-        for p in period_options:
-            period_col = str(p)
-            if period_col in thirty_plan_row.index and pd.notna(thirty_plan_row[period_col]):
-                try:
-                    interest_30 = float(thirty_plan_row[period_col])
-                    interest_amount = loan_amount * (interest_30 / 100) * (p / 12)
-                    if interest_amount > 25000:
-                        monthly_30 = (loan_amount + interest_amount) / p
-                        qualified_periods_30_plan.append({
-                           "Period": f"{p} months",
-                           "Interest (30% Plan Rate)": f"{interest_30:.2f}%",
-                           "Monthly Installment": f"฿{monthly_30:,.2f}",
-                        })
-                except (ValueError, TypeError, KeyError, ZeroDivisionError):
-                    continue
+    if result.status in (QUOTE_THIRTY_PLAN, QUOTE_NO_THIRTY_PLAN):
+        qualified_periods_30_plan = [
+            {
+                "Period": f"{option.period} months",
+                "Interest (30% Plan Rate)": f"{option.interest_rate:.2f}%",
+                "Monthly Installment": f"฿{option.monthly_installment:,.2f}",
+            }
+            for option in result.thirty_plan_options
+        ]
         if qualified_periods_30_plan:
             df_30 = pd.DataFrame(qualified_periods_30_plan)
             df_30.insert(0, "Option", range(1, len(df_30) + 1))
             df_30.set_index("Option", inplace=True)
             
-            rate_indicator = "🌟" if is_seal_special else ""
+            rate_indicator = "🌟" if is_promo_rate else ""
             st.markdown(f"""
             <div style="background-color: #e6f4ea; padding: 1rem; border-radius: 10px; border-left: 6px solid #34a853;">
             ✅ <strong>ด้วยเงินดาวน์ {down_payment_amount:,.0f} บาท ({down_percent:.2f}%) {rate_indicator}</strong> 
@@ -323,6 +547,7 @@ if st.session_state.show_result and input_valid and price > 0 and not down_payme
                     <div class="item price">💳 ยอดผ่อนรายเดือน: {row['Monthly Installment']} / เดือน</div>
                 </div>
                 """, unsafe_allow_html=True)
+            render_downloads(result, selected_model, selected_submodel)
             st.stop()
         else:
             st.markdown("""
@@ -336,30 +561,25 @@ if st.session_state.show_result and input_valid and price > 0 and not down_payme
             st.stop()
     
     # Regular calculation logic for all other cases
-    available_percents = sorted(rate_df['down_payment'].unique())
-    matched_percent = max([p for p in available_percents if p <= down_percent], default=None)
+    matched_percent = result.matched_tier
     
-    if matched_percent is not None:
-        interest_row = rate_df[rate_df['down_payment'] == matched_percent]
-        if not interest_row.empty:
-            period_col = str(period)
-            if period_col in interest_row.columns and pd.notna(interest_row[period_col].values[0]):
-                try:
-                    interest_rate = float(interest_row[period_col].values[0])
-                    loan_amount = price - down_payment_amount
-                    total_interest = loan_amount * (interest_rate / 100) * (period / 12)
-                    monthly_installment = (loan_amount + total_interest) / period
-                    
-                    rate_indicator = " 🌟" if is_seal_special else ""
-                    st.markdown(f"#### 📊 สรุปการผ่อนชำระ{rate_indicator} <small>(Installment Summary)</small>", unsafe_allow_html=True)
-
-                    if is_seal_special:
-                         st.markdown("""
-                         <div style="background-color: #e8f5e8; padding: 12px; border-radius: 8px; border-left: 4px solid #28a745; margin-bottom: 16px;">
-                         🌟 <strong>Special Rate Applied!</strong> You're getting exclusive financing rates for BYD SEAL Dynamic/Premium models.
-                         </div>
-                         """, unsafe_allow_html=True)
+    if result.status != QUOTE_NO_TIER:
+        if result.status != QUOTE_MISSING_RATE:
+            try:
+                interest_rate = result.interest_rate
+                monthly_installment = result.monthly_installment
+                
+                rate_indicator = " 🌟" if is_promo_rate else ""
+                st.markdown(f"#### 📊 สรุปการผ่อนชำระ{rate_indicator} <small>(Installment Summary)</small>", unsafe_allow_html=True)
+
+                if is_promo_rate:
+                     st.markdown(f"""
+                     <div style="background-color: #e8f5e8; padding: 12px; border-radius: 8px; border-left: 4px solid #28a745; margin-bottom: 16px;">
+                     🌟 <strong>Special Rate Applied!</strong> You're getting exclusive financing rates for {campaign.label} models.
+                     </div>
+                     """, unsafe_allow_html=True)
 
+                with span("render.result"):
                     res_col1, res_col2, res_col3 = st.columns(3)
                     rounded_down_payment = math.ceil(down_payment_amount)
                     res_col1.metric("เงินดาวน์ที่เลือก (Your Down Payment)", f"฿{rounded_down_payment:,.0f} ({int(down_percent)}%)")
@@ -367,12 +587,25 @@ if st.session_state.show_result and input_valid and price > 0 and not down_payme
                     res_col2.metric("อัตราดอกเบี้ย (Interest Rate Applied)", f"{interest_rate:.2f}%", help=interest_help_text)
                     rounded_monthly = math.ceil(monthly_installment)
                     res_col3.metric("ยอดผ่อนรายเดือน (Monthly Installment)", f"฿{rounded_monthly:,.0f} /เดือน")
-                except (ValueError, TypeError, ZeroDivisionError) as e:
-                    st.error(f"⚠️ Error calculating installment for {period} months: {e}")
-            else:
-                st.error(f"⚠️ Interest rate data is missing or invalid for {matched_percent:.1f}% down payment and {period} months period.")
+                    st.caption(f"ข้อมูลอัตราดอกเบี้ยเวอร์ชัน {result.snapshot_version} (Rate data version {result.snapshot_version})")
+                with st.expander("📅 ตารางผ่อนรายเดือน (Monthly Schedule)"):
+                    st.dataframe(
+                        pd.DataFrame(plan_schedule(result, next(financed_plans(result)))).rename(columns={
+                            "month": "งวด (Month)",
+                            "installment": "ค่างวด (Installment)",
+                            "principal": "เงินต้น (Principal)",
+                            "interest": "ดอกเบี้ย (Interest)",
+                            "principal_balance": "เงินต้นคงเหลือ (Principal Left)",
+                            "remaining_balance": "ยอดคงเหลือ (Total Left)",
+                        }).round(2),
+                        hide_index=True,
+                        use_container_width=True,
+                    )
+                render_downloads(result, selected_model, selected_submodel)
+            except (ValueError, TypeError, ZeroDivisionError) as e:
+                st.error(f"⚠️ Error calculating installment for {period} months: {e}")
         else:
-            st.error(f"❌ No interest rate data found for the qualifying tier: {matched_percent:.1f}%.")
+            st.error(f"⚠️ Interest rate data is missing or invalid for {matched_percent:.1f}% down payment and {period} months period.")
     else:
         st.error("❌ No financing options available for the provided down payment percentage.")
     
@@ -388,8 +621,7 @@ elif price <= 0:
 elif down_payment_df.empty:
     st.error("❌ Cannot perform calculations because the down payment interest rate data is missing or invalid.")
     
-# PDF Section remains commented out
-# ... (rest of the PDF code if needed) ...
+# PDF / CSV downloads are rendered with each result above (see render_downloads)
 
 st.markdown("""
     <style>
@@ -0,0 +1,244 @@
+"""Offline benchmark of the quote path, data loading and a full page rerun.
+
+Usage:
+    python scripts/benchmark.py [--output results.json] [--compare previous.json] [--quick]
+
+Runs entirely against the recorded CSVs in fixtures/sheets: the page benchmark
+serves them through scripts/fake_sheets.py and points BYD_SHEETS_BASE_URL at it.
+Every cache lives in a scratch directory that is removed on exit, car photos are
+never downloaded, and without --output the results go to byd-benchmark.json in the
+system temp directory, so a run leaves nothing in the working directory.
+Each benchmark reports per-call min / median / p95 / mean in milliseconds, and the
+results are written as JSON so two runs can be compared; --compare exits non-zero
+when a benchmark's median regressed by more than --tolerance.
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# byd_calc reads its cache directories when it is imported, so they must point into
+# the scratch directory before the first byd_calc import below
+SCRATCH_DIR = tempfile.mkdtemp(prefix="byd-benchmark-")
+atexit.register(shutil.rmtree, SCRATCH_DIR, True)
+os.environ["BYD_SHEET_CACHE_DIR"] = os.path.join(SCRATCH_DIR, "sheets")
+os.environ["BYD_SNAPSHOT_DIR"] = os.path.join(SCRATCH_DIR, "snapshot")
+os.environ["BYD_IMAGE_CACHE_DIR"] = os.path.join(SCRATCH_DIR, "images")
+os.environ["BYD_SNAPSHOT_FOLLOW"] = "0"
+
+from fake_sheets import FIXTURES_DIR, start_fake_sheets  # noqa: E402
+
+from byd_calc.affordability import AffordabilityGrid  # noqa: E402
+from byd_calc.data import CAR_TABLE, STANDARD_RATES_TABLE, Snapshot, build_table, table_sources  # noqa: E402
+from byd_calc.links import GOOGLE_SHEET_GID_RE  # noqa: E402
+from byd_calc.promotions import load_campaigns  # noqa: E402
+from byd_calc.quotes import down_payment_for, quote, quote_batch, quote_grid  # noqa: E402
+from byd_calc.rates import RATE_PERIODS  # noqa: E402
+from byd_calc.sheets import content_digest  # noqa: E402
+
+DEFAULT_TOLERANCE = 1.25  # --compare fails when median_ms grows by more than 25%
+DEFAULT_OUTPUT = os.path.join(tempfile.gettempdir(), "byd-benchmark.json")
+
+
+def measure(fn, number=1, repeat=20):
+    # Per-call timings (ms) of `fn` over `repeat` rounds of `number` calls each
+    fn()  # Warm-up: first-call imports and caches are not what we are measuring
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+    samples.sort()
+    return {
+        "calls": number * repeat,
+        "min_ms": samples[0],
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "mean_ms": statistics.fmean(samples),
+    }
+
+
+def read_fixtures(sources):
+    # table name -> {"content", "digest"} as SheetCache would return them
+    raw = {}
+    for name, (link, _) in sources.items():
+        gid = GOOGLE_SHEET_GID_RE.search(link).group(1)
+        with open(os.path.join(FIXTURES_DIR, f"{gid}.csv"), encoding="utf-8") as f:
+            content = f.read()
+        raw[name] = {"content": content, "digest": content_digest(content)}
+    return raw
+
+
+def bench_data(raw, sources, repeat):
+    results = {}
+    for name, (_, builder) in sources.items():
+        results[f"clean.{name}"] = measure(lambda: build_table(name, raw[name], 1, builder), number=5, repeat=repeat)
+    return results
+
+
+def bench_quotes(tables, repeat):
+    rng = random.Random(0)
+    index = tables[STANDARD_RATES_TABLE].index
+    prices = [car.price for car in tables[CAR_TABLE].catalog.cars()]
+    down_percents = [rng.uniform(5, 100) for _ in range(10000)]
+    periods = [rng.choice(RATE_PERIODS) for _ in range(10000)]
+    batch_prices = [rng.choice(prices) for _ in range(10000)]
+    batch_down = [down_payment_for(p, d) for p, d in zip(batch_prices, down_percents)]
+
+    def lookups():
+        for d, p in zip(down_percents[:1000], periods[:1000]):
+            index.lookup(d, p)
+
+    def single_quotes():
+        for price, dp, d, p in zip(batch_prices[:1000], batch_down[:1000], down_percents[:1000], periods[:1000]):
+            quote(price, dp, d, p, index)
+
+    results = {
+        "rate_lookup.x1000": measure(lookups, repeat=repeat),
+        "quote.single.x1000": measure(single_quotes, repeat=repeat),
+        "quote.batch.10000": measure(lambda: quote_batch(batch_prices, batch_down, down_percents, periods, index), repeat=repeat),
+    }
+    for name, table in tables.items():
+        if table.index is None:
+            continue
+        rates = table.index
+        results[f"quote.grid.catalog.{name}"] = measure(
+            lambda: quote_grid(prices, rates.tiers, RATE_PERIODS, rates), number=10, repeat=repeat
+        )
+    return results
+
+
+def bench_affordability(tables, campaigns, repeat):
+    # The explorer's grid is built once per snapshot; every budget change is one solve()
+    snapshot = Snapshot(version=1, created_at=0, tables=tables, campaigns=campaigns)
+    cars = snapshot.catalog.cars()
+    grid = AffordabilityGrid.build(cars, snapshot.rate_index_for)
+    budgets = [10000 + 500 * i for i in range(40)]
+    return {
+        "affordability.build": measure(lambda: AffordabilityGrid.build(cars, snapshot.rate_index_for), number=10, repeat=repeat),
+        "affordability.solve.x40": measure(lambda: [grid.solve(b) for b in budgets], repeat=repeat),
+    }
+
+
+def bench_page(repeat):
+    # Full headless script runs through Streamlit's AppTest against the fixture server
+    from streamlit.testing.v1 import AppTest
+
+    server, base_url = start_fake_sheets()
+    os.environ["BYD_SHEETS_BASE_URL"] = base_url
+    # With an image base URL the page only links photos (to the fixture server, which
+    # nobody requests here) instead of prefetching the catalog from Google Drive
+    os.environ["BYD_IMAGE_BASE_URL"] = base_url
+    script = os.path.join(REPO_ROOT, "byd_interest_calc.py")
+    try:
+        start = time.perf_counter()
+        app = AppTest.from_file(script, default_timeout=60)
+        app.run()
+        first_run_ms = (time.perf_counter() - start) * 1000
+        if app.exception:
+            raise RuntimeError(f"page raised: {app.exception[0].message}")
+
+        def rerun():
+            app.run()
+
+        results = {
+            "page.first_run": {"calls": 1, "min_ms": first_run_ms, "median_ms": first_run_ms,
+                               "p95_ms": first_run_ms, "mean_ms": first_run_ms},
+            "page.rerun": measure(rerun, repeat=repeat),
+        }
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def metadata():
+    import numpy
+    import pandas
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    try:
+        import streamlit
+        streamlit_version = streamlit.__version__
+    except ImportError:
+        streamlit_version = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+        "streamlit": streamlit_version,
+    }
+
+
+def compare(results, previous, tolerance):
+    # Returns the names of benchmarks whose median regressed beyond tolerance
+    regressions = []
+    for name, current in sorted(results.items()):
+        before = previous.get("results", {}).get(name)
+        if not before:
+            continue
+        ratio = current["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        flag = "❌" if ratio > tolerance else "  "
+        print(f"{flag} {name:<40} {before['median_ms']:>10.3f} -> {current['median_ms']:>10.3f} ms  ({ratio:.2f}x)")
+        if ratio > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the BYD calculator")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="where to write the JSON results (default: %(default)s)")
+    parser.add_argument("--compare", help="previous JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--quick", action="store_true", help="fewer rounds, for a smoke run")
+    parser.add_argument("--skip-page", action="store_true", help="skip the Streamlit AppTest runs")
+    args = parser.parse_args(argv)
+
+    repeat = 5 if args.quick else 20
+    campaigns = load_campaigns()
+    sources = table_sources(campaigns)
+    raw = read_fixtures(sources)
+    tables = {name: build_table(name, raw[name], 1, builder) for name, (_, builder) in sources.items()}
+    results = {}
+    results.update(bench_data(raw, sources, repeat))
+    results.update(bench_quotes(tables, repeat))
+    results.update(bench_affordability(tables, campaigns, repeat))
+    if not args.skip_page:
+        results.update(bench_page(repeat))
+
+    for name, r in results.items():
+        print(f"{name:<40} median {r['median_ms']:>10.3f} ms   p95 {r['p95_ms']:>10.3f} ms")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"meta": metadata(), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} benchmark(s) regressed by more than {args.tolerance:.2f}x")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""Fails when a cold ``import byd_calc`` takes longer than the budget.
+
+Usage: python scripts/check_import_time.py [--budget-ms 150] [--runs 5]
+
+Each run is a fresh interpreter so nothing is cached in sys.modules; the best
+of N runs is compared to the budget to keep noise from a busy machine out.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+IMPORT_BUDGET_MS = 150  # numpy is the only heavy dependency the core may load at import
+FORBIDDEN_MODULES = ("streamlit", "pandas", "requests")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import_ms(module="byd_calc"):
+    # Cumulative import time of `module` in microseconds, from `python -X importtime`
+    probe = f"import {module}, sys; print(','.join(m for m in {FORBIDDEN_MODULES!r} if m in sys.modules))"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    cumulative_us = None
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)$", line)
+        if match and match.group(2) == module:
+            cumulative_us = int(match.group(1))
+    leaked = [m for m in proc.stdout.strip().split(",") if m]
+    return cumulative_us / 1000, leaked
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = [measure_import_ms() for _ in range(args.runs)]
+    best_ms = min(ms for ms, _ in results)
+    leaked = results[0][1]
+    print(f"import byd_calc: best {best_ms:.1f} ms of {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    if leaked:
+        print(f"❌ byd_calc imported {', '.join(leaked)} at import time")
+        return 1
+    if best_ms > args.budget_ms:
+        print("❌ Import time budget exceeded")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
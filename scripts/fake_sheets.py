@@ -0,0 +1,84 @@
+"""Local stand-in for the Google Sheets CSV export endpoint.
+
+Usage:
+    python scripts/fake_sheets.py --port 8700 [--dir fixtures/sheets] [--delay 0.2]
+    BYD_SHEETS_BASE_URL=http://127.0.0.1:8700 streamlit run byd_interest_calc.py
+
+Serves ``<dir>/<gid>.csv`` for ``/spreadsheets/d/<sheet id>/export?format=csv&gid=<gid>``
+with an ETag, and answers matching If-None-Match requests with 304 like Google does.
+Files are re-read on every request, so editing a fixture simulates a sheet change.
+"""
+import argparse
+import hashlib
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(REPO_ROOT, "fixtures", "sheets")
+
+EXPORT_PATH_RE = re.compile(r"^/spreadsheets/d/[a-zA-Z0-9-_]+/export$")
+
+
+def make_handler(fixtures_dir, delay=0.0):
+    class FakeSheetsHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        requests_served = 0
+        not_modified_served = 0  # 304 answers among requests_served
+
+        def do_GET(self):
+            type(self).requests_served += 1
+            url = urlsplit(self.path)
+            gid = parse_qs(url.query).get("gid", ["0"])[0]
+            path = os.path.join(fixtures_dir, f"{gid}.csv")
+            if not EXPORT_PATH_RE.match(url.path) or not gid.isdigit() or not os.path.exists(path):
+                self.send_error(404)
+                return
+            if delay:
+                time.sleep(delay)
+            with open(path, "rb") as f:
+                content = f.read()
+            etag = f'"{hashlib.sha1(content).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                type(self).not_modified_served += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv; charset=utf-8")
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeSheetsHandler
+
+
+def start_fake_sheets(port=0, fixtures_dir=FIXTURES_DIR, delay=0.0):
+    # Starts the stand-in on a daemon thread; returns (server, base_url). port=0 picks a free port.
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(fixtures_dir, delay))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for Google Sheets CSV exports")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--dir", default=FIXTURES_DIR, help="directory of <gid>.csv files")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before each response")
+    args = parser.parse_args(argv)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.dir, args.delay))
+    print(f"Serving {args.dir} at http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
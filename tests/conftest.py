@@ -0,0 +1,50 @@
+"""Shared fixtures: the recorded sheets in fixtures/sheets served by scripts/fake_sheets.py.
+
+Run with ``pip install -r requirements-dev.txt && python -m pytest``.
+"""
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, "scripts"))
+
+from fake_sheets import start_fake_sheets  # noqa: E402
+
+from byd_calc.data import SnapshotStore  # noqa: E402
+from byd_calc.promotions import load_campaigns  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def fake_sheets_url():
+    server, base_url = start_fake_sheets()
+    previous = os.environ.get("BYD_SHEETS_BASE_URL")
+    os.environ["BYD_SHEETS_BASE_URL"] = base_url
+    yield base_url
+    if previous is None:
+        os.environ.pop("BYD_SHEETS_BASE_URL", None)
+    else:
+        os.environ["BYD_SHEETS_BASE_URL"] = previous
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope="session")
+def store(fake_sheets_url, tmp_path_factory):
+    from byd_calc.sheets import SheetCache
+
+    campaigns = load_campaigns(os.path.join(REPO_ROOT, "promotions.json"))
+    return SnapshotStore(SheetCache(cache_dir=str(tmp_path_factory.mktemp("sheets"))), campaigns=campaigns)
+
+
+@pytest.fixture(scope="session")
+def snapshot(store):
+    return store.snapshot().require_cars()
+
+
+@pytest.fixture(scope="session")
+def rate_tables(snapshot):
+    # Every usable rate table of the fixtures: table name -> SheetTable
+    return {name: table for name, table in snapshot.tables.items() if table.index is not None and table.problem is None}
@@ -0,0 +1,71 @@
+import asyncio
+import socket
+import zlib
+
+from byd_calc.cluster import StickyBalancer
+
+BACKENDS = [("127.0.0.1", 9001), ("127.0.0.1", 9002), ("127.0.0.1", 9003)]
+
+
+def test_a_client_always_starts_at_its_own_worker():
+    balancer = StickyBalancer(BACKENDS)
+    for ip in ("10.0.0.1", "10.0.0.2", "192.168.1.50", ""):
+        candidates = balancer.candidates(ip)
+        assert candidates == balancer.candidates(ip)
+        assert candidates[0] == BACKENDS[zlib.crc32(ip.encode("utf-8")) % len(BACKENDS)]
+        assert sorted(candidates) == BACKENDS  # Every worker once, as fallbacks
+        start = BACKENDS.index(candidates[0])
+        assert candidates == BACKENDS[start:] + BACKENDS[:start]
+
+
+def test_clients_are_spread_over_the_workers():
+    balancer = StickyBalancer(BACKENDS)
+    assert {balancer.candidates(f"10.0.0.{i}")[0] for i in range(50)} == set(BACKENDS)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_a_dead_worker_fails_over_to_the_next():
+    async def run():
+        async def echo(reader, writer):
+            writer.write(b"worker: " + await reader.readline())
+            await writer.drain()
+            writer.close()
+
+        alive = await asyncio.start_server(echo, "127.0.0.1", 0)
+        alive_backend = ("127.0.0.1", alive.sockets[0].getsockname()[1])
+        dead_backend = ("127.0.0.1", free_port())  # Nothing listens here
+        # Order the backends so the client's own worker is the dead one
+        own = zlib.crc32(b"127.0.0.1") % 2
+        backends = [alive_backend, alive_backend]
+        backends[own] = dead_backend
+        balancer = StickyBalancer(backends, connect_timeout=1)
+        assert balancer.candidates("127.0.0.1")[0] == dead_backend
+
+        proxy = await asyncio.start_server(balancer.handle_connection, "127.0.0.1", 0)
+        async with alive, proxy:
+            reader, writer = await asyncio.open_connection("127.0.0.1", proxy.sockets[0].getsockname()[1])
+            writer.write(b"hello\n")
+            await writer.drain()
+            reply = await asyncio.wait_for(reader.readline(), 5)
+            writer.close()
+            return reply
+
+    assert asyncio.run(run()) == b"worker: hello\n"
+
+
+def test_no_live_worker_closes_the_connection():
+    async def run():
+        balancer = StickyBalancer([("127.0.0.1", free_port())], connect_timeout=1)
+        proxy = await asyncio.start_server(balancer.handle_connection, "127.0.0.1", 0)
+        async with proxy:
+            reader, writer = await asyncio.open_connection("127.0.0.1", proxy.sockets[0].getsockname()[1])
+            data = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return data
+
+    assert asyncio.run(run()) == b""
@@ -0,0 +1,89 @@
+import glob
+import os
+
+import pytest
+from conftest import REPO_ROOT
+
+from byd_calc.images import IMAGE_FORMATS, IMAGE_WIDTHS, ImageCache, ImageUnavailableError
+
+# The two smallest bundled photos keep resizing quick
+BUNDLED = [os.path.basename(p) for p in sorted(glob.glob(os.path.join(REPO_ROOT, "*.png")), key=os.path.getsize)[:2]]
+VARIANTS = [(variant, fmt) for variant in IMAGE_WIDTHS for fmt in IMAGE_FORMATS]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ImageCache(str(tmp_path))
+
+
+def source_files(cache, source):
+    return sorted(cache._sources.get(cache._key(source), {}))
+
+
+def test_every_variant_is_served(cache):
+    for variant, fmt in VARIANTS:
+        image = cache.get(BUNDLED[0], variant, fmt)
+        assert image.content_type == IMAGE_FORMATS[fmt]
+    assert len(source_files(cache, BUNDLED[0])) == len(VARIANTS)
+
+
+def test_a_missing_variant_is_regenerated(cache):
+    cache.get(BUNDLED[0], "desktop", "webp")
+    dropped = f"{cache._key(BUNDLED[0])}.mobile.jpeg"
+    os.remove(os.path.join(cache.cache_dir, dropped))
+    cache._forget(dropped)
+    assert cache.get(BUNDLED[0], "mobile", "jpeg").content
+    assert dropped in source_files(cache, BUNDLED[0])
+
+
+def test_eviction_drops_whole_sources(tmp_path):
+    sizing = ImageCache(str(tmp_path / "sizing"))
+    sizing.get(BUNDLED[0])
+    one_source = sizing._size
+    cache = ImageCache(str(tmp_path / "cache"), max_bytes=int(one_source * 1.5))
+    cache.get(BUNDLED[0])
+    cache.get(BUNDLED[1])
+    assert source_files(cache, BUNDLED[0]) == []
+    assert len(source_files(cache, BUNDLED[1])) == len(VARIANTS)
+    assert sorted(os.listdir(cache.cache_dir)) == source_files(cache, BUNDLED[1])
+    for variant, fmt in VARIANTS:
+        assert cache.get(BUNDLED[1], variant, fmt).content
+
+
+def test_reading_a_variant_keeps_its_whole_source(tmp_path):
+    cache = ImageCache(str(tmp_path))
+    cache.get(BUNDLED[0])
+    one_source = cache._size
+    cache.get(BUNDLED[1])
+    cache.get(BUNDLED[0], "mobile", "jpeg")  # BUNDLED[1] is now the least recently used source
+    cache.max_bytes = int(one_source * 1.5)
+    cache._evict()
+    assert source_files(cache, BUNDLED[1]) == []
+    assert len(source_files(cache, BUNDLED[0])) == len(VARIANTS)
+    assert cache._size == one_source <= cache.max_bytes
+
+
+def test_the_only_source_is_never_evicted(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=1)
+    cache.get(BUNDLED[0])
+    assert len(source_files(cache, BUNDLED[0])) == len(VARIANTS)
+
+
+def test_unknown_sources_are_refused(cache):
+    with pytest.raises(ImageUnavailableError):
+        cache.get("https://example.com/cat.png")
+
+
+def test_old_variants_are_refreshed_in_the_background(cache, monkeypatch):
+    before = cache.get(BUNDLED[0])
+    assert before.etag == cache.get(BUNDLED[0]).etag  # Same content, same ETag
+    for name in source_files(cache, BUNDLED[0]):
+        os.utime(os.path.join(cache.cache_dir, name), (0, 0))
+    with open(os.path.join(REPO_ROOT, BUNDLED[1]), "rb") as f:
+        replaced = f.read()
+    monkeypatch.setattr(cache, "_download", lambda source: replaced)  # The photo changed under the same URL
+
+    assert cache.get(BUNDLED[0]).content == before.content  # Served as cached while it is re-fetched
+    cache._pool.shutdown(wait=True)
+    after = cache.get(BUNDLED[0])
+    assert after.content != before.content and after.etag != before.etag
@@ -0,0 +1,13 @@
+import os
+import subprocess
+import sys
+
+from conftest import REPO_ROOT
+
+CHECK_SCRIPT = os.path.join(REPO_ROOT, "scripts", "check_import_time.py")
+
+
+def test_import_stays_within_budget():
+    # Same guardrail as running the script by hand: fresh interpreters, best of N, nothing heavy leaked
+    proc = subprocess.run([sys.executable, CHECK_SCRIPT], cwd=REPO_ROOT, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
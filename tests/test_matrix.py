@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+import pytest
+
+from byd_calc.affordability import AffordabilityGrid
+from byd_calc.matrix import comparison_matrix, group_by_rate_index
+from byd_calc.quotes import QUOTE_OK, QUOTE_THIRTY_PLAN, down_payment_for, quote
+from byd_calc.rates import RATE_PERIODS
+
+
+def test_cars_sharing_a_rate_table_are_grouped(snapshot):
+    cars = snapshot.catalog.cars()
+    groups = group_by_rate_index(cars, snapshot.rate_index_for)
+    assert sorted(i for _, positions in groups for i in positions) == list(range(len(cars)))
+    for rate_index, positions in groups:
+        for i in positions:
+            assert snapshot.rate_index_for(cars[i].model, cars[i].submodel)[0] is rate_index
+    assert len(groups) == 2  # Standard rates and the SEAL promotion
+
+
+def test_comparison_matrix_matches_quote(snapshot):
+    cars = snapshot.catalog.cars()
+    matrix = comparison_matrix(cars, snapshot.rate_index_for)
+    assert list(matrix.columns) == ["model", "submodel", "down_percent", *RATE_PERIODS]
+    assert list(dict.fromkeys(zip(matrix["model"], matrix["submodel"]))) == [(c.model, c.submodel) for c in cars]
+    records = {(c.model, c.submodel): c for c in cars}
+    for row in matrix.itertuples(index=False):
+        car = records[(row.model, row.submodel)]
+        rate_index, _ = snapshot.rate_index_for(car.model, car.submodel)
+        for period, value in zip(RATE_PERIODS, row[3:]):
+            q = quote(car.price, down_payment_for(car.price, row.down_percent), row.down_percent, period, rate_index)
+            if q.status == QUOTE_OK and row.down_percent >= 5:
+                assert value == math.ceil(q.monthly_installment)
+            elif q.status == QUOTE_THIRTY_PLAN and any(o.period == period for o in q.thirty_plan_options):
+                option = next(o for o in q.thirty_plan_options if o.period == period)
+                assert value == math.ceil(option.monthly_installment)
+            else:
+                assert math.isnan(value)
+
+
+def test_comparison_matrix_of_no_cars_is_empty(snapshot):
+    assert comparison_matrix([], snapshot.rate_index_for).empty
+
+
+def test_affordability_grid_marks_promotions(snapshot):
+    cars = snapshot.catalog.cars()
+    grid = AffordabilityGrid.build(cars, snapshot.rate_index_for)
+    expected = [c.name if c else None for _, c in (snapshot.rate_index_for(car.model, car.submodel) for car in cars)]
+    assert grid.promotions == expected
+    position = grid.position("BYD SEAL", "Dynamic")
+    assert grid.monthly[position, list(grid.down_percents).index(20), 0] == pytest.approx(16992)
+
+
+def test_affordability_curve_frame(snapshot):
+    grid = AffordabilityGrid.build(snapshot.catalog.cars(), snapshot.rate_index_for)
+    position = grid.position("BYD SEAL", "Dynamic")
+    frame = grid.curve_frame(position)
+    assert frame is grid.curve_frame(position)
+    assert list(frame.columns) == ["down_percent", "period", "monthly"]
+    assert not frame["monthly"].isna().any()
+    curve = grid.curve(position)
+    for row in frame.itertuples(index=False):
+        d = list(grid.down_percents).index(row.down_percent)
+        p = list(grid.periods).index(row.period)
+        assert curve[d, p] == row.monthly
+    assert len(frame) == int((~np.isnan(curve)).sum())
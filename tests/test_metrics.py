@@ -0,0 +1,70 @@
+import re
+
+from byd_calc import metrics
+from byd_calc.metrics import MetricsRegistry, own_trace, render_prometheus, span, start_trace
+
+
+def test_span_stats_and_percentiles():
+    registry = MetricsRegistry(samples=100)
+    for ms in range(1, 201):  # Only the 100 most recent samples (101..200 ms) count for percentiles
+        registry.observe("clean", ms / 1000)
+    stats = registry.span_stats()["clean"]
+    assert stats["count"] == 200
+    assert stats["sum"] == sum(range(1, 201)) / 1000
+    assert (stats["p50"], stats["p95"], stats["p99"]) == (0.151, 0.196, 0.2)
+
+
+def test_cache_stats():
+    registry = MetricsRegistry()
+    for hit in (True, True, True, False):
+        registry.cache_event("sheet", hit)
+    assert registry.cache_stats() == {"sheet": {"hits": 3, "misses": 1, "hit_rate": 0.75}}
+    registry.reset()
+    assert registry.cache_stats() == {} and registry.span_stats() == {}
+
+
+def test_render_prometheus():
+    registry = MetricsRegistry()
+    registry.observe("fetch", 0.25)
+    registry.cache_event("image", hit=False)
+    lines = render_prometheus(registry).splitlines()
+    assert 'byd_span_duration_seconds{span="fetch",quantile="0.95"} 0.250000' in lines
+    assert 'byd_span_duration_seconds_sum{span="fetch"} 0.250000' in lines
+    assert 'byd_span_duration_seconds_count{span="fetch"} 1' in lines
+    assert 'byd_cache_requests_total{cache="image",result="miss"} 1' in lines
+    assert "# TYPE byd_span_duration_seconds summary" in lines
+    for line in lines:
+        assert line.startswith("#") or re.fullmatch(r'[a-z_]+\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\} [0-9.]+', line)
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics, "REGISTRY", registry)
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    trace = start_trace()
+    with span("clean"):
+        pass
+    metrics.cache_event("sheet", hit=True)
+    assert (trace, registry.span_stats(), registry.cache_stats()) == ([], {}, {})
+
+
+def test_own_trace_keeps_fragment_spans_out_of_the_rerun_trace(monkeypatch):
+    monkeypatch.setattr(metrics, "REGISTRY", MetricsRegistry())
+    rerun = start_trace()
+    with span("fetch"):
+        pass
+
+    @own_trace()
+    def fragment():
+        with span("affordability.solve"):
+            pass
+
+    fragment()
+    with own_trace() as fragment_trace:
+        with span("render.affordability"):
+            pass
+    with span("render"):
+        pass
+    assert [name for name, _ in rerun] == ["fetch", "render"]
+    assert [name for name, _ in fragment_trace] == ["render.affordability"]
+    assert metrics.REGISTRY.span_stats()["affordability.solve"]["count"] == 1
@@ -0,0 +1,178 @@
+from datetime import date
+
+import pytest
+
+from byd_calc.cleaning import SEAL_PROMO_RATE_COLUMNS, STANDARD_RATE_COLUMNS
+from byd_calc.data import PROBLEM_LOAD_FAILED, SnapshotStore, build_table, table_sources
+from byd_calc.promotions import compile_promotions, load_campaigns, parse_campaigns
+from byd_calc.sheets import SheetCache
+
+SHEET = "https://docs.google.com/spreadsheets/d/abc/edit?gid=1"
+DAY = date(2025, 6, 15)
+
+
+def campaign(**fields):
+    entry = {"name": "promo", "sheet": SHEET, **fields}
+    return parse_campaigns({"campaigns": [entry]})[0]
+
+
+class FakeIndex:
+    # Stand-in rate table: only its identity and emptiness matter to compile_promotions
+    def __init__(self, name, empty=False):
+        self.name = name
+        self.empty = empty
+
+
+def resolve(campaigns, car, tables=None, day=DAY):
+    if tables is None:
+        tables = {c.table: FakeIndex(c.name) for c in campaigns}
+    promotions = compile_promotions([car], campaigns, tables, FakeIndex("standard"), day)
+    index, chosen = promotions.resolve(*car)
+    return index.name, chosen.name if chosen is not None else None
+
+
+def test_defaults():
+    c = campaign()
+    assert (c.label, c.columns, c.priority, c.table) == ("promo", SEAL_PROMO_RATE_COLUMNS, 0, "promo.promo")
+    assert campaign(layout="standard").columns == STANDARD_RATE_COLUMNS
+
+
+@pytest.mark.parametrize("fields, car, expected", [
+    ({}, ("BYD ATTO 3", "Extended"), True),
+    ({"models": ["BYD SEAL"]}, ("BYD SEAL", "Premium"), True),
+    ({"models": ["BYD SEAL"]}, ("BYD SEALION 7", "Premium"), False),
+    ({"models": ["  byd   seal "]}, ("BYD SEAL", "Premium"), True),
+    ({"models": ["BYD SEAL"], "submodels": ["Dynamic"]}, ("BYD SEAL", "dynamic"), True),
+    ({"models": ["BYD SEAL"], "submodels": ["Dynamic"]}, ("BYD SEAL", "Dynamic Plus"), False),
+    ({"submodel_keywords": ["dynamic", "premium"]}, ("BYD SEAL", "Premium AWD"), True),
+    ({"submodel_keywords": ["dynamic", "premium"]}, ("BYD SEAL", "Performance AWD"), False),
+    ({"submodels": ["Performance AWD"], "submodel_keywords": ["dynamic"]}, ("BYD SEAL", "Performance AWD"), True),
+])
+def test_campaign_matches(fields, car, expected):
+    assert campaign(**fields).matches(*car) is expected
+
+
+def test_highest_priority_wins_and_ties_keep_file_order():
+    campaigns = parse_campaigns({"campaigns": [
+        {"name": "low", "sheet": SHEET, "priority": 1},
+        {"name": "high", "sheet": SHEET, "priority": 5, "models": ["BYD SEAL"]},
+        {"name": "tie", "sheet": SHEET, "priority": 5},
+    ]})
+    assert resolve(campaigns, ("BYD SEAL", "Dynamic")) == ("high", "high")
+    assert resolve(campaigns, ("BYD DOLPHIN", "Standard")) == ("tie", "tie")
+    assert resolve(campaigns[:1], ("BYD DOLPHIN", "Standard")) == ("low", "low")
+
+
+def test_campaigns_without_usable_rates_are_skipped():
+    campaigns = parse_campaigns({"campaigns": [
+        {"name": "high", "sheet": SHEET, "priority": 5},
+        {"name": "low", "sheet": SHEET, "priority": 1},
+    ]})
+    tables = {"promo.high": FakeIndex("high", empty=True), "promo.low": FakeIndex("low")}
+    assert resolve(campaigns, ("BYD SEAL", "Dynamic"), tables) == ("low", "low")
+    assert resolve(campaigns, ("BYD SEAL", "Dynamic"), {}) == ("standard", None)
+
+
+@pytest.mark.parametrize("day, expected", [
+    (date(2025, 5, 31), None),
+    (date(2025, 6, 1), "june"),
+    (date(2025, 6, 30), "june"),
+    (date(2025, 7, 1), None),
+])
+def test_date_windows_are_inclusive(day, expected):
+    june = campaign(name="june", starts="2025-06-01", ends="2025-06-30")
+    assert june.active_on(day) is (expected is not None)
+    assert resolve((june,), ("BYD SEAL", "Dynamic"), day=day)[1] == expected
+
+
+def test_open_ended_windows():
+    assert campaign(starts="2025-06-01").active_on(date(2030, 1, 1))
+    assert campaign(ends="2025-06-01").active_on(date(2000, 1, 1))
+
+
+@pytest.mark.parametrize("config", [
+    [],
+    {"campaigns": {"name": "x"}},
+    {"campaigns": ["x"]},
+    {"campaigns": [{"name": "x"}]},
+    {"campaigns": [{"name": "x", "sheet": 42}]},
+    {"campaigns": [{"name": "x", "sheet": ["https://docs.google.com/"]}]},
+    {"campaigns": [{"name": "x", "sheet": "promo-rates.csv"}]},
+    {"campaigns": [{"name": "x", "sheet": "https://example.com/spreadsheets/d/abc/edit"}]},
+    {"campaigns": [{"name": "x", "sheet": "https://docs.google.com/document/d/abc/edit"}]},
+    {"campaigns": [{"name": "x", "sheet": SHEET, "label": 3}]},
+    {"campaigns": [{"name": "a/b", "sheet": SHEET}]},
+    {"campaigns": [{"name": "a.b", "sheet": SHEET}]},
+    {"campaigns": [{"name": 7, "sheet": SHEET}]},
+    {"campaigns": [{"name": "x", "sheet": SHEET, "layout": "other"}]},
+    {"campaigns": [{"name": "x", "sheet": SHEET, "layout": {"ดาวน์": "down_payment"}}]},
+    {"campaigns": [{"name": "x", "sheet": SHEET, "layout": {"a": "down_payment", "b": "48", "c": "60", "d": "72", "e": "72"}}]},
+    {"campaigns": [{"name": "x", "sheet": SHEET, "layout": {"a": "down_payment", "b": "48", "c": "60", "d": "72", "e": 84}}]},
+    {"campaigns": [{"name": "x", "sheet": SHEET, "models": "BYD SEAL"}]},
+    {"campaigns": [{"name": "x", "sheet": SHEET, "submodel_keywords": [1]}]},
+    {"campaigns": [{"name": "x", "sheet": SHEET, "priority": "10"}]},
+    {"campaigns": [{"name": "x", "sheet": SHEET, "priority": True}]},
+    {"campaigns": [{"name": "x", "sheet": SHEET, "starts": "15/06/2025"}]},
+    {"campaigns": [{"name": "x", "sheet": SHEET}, {"name": "x", "sheet": SHEET}]},
+])
+def test_invalid_configs_are_rejected(config):
+    with pytest.raises(ValueError):
+        parse_campaigns(config)
+
+
+def test_a_column_map_layout_is_accepted():
+    layout = {"Down": "down_payment", "48m": "48", "60m": "60", "72m": "72", "84m": "84"}
+    assert campaign(layout=layout).columns == layout
+
+
+def test_a_failing_table_builder_fails_only_its_table():
+    def broken(raw_df):
+        raise KeyError("48")
+
+    table = build_table("promo.x", {"content": "a,b\n1,2\n", "digest": "d"}, 3, broken)
+    assert (table.problem, table.digest, table.version) == (PROBLEM_LOAD_FAILED, "d", 3)
+    assert isinstance(table.error, KeyError)
+
+
+def test_a_bad_campaign_sheet_does_not_break_the_snapshot(fake_sheets_url, tmp_path):
+    # The promo sheet's columns do not fit the standard layout, so that table fails on its own
+    (bad,) = parse_campaigns({"campaigns": [{
+        "name": "bad", "sheet": "https://docs.google.com/spreadsheets/d/x/edit?gid=1853511418", "layout": "standard",
+        "models": ["BYD SEAL"],
+    }]})
+    store = SnapshotStore(SheetCache(cache_dir=str(tmp_path)), campaigns=(bad,))
+    assert set(store.sources) == set(table_sources((bad,)))
+    snapshot = store.snapshot().require_cars()
+    assert snapshot.tables["promo.bad"].problem is not None
+    assert snapshot.rate_index_for("BYD SEAL", "Dynamic") == (snapshot.standard_rates, None)
+
+
+def test_a_corrected_layout_is_rebuilt_after_a_restart(fake_sheets_url, tmp_path):
+    entry = {
+        "name": "seal", "sheet": "https://docs.google.com/spreadsheets/d/x/edit?gid=1853511418", "layout": "standard",
+        "models": ["BYD SEAL"],
+    }
+    sheets = SheetCache(cache_dir=str(tmp_path / "sheets"))
+    (wrong,) = parse_campaigns({"campaigns": [entry]})
+    before = SnapshotStore(sheets, snapshot_dir=str(tmp_path / "snapshot"), campaigns=(wrong,)).snapshot()
+    assert before.tables["promo.seal"].problem is not None
+
+    (fixed,) = parse_campaigns({"campaigns": [{**entry, "layout": "promo"}]})
+    store = SnapshotStore(sheets, snapshot_dir=str(tmp_path / "snapshot"), campaigns=(fixed,))
+    assert store.current.tables["promo.seal"].config == before.tables["promo.seal"].config
+    after = store.snapshot().require_cars()
+    table = after.tables["promo.seal"]
+    assert (table.problem, table.config) == (None, store.configs["promo.seal"])
+    assert after.tables["car"].version == before.tables["car"].version  # Unchanged tables are reused
+    assert after.rate_index_for("BYD SEAL", "Dynamic")[1] == fixed
+
+
+def test_a_promotions_file_with_a_bad_sheet_link_is_reported(tmp_path, monkeypatch):
+    from byd_calc import data
+
+    path = tmp_path / "promotions.json"
+    path.write_text('{"campaigns": [{"name": "x", "sheet": "https://example.com/rates.csv"}]}', encoding="utf-8")
+    monkeypatch.setattr(data, "load_campaigns", lambda: load_campaigns(str(path)))
+    campaigns, error = data.load_promotions()
+    assert campaigns == ()
+    assert isinstance(error, ValueError) and "Google Sheet" in str(error)
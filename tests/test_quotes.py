@@ -0,0 +1,159 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from byd_calc.quotes import (
+    MIN_DOWN_PERCENT,
+    QUOTE_MISSING_RATE,
+    QUOTE_NO_FINANCING,
+    QUOTE_NO_THIRTY_PLAN,
+    QUOTE_NO_TIER,
+    QUOTE_OK,
+    QUOTE_THIRTY_PLAN,
+    down_payment_for,
+    quote,
+    quote_batch,
+    quote_grid,
+)
+from byd_calc.rates import RATE_PERIODS
+
+DOWN_PERCENTS = [0, 4.99, 5, 7.5, 10, 15, 20, 25, 29.99, 30, 30.01, 35, 40, 50, 75, 90, 99.9]
+
+
+def baseline_quote(price, down_payment, down_percent, period, rate_df):
+    # The calculator's original DataFrame-based rules, kept as the reference:
+    # ("thirty_plan", [(period, rate, total interest, monthly)]) or ("ok", tier, rate, total interest, monthly)
+    # or ("no_tier", None) / ("missing_rate", tier)
+    loan_amount = price - down_payment
+    if down_percent > 30 and 30.0 in rate_df["down_payment"].values:
+        row = rate_df[rate_df["down_payment"] == 30.0].iloc[0]
+        options = []
+        for p in RATE_PERIODS:
+            if str(p) in row.index and not math.isnan(row[str(p)]):
+                interest_30 = float(row[str(p)])
+                interest_amount = loan_amount * (interest_30 / 100) * (p / 12)
+                if interest_amount > 25000:
+                    options.append((p, interest_30, interest_amount, (loan_amount + interest_amount) / p))
+        return ("thirty_plan", options)
+    available = rate_df["down_payment"].dropna().tolist()
+    matched = max([p for p in available if p <= down_percent], default=None)
+    if matched is None:
+        return ("no_tier", None)
+    value = rate_df[rate_df["down_payment"] == matched][str(period)].values[0]
+    if math.isnan(value):
+        return ("missing_rate", matched)
+    total_interest = loan_amount * (float(value) / 100) * (period / 12)
+    return ("ok", matched, float(value), total_interest, (loan_amount + total_interest) / period)
+
+
+def cases(snapshot):
+    for car in snapshot.catalog.cars():
+        for down_percent in DOWN_PERCENTS:
+            for period in RATE_PERIODS:
+                yield car.price, down_payment_for(car.price, down_percent), down_percent, period
+
+
+def fields(q):
+    # Comparable tuple of a Quote: NaN compares equal to NaN
+    values = [q.status, q.price, q.down_payment, q.down_percent, q.period, q.loan_amount, q.matched_tier,
+              q.interest_rate, q.total_interest, q.monthly_installment, q.snapshot_version]
+    values = ["nan" if isinstance(v, float) and math.isnan(v) else v for v in values]
+    return values, [(o.period, o.interest_rate, o.total_interest, o.monthly_installment) for o in q.thirty_plan_options]
+
+
+def test_quote_matches_baseline_formulas(snapshot, rate_tables):
+    for table in rate_tables.values():
+        for price, down_payment, down_percent, period in cases(snapshot):
+            q = quote(price, down_payment, down_percent, period, table.index)
+            if down_payment >= price:
+                assert q.status == QUOTE_NO_FINANCING
+                continue
+            expected = baseline_quote(price, down_payment, down_percent, period, table.df)
+            if expected[0] == "thirty_plan":
+                assert q.status == (QUOTE_THIRTY_PLAN if expected[1] else QUOTE_NO_THIRTY_PLAN)
+                assert q.matched_tier == 30.0
+                got = [(o.period, o.interest_rate, o.total_interest, o.monthly_installment) for o in q.thirty_plan_options]
+                assert got == pytest.approx(expected[1])
+            elif expected[0] == "no_tier":
+                assert q.status == QUOTE_NO_TIER
+            elif expected[0] == "missing_rate":
+                assert (q.status, q.matched_tier) == (QUOTE_MISSING_RATE, expected[1])
+            else:
+                assert q.status == QUOTE_OK
+                assert (q.matched_tier, q.interest_rate, q.total_interest, q.monthly_installment) == pytest.approx(expected[1:])
+
+
+def test_quote_flat_rate_example(rate_tables):
+    index = rate_tables["standard_rates"].index
+    tier, rate = index.lookup(20, 48)
+    q = quote(1_000_000, 200_000, 20, 48, index, snapshot_version=7)
+    assert q.status == QUOTE_OK and q.matched_tier == tier == 20
+    assert q.loan_amount == 800_000
+    assert q.total_interest == pytest.approx(800_000 * rate / 100 * 4)
+    assert q.monthly_installment == pytest.approx((800_000 + q.total_interest) / 48)
+    assert q.snapshot_version == 7
+
+
+def test_quote_batch_matches_quote_field_for_field(snapshot, rate_tables):
+    rng = random.Random(0)
+    prices = [car.price for car in snapshot.catalog.cars()]
+    for table in rate_tables.values():
+        rows = list(cases(snapshot))
+        for _ in range(2000):
+            price = rng.choice(prices)
+            down_percent = rng.choice([rng.uniform(0, 101), rng.choice(DOWN_PERCENTS)])
+            rows.append((price, down_payment_for(price, down_percent), down_percent, rng.choice(RATE_PERIODS + (36,))))
+        batch = quote_batch(*zip(*rows), table.index, snapshot_version=3)
+        assert len(batch) == len(rows)
+        for row, got in zip(rows, batch):
+            assert fields(got) == fields(quote(*row, table.index, snapshot_version=3)), row
+
+
+def test_quote_grid_eligibility_matches_quote(snapshot, rate_tables):
+    prices = [car.price for car in snapshot.catalog.cars()]
+    down_percents = np.array(DOWN_PERCENTS + [100])
+    for table in rate_tables.values():
+        grid = quote_grid(prices, down_percents, RATE_PERIODS, table.index)
+        assert grid.eligible.shape == (len(prices), len(down_percents), len(RATE_PERIODS))
+        for i, price in enumerate(prices):
+            for j, down_percent in enumerate(down_percents):
+                for k, period in enumerate(RATE_PERIODS):
+                    q = quote(price, down_payment_for(price, float(down_percent)), float(down_percent), period, table.index)
+                    if q.status == QUOTE_OK:
+                        expected = down_percent >= MIN_DOWN_PERCENT
+                        monthly = q.monthly_installment
+                    elif q.status in (QUOTE_THIRTY_PLAN, QUOTE_NO_THIRTY_PLAN):
+                        option = [o for o in q.thirty_plan_options if o.period == period]
+                        expected = bool(option)
+                        monthly = option[0].monthly_installment if option else None
+                        assert grid.thirty_plan[i, j, k]
+                    else:
+                        expected, monthly = False, None
+                    assert bool(grid.eligible[i, j, k]) == expected, (price, down_percent, period, q.status)
+                    if expected:
+                        assert grid.monthly_installment[i, j, k] == pytest.approx(monthly)
+
+
+def test_quote_grid_rounds_like_quote(rate_tables):
+    # For these the two orders of price * down % / 100 differ in the last bit
+    index = rate_tables["standard_rates"].index
+    down_percents = [57, 58, 67, 68]
+    grid = quote_grid([759_900], down_percents, RATE_PERIODS, index)
+    for j, down_percent in enumerate(down_percents):
+        down_payment = down_payment_for(759_900, float(down_percent))
+        assert grid.down_payment[0, j, 0] == down_payment
+        for k, period in enumerate(RATE_PERIODS):
+            q = quote(759_900, down_payment, float(down_percent), period, index)
+            monthly = [o.monthly_installment for o in q.thirty_plan_options if o.period == period]
+            if q.status == QUOTE_OK:
+                monthly = [q.monthly_installment]
+            assert grid.eligible[0, j, k] == bool(monthly)
+            if monthly:
+                assert math.ceil(grid.monthly_installment[0, j, k]) == math.ceil(monthly[0])
+
+
+def test_quote_grid_skips_unknown_periods(rate_tables):
+    grid = quote_grid([1_000_000], [20], [36, 48], rate_tables["standard_rates"].index)
+    assert grid.eligible[0, 0].tolist() == [False, True]
@@ -0,0 +1,95 @@
+import csv
+import gc
+import gzip
+import io
+import os
+import re
+
+import pytest
+
+from byd_calc.quotes import QUOTE_OK, down_payment_for, quote
+from byd_calc.reports import CatalogExport, export_pool, quote_csv, quote_pdf, schedule
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with export_pool(2) as pool:
+        yield pool
+
+
+def rows_in(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return sum(1 for _ in f) - 1  # Header
+
+
+def test_exports_to_the_same_path_do_not_mix(snapshot, pool, tmp_path):
+    path = str(tmp_path / "catalog.csv.gz")
+    first = CatalogExport(snapshot, path, pool, schedules=False)
+    second = CatalogExport(snapshot, path, pool, schedules=False)
+    assert first.result() == second.result() == rows_in(path)
+    assert os.listdir(tmp_path) == ["catalog.csv.gz"]
+
+
+def test_cancel_removes_every_file(snapshot, pool, tmp_path):
+    export = CatalogExport(snapshot, str(tmp_path / "catalog.csv.gz"), pool, schedules=False)
+    export.result()
+    parts_dir = export._parts_dir
+    export.cancel()
+    assert os.listdir(tmp_path) == [] and not os.path.exists(parts_dir)
+
+
+def test_a_temporary_export_is_removed_with_its_object(snapshot, pool, tmp_path):
+    kept = CatalogExport(snapshot, str(tmp_path / "kept.csv.gz"), pool, schedules=False)
+    dropped = CatalogExport(snapshot, str(tmp_path / "dropped.csv.gz"), pool, schedules=False, temporary=True)
+    unfinished = CatalogExport(snapshot, str(tmp_path / "unfinished.csv.gz"), pool, temporary=True)
+    kept.result()
+    dropped.result()
+    parts_dir = unfinished._parts_dir
+    del kept, dropped, unfinished
+    gc.collect()
+    assert os.listdir(tmp_path) == ["kept.csv.gz"]
+    assert not os.path.exists(parts_dir)
+
+
+def test_schedule_repays_the_loan_and_the_interest():
+    rows = list(schedule(850_000, 104_125, 48))
+    assert [row.month for row in rows] == list(range(1, 49))
+    assert sum(row.installment for row in rows) == pytest.approx(850_000 + 104_125)
+    assert sum(row.principal for row in rows) == pytest.approx(850_000)
+    assert sum(row.interest for row in rows) == pytest.approx(104_125)
+    assert (rows[-1].principal_balance, rows[-1].remaining_balance) == (0.0, 0.0)
+    assert rows[0].remaining_balance == pytest.approx(850_000 + 104_125 - rows[0].installment)
+
+
+def a_quote(snapshot):
+    car = snapshot.catalog.cars()[0]
+    rate_index, _ = snapshot.rate_index_for(car.model, car.submodel)
+    q = quote(car.price, down_payment_for(car.price, 20.0), 20.0, 48, rate_index, snapshot.data_version)
+    assert q.status == QUOTE_OK
+    return q, (car.model, car.submodel)
+
+
+def test_quote_csv_has_one_row_per_month_with_amounts_in_baht(snapshot):
+    q, car = a_quote(snapshot)
+    rows = list(csv.DictReader(io.StringIO(quote_csv(q, car))))
+    assert len(rows) == 48
+    assert (rows[0]["model"], rows[0]["submodel"], rows[0]["snapshot_version"]) == (*car, snapshot.data_version)
+    for column in ("price", "down_payment", "loan_amount", "total_interest", "monthly_installment",
+                   "installment", "principal", "interest", "principal_balance", "remaining_balance"):
+        assert all(re.fullmatch(r"-?\d+\.\d\d", row[column]) for row in rows), column
+    assert float(rows[0]["monthly_installment"]) == pytest.approx(q.monthly_installment, abs=0.005)
+    assert rows[-1]["remaining_balance"] == "0.00"
+
+
+def test_quote_pdf_is_a_pdf(snapshot):
+    q, car = a_quote(snapshot)
+    pdf = quote_pdf(q, car, comparison=[q])
+    assert pdf.startswith(b"%PDF") and pdf.rstrip().endswith(b"%%EOF")
+
+
+def test_catalog_export_amounts_are_rounded(snapshot, pool, tmp_path):
+    path = str(tmp_path / "catalog.csv.gz")
+    CatalogExport(snapshot, path, pool, schedules=False).result()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert rows and all(re.fullmatch(r"\d+\.\d\d", row["monthly_installment"]) for row in rows)
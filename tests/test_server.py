@@ -0,0 +1,162 @@
+import asyncio
+import json
+from http import HTTPStatus
+
+import pytest
+
+from byd_calc import server
+from byd_calc.quotes import quote
+from byd_calc.server import QuoteService
+
+CAR = {"model": "BYD SEAL", "submodel": "Dynamic"}
+
+
+@pytest.fixture
+def service(store):
+    service = QuoteService(store)
+    asyncio.run(service.load())
+    return service
+
+
+def post(service, path, payload):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+    return asyncio.run(service.dispatch("POST", path, body))
+
+
+def test_quote_for_a_catalog_car(service):
+    status, body = post(service, "/quote", dict(CAR, down_percent=20, period=48))
+    assert status == HTTPStatus.OK
+    assert (body["status"], body["promotion"], body["special_rate"]) == ("ok", "seal_special", True)
+    assert body["interest_rate"] == 0.49
+    assert body["monthly_installment_rounded"] == 16992
+
+
+def test_quote_by_price_uses_standard_rates(service):
+    status, body = post(service, "/quote", {"price": 1_000_000, "down_payment": 400_000, "period": 60})
+    expected = quote(1_000_000, 400_000, 40.0, 60, service.snapshot.standard_rates)
+    assert status == HTTPStatus.OK
+    assert body["status"] == expected.status == "thirty_plan"
+    assert [o["period"] for o in body["thirty_plan_options"]] == [o.period for o in expected.thirty_plan_options]
+    assert body["promotion"] is None
+
+
+@pytest.mark.parametrize("payload, status", [
+    (b"{not json", HTTPStatus.BAD_REQUEST),
+    ([1, 2], HTTPStatus.BAD_REQUEST),
+    ({"model": ["BYD SEAL"], "submodel": "Dynamic", "down_percent": 20, "period": 48}, HTTPStatus.BAD_REQUEST),
+    ({"model": "BYD SEAL", "down_percent": 20, "period": 48}, HTTPStatus.BAD_REQUEST),
+    ({"model": "BYD SEAL", "submodel": "Nope", "down_percent": 20, "period": 48}, HTTPStatus.NOT_FOUND),
+    (dict(CAR, down_percent=20), HTTPStatus.BAD_REQUEST),
+    (dict(CAR, down_percent="twenty", period=48), HTTPStatus.BAD_REQUEST),
+    (dict(CAR, down_percent=20, period=48.9), HTTPStatus.BAD_REQUEST),
+    (dict(CAR, down_percent=20, period=True), HTTPStatus.BAD_REQUEST),
+    (dict(CAR, down_percent=20, period=36), HTTPStatus.BAD_REQUEST),
+    (dict(CAR, down_percent=4, period=48), HTTPStatus.UNPROCESSABLE_ENTITY),
+    (dict(CAR, down_percent=101, period=48), HTTPStatus.UNPROCESSABLE_ENTITY),
+    ({"price": 0, "down_payment": 0, "period": 48}, HTTPStatus.BAD_REQUEST),
+    (b'{"model": "BYD SEAL", "submodel": "Dynamic", "down_percent": 20, "period": Infinity}', HTTPStatus.BAD_REQUEST),
+    (b'{"model": "BYD SEAL", "submodel": "Dynamic", "down_percent": 20, "period": NaN}', HTTPStatus.BAD_REQUEST),
+    (b'{"price": 1e400, "down_percent": 20, "period": 48}', HTTPStatus.BAD_REQUEST),
+    (b'{"price": NaN, "down_payment": 0, "period": 48}', HTTPStatus.BAD_REQUEST),
+    (b'{"price": 1000000, "down_payment": -Infinity, "period": 48}', HTTPStatus.BAD_REQUEST),
+    ({"price": True, "down_percent": 20, "period": 48}, HTTPStatus.BAD_REQUEST),
+    ({"price": 1_000_000, "down_payment": True, "period": 48}, HTTPStatus.BAD_REQUEST),
+    ({"price": 1e-320, "down_payment": 1, "period": 48}, HTTPStatus.BAD_REQUEST),
+])
+def test_quote_rejects_invalid_requests(service, payload, status):
+    got, body = post(service, "/quote", payload)
+    assert got == status
+    assert isinstance(body["error"], str)
+
+
+def test_whole_float_period_is_accepted(service):
+    status, body = post(service, "/quote", dict(CAR, down_percent=20, period=48.0))
+    assert (status, body["period"]) == (HTTPStatus.OK, 48)
+
+
+def test_quote_routing_errors(service):
+    assert asyncio.run(service.dispatch("GET", "/quote", b""))[0] == HTTPStatus.METHOD_NOT_ALLOWED
+    assert asyncio.run(service.dispatch("POST", "/nope", b"{}"))[0] == HTTPStatus.NOT_FOUND
+    assert asyncio.run(QuoteService(None).dispatch("POST", "/quote", b"{}"))[0] == HTTPStatus.SERVICE_UNAVAILABLE
+
+
+@pytest.mark.parametrize("payload", [b"[]", {"quotes": "x"}, {"items": []}])
+def test_batch_rejects_malformed_bodies(service, payload):
+    assert post(service, "/quotes:batch", payload)[0] == HTTPStatus.BAD_REQUEST
+
+
+def test_batch_limits_its_size(service, monkeypatch):
+    monkeypatch.setattr(server, "MAX_BATCH_QUOTES", 2)
+    status, _ = post(service, "/quotes:batch", {"quotes": [dict(CAR, down_percent=20, period=48)] * 3})
+    assert status == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+def test_batch_reports_errors_per_item(service):
+    good = dict(CAR, down_percent=20, period=48)
+    status, body = post(service, "/quotes:batch", {"quotes": [
+        {"model": {"a": 1}, "submodel": "Dynamic", "down_percent": 20, "period": 48},
+        good,
+        dict(CAR, down_percent=20, period=48.5),
+        "not an object",
+        dict(CAR, down_percent=20, period=float("inf")),
+    ]})
+    assert status == HTTPStatus.OK
+    results = body["results"]
+    assert [r["status"] for r in results] == ["error", "ok", "error", "error", "error"]
+    assert results[1] == post(service, "/quote", good)[1]
+
+
+def test_unexpected_error_answers_500_and_keeps_the_connection(service, monkeypatch):
+    calls = []
+
+    async def dispatch(method, target, body, request_headers=None):
+        calls.append(target)
+        if target == "/boom":
+            raise RuntimeError("bug")
+        if target == "/nan":
+            return HTTPStatus.OK, {"value": float("nan")}  # Would be invalid JSON
+        return HTTPStatus.OK, {"ok": True}
+
+    monkeypatch.setattr(service, "dispatch", dispatch)
+
+    async def exchange():
+        listener = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            statuses = []
+            for target in ("/boom", "/nan", "/fine"):
+                writer.write(f"GET {target} HTTP/1.1\r\nHost: x\r\n\r\n".encode("latin-1"))
+                await writer.drain()
+                statuses.append((await reader.readline()).decode("latin-1").split()[1])
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                await reader.readexactly(int(headers["content-length"]))
+            writer.close()
+            return statuses
+
+    assert asyncio.run(exchange()) == ["500", "500", "200"]
+    assert calls == ["/boom", "/nan", "/fine"]
+
+
+@pytest.mark.parametrize("follow", [False, True])
+def test_serve_only_fetches_images_when_not_following(follow, store, monkeypatch):
+    from byd_calc import images, persist
+
+    monkeypatch.setattr(images, "IMAGE_FOLLOW", follow)
+    monkeypatch.setattr(persist, "SNAPSHOT_FOLLOW", False)
+    created = []
+
+    class Stop(Exception):
+        pass
+
+    def quote_service(store, refresh_seconds, image_cache=None):
+        created.append(image_cache)
+        raise Stop
+
+    monkeypatch.setattr(server, "QuoteService", quote_service)
+    with pytest.raises(Stop):
+        asyncio.run(server.serve(sheet_cache=store.sheet_cache))
+    assert created[0].fetch is not follow
@@ -0,0 +1,142 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fake_sheets import start_fake_sheets
+
+from byd_calc.sheets import SheetCache
+
+URL_PATH = "/spreadsheets/d/abc/export?format=csv&gid=1"
+
+
+@pytest.fixture
+def sheets(tmp_path):
+    # A stand-in serving tmp_path/sheets, empty at first: every sheet answers 404
+    fixtures = tmp_path / "sheets"
+    fixtures.mkdir()
+    server, base_url = start_fake_sheets(fixtures_dir=str(fixtures))
+    yield server, fixtures, base_url + URL_PATH
+    server.shutdown()
+    server.server_close()
+
+
+def wait_idle(cache):
+    deadline = time.monotonic() + 5
+    while cache._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def served(server):
+    return server.RequestHandlerClass.requests_served
+
+
+def test_failed_background_load_waits_a_ttl_before_retrying(sheets, tmp_path):
+    server, fixtures, url = sheets
+    cache = SheetCache(ttl=0.5, cache_dir=str(tmp_path / "cache"))
+    assert cache.get_many([url], block=False) == [None]
+    wait_idle(cache)
+    for _ in range(5):
+        (result,) = cache.get_many([url], block=False)
+        wait_idle(cache)
+        assert isinstance(result, Exception)
+    assert served(server) == 1
+
+    (fixtures / "1.csv").write_text("a,b\n1,2\n")
+    time.sleep(0.6)
+    assert cache.get_many([url], block=False) == [None]  # Retried in the background
+    wait_idle(cache)
+    assert cache.get_many([url], block=False)[0]["content"] == "a,b\n1,2\n"
+    assert served(server) == 2
+
+
+def test_background_load_falls_back_to_the_disk_copy(sheets, tmp_path):
+    server, fixtures, url = sheets
+    (fixtures / "1.csv").write_text("a,b\n1,2\n")
+    first = SheetCache(cache_dir=str(tmp_path / "cache"))
+    first.save_last_good(url, first.get(url)["digest"])  # Leaves a last-good copy on disk
+    (fixtures / "1.csv").unlink()
+
+    cache = SheetCache(cache_dir=str(tmp_path / "cache"))
+    assert cache.get_many([url], block=False) == [None]
+    wait_idle(cache)
+    assert cache.get_many([url], block=False)[0]["content"] == "a,b\n1,2\n"
+
+
+def test_invalidate_retries_a_failed_sheet_at_once(sheets, tmp_path):
+    server, fixtures, url = sheets
+    cache = SheetCache(cache_dir=str(tmp_path / "cache"))
+    assert isinstance(cache.get_many([url])[0], Exception)
+    (fixtures / "1.csv").write_text("a,b\n1,2\n")
+    assert isinstance(cache.get_many([url])[0], Exception)  # Within the TTL: not fetched again
+    assert served(server) == 1
+    cache.invalidate()
+    assert cache.get_many([url])[0]["content"] == "a,b\n1,2\n"
+
+
+def test_only_saved_downloads_become_the_disk_copy(sheets, tmp_path):
+    server, fixtures, url = sheets
+    (fixtures / "1.csv").write_text("a,b\n1,2\n")
+    cache = SheetCache(cache_dir=str(tmp_path / "cache"))
+    cache.save_last_good(url, cache.get(url)["digest"])
+    (fixtures / "1.csv").write_text("<html>sign in</html>\n")
+    cache.invalidate()
+    cache.get_many([url])
+    wait_idle(cache)
+    html = cache.get(url)
+    assert html["content"] == "<html>sign in</html>\n"
+    cache.save_last_good(url, "not the current digest")  # Ignored: only the content in memory can be saved
+    (fixtures / "1.csv").unlink()
+
+    cold = SheetCache(cache_dir=str(tmp_path / "cache"))
+    assert cold.get(url)["content"] == "a,b\n1,2\n"
+    assert not [p for p in (tmp_path / "cache").iterdir() if p.name.endswith(".tmp")]
+
+
+def not_modified(server):
+    return server.RequestHandlerClass.not_modified_served
+
+
+def test_a_stale_sheet_is_served_while_it_is_revalidated(sheets, tmp_path):
+    server, fixtures, url = sheets
+    (fixtures / "1.csv").write_text("a,b\n1,2\n")
+    cache = SheetCache(ttl=0.2, cache_dir=str(tmp_path / "cache"))
+    assert cache.get(url)["content"] == "a,b\n1,2\n"
+    assert cache.get(url)["content"] == "a,b\n1,2\n"  # Fresh: from memory
+    assert served(server) == 1
+
+    (fixtures / "1.csv").write_text("a,b\n3,4\n")
+    time.sleep(0.3)
+    assert cache.get(url)["content"] == "a,b\n1,2\n"  # Stale copy at once, even for a blocking read
+    wait_idle(cache)
+    assert cache.get(url)["content"] == "a,b\n3,4\n"
+    assert served(server) == 2
+
+
+def test_an_unchanged_sheet_is_revalidated_with_its_etag(sheets, tmp_path):
+    server, fixtures, url = sheets
+    (fixtures / "1.csv").write_text("a,b\n1,2\n")
+    cache = SheetCache(ttl=0.2, cache_dir=str(tmp_path / "cache"))
+    digest = cache.get(url)["digest"]
+    time.sleep(0.3)
+    cache.get(url)
+    wait_idle(cache)
+    assert (served(server), not_modified(server)) == (2, 1)
+    assert cache.get(url)["digest"] == digest
+    wait_idle(cache)
+    assert served(server) == 2  # The 304 made the copy fresh again
+
+
+def test_concurrent_first_loads_fetch_once(tmp_path):
+    fixtures = tmp_path / "sheets"
+    fixtures.mkdir()
+    (fixtures / "1.csv").write_text("a,b\n1,2\n")
+    server, base_url = start_fake_sheets(fixtures_dir=str(fixtures), delay=0.2)
+    try:
+        cache = SheetCache(cache_dir=str(tmp_path / "cache"))
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: cache.get(base_url + URL_PATH), range(8)))
+        assert {r["content"] for r in results} == {"a,b\n1,2\n"}
+        assert served(server) == 1
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,129 @@
+import os
+import time
+from dataclasses import replace
+
+import pytest
+from conftest import REPO_ROOT
+
+from byd_calc.data import PROBLEM_LOAD_FAILED, DataUnavailableError, SnapshotStore
+from byd_calc.persist import SnapshotFollower, load_snapshot
+from byd_calc.promotions import load_campaigns
+from byd_calc.sheets import SheetCache, content_digest
+
+PROMOTIONS_FILE = os.path.join(REPO_ROOT, "promotions.json")
+
+
+def make_store(tmp_path, snapshot_dir, name):
+    cache = SheetCache(cache_dir=str(tmp_path / f"sheets-{name}"))
+    return SnapshotStore(cache, snapshot_dir=str(snapshot_dir), campaigns=load_campaigns(PROMOTIONS_FILE))
+
+
+def test_data_version_is_the_same_in_every_process(fake_sheets_url, tmp_path, snapshot):
+    shared = tmp_path / "snapshot"
+    first = make_store(tmp_path, shared, "a").snapshot()
+    # A second writer on the same directory starts from the first one's snapshot...
+    second_store = make_store(tmp_path, shared, "b")
+    second = second_store.snapshot()
+    # ...while a third one with its own directory counts its versions from 1 again
+    other = make_store(tmp_path, tmp_path / "other", "c").snapshot()
+    follower = SnapshotFollower(str(shared), campaigns=load_campaigns(PROMOTIONS_FILE)).snapshot()
+    assert first.data_version == second.data_version == other.data_version == follower.data_version
+    assert first.data_version == snapshot.data_version
+
+
+def test_data_version_changes_with_the_tables_and_the_campaigns(snapshot):
+    car = snapshot.tables["car"]
+    changed_table = replace(snapshot, tables=dict(snapshot.tables, car=replace(car, digest="0" * 64)))
+    assert changed_table.data_version != snapshot.data_version
+    campaign = snapshot.campaigns[0]
+    changed_campaign = replace(snapshot, campaigns=(replace(campaign, priority=campaign.priority + 1),))
+    assert changed_campaign.data_version != snapshot.data_version
+    assert replace(snapshot, version=snapshot.version + 5).data_version == snapshot.data_version
+
+
+def test_saved_snapshot_keeps_its_data_version(tmp_path, snapshot):
+    from byd_calc.persist import save_snapshot
+
+    save_snapshot(snapshot, str(tmp_path))
+    loaded = load_snapshot(str(tmp_path))
+    assert replace(loaded, campaigns=snapshot.campaigns).data_version == snapshot.data_version
+
+
+class FixedSheets:
+    # Stand-in SheetCache that returns the same downloads for every url, in order
+    def __init__(self, results):
+        self.results = results
+        self.saved = []  # Digests passed to save_last_good
+
+    def get_many(self, urls, block=True):
+        return [self.results.get(i) for i in range(len(urls))]
+
+    def save_last_good(self, url, digest):
+        self.saved.append(digest)
+
+
+def download(content):
+    return {"content": content, "digest": content_digest(content)}
+
+
+def fixture(gid):
+    with open(os.path.join(REPO_ROOT, "fixtures", "sheets", f"{gid}.csv"), encoding="utf-8") as f:
+        return download(f.read())
+
+
+def test_an_unparseable_sheet_is_not_rebuilt_on_every_call(tmp_path):
+    broken = download('<html>,<body>\n"unterminated')
+    store = SnapshotStore(FixedSheets({0: fixture(442434100), 1: broken}), snapshot_dir=str(tmp_path), campaigns=())
+    first = store.snapshot()
+    assert first.tables["standard_rates"].problem == "load_failed"
+    assert store.snapshot() is first
+    assert len([d for d in os.listdir(tmp_path) if d.startswith("v")]) == 1
+
+
+def test_an_unusable_download_keeps_the_last_good_table(tmp_path):
+    sheets = FixedSheets({0: fixture(442434100), 1: fixture(569887943)})
+    store = SnapshotStore(sheets, snapshot_dir=str(tmp_path), campaigns=())
+    good = store.snapshot().tables["standard_rates"]
+    assert good.problem is None
+
+    sheets.results[1] = download("<html>,<title>Sign in</title>\n<body>,<form>\n")
+    rates = store.snapshot().tables["standard_rates"]
+    assert (rates.problem, rates.digest, rates.index) == (None, good.digest, good.index)
+    assert (rates.rejected_digest, rates.rejected_problem) == (sheets.results[1]["digest"], "missing_columns")
+    assert store.snapshot() is store.current
+    assert load_snapshot(str(tmp_path)).tables["standard_rates"].rejected_problem == "missing_columns"
+    assert sheets.results[1]["digest"] not in sheets.saved and good.digest in sheets.saved
+
+    sheets.results[1] = fixture(569887943)
+    assert store.snapshot().tables["standard_rates"].rejected_problem is None
+
+
+def test_a_follower_picks_up_each_published_snapshot(tmp_path, snapshot):
+    from byd_calc.persist import save_snapshot
+
+    follower = SnapshotFollower(str(tmp_path), campaigns=snapshot.campaigns, check_seconds=0, wait_seconds=0)
+    save_snapshot(snapshot, str(tmp_path))
+    first = follower.snapshot()
+    assert (first.version, first.data_version) == (snapshot.version, snapshot.data_version)
+    assert follower.snapshot() is first  # CURRENT did not change
+
+    car = snapshot.tables["car"]
+    changed = replace(snapshot, version=snapshot.version + 1, tables=dict(snapshot.tables, car=replace(car, digest="0" * 64)))
+    save_snapshot(changed, str(tmp_path))
+    second = follower.snapshot()
+    assert second.version == snapshot.version + 1
+    assert second.data_version == changed.data_version != first.data_version
+
+
+def test_a_follower_without_a_writer_serves_an_unavailable_snapshot(tmp_path):
+    follower = SnapshotFollower(str(tmp_path), campaigns=(), check_seconds=0.05, wait_seconds=0.2)
+    started = time.monotonic()
+    empty = follower.snapshot()
+    assert time.monotonic() - started >= 0.2  # Only the first call waits for the writer
+    assert empty.version == 0
+    assert {table.problem for table in empty.tables.values()} == {PROBLEM_LOAD_FAILED}
+    with pytest.raises(DataUnavailableError):
+        empty.require_cars()
+    started = time.monotonic()
+    follower.snapshot()
+    assert time.monotonic() - started < 0.2